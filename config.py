@@ -1,12 +1,29 @@
 import os
 
+# 相対パスの既定値は、起動時のカレントディレクトリではなくこのファイルのディレクトリを基準にする
+_BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
 class Config:
     # LINE Bot API設定
     LINE_CHANNEL_ACCESS_TOKEN = os.getenv('LINE_CHANNEL_ACCESS_TOKEN')
     LINE_CHANNEL_SECRET = os.getenv('LINE_CHANNEL_SECRET')
 
+    # LINE Messaging API クライアントの接続プールのサイズ・タイムアウト（秒）・再試行の設定
+    LINE_API_POOL_SIZE = int(os.getenv('LINE_API_POOL_SIZE', '10'))
+    LINE_API_CONNECT_TIMEOUT_SECONDS = float(os.getenv('LINE_API_CONNECT_TIMEOUT_SECONDS', '3'))
+    LINE_API_READ_TIMEOUT_SECONDS = float(os.getenv('LINE_API_READ_TIMEOUT_SECONDS', '10'))
+    LINE_API_MAX_RETRIES = int(os.getenv('LINE_API_MAX_RETRIES', '3'))
+    LINE_API_RETRY_BACKOFF_SECONDS = float(os.getenv('LINE_API_RETRY_BACKOFF_SECONDS', '0.5'))
+
+    # イベント発生からこの秒数以内に返信できない場合、先に「処理中」と返信し、結果はプッシュメッセージで送る
+    REPLY_DEADLINE_SECONDS = float(os.getenv('REPLY_DEADLINE_SECONDS', '8'))
+    # 1イベントの処理全体の期限（秒）。Google Sheets API の呼び出しはこれを超えて待たない
+    EVENT_DEADLINE_SECONDS = float(os.getenv('EVENT_DEADLINE_SECONDS', '45'))
+
     # Google Sheets API設定
     GOOGLE_SHEETS_SPREADSHEET_NAME = os.getenv('GOOGLE_SHEETS_SPREADSHEET_NAME')
+    # スプレッドシートキー（URLの /d/<key>/ 部分）。設定されていれば名前によるDrive検索を省略する
+    GOOGLE_SHEETS_SPREADSHEET_KEY = os.getenv('GOOGLE_SHEETS_SPREADSHEET_KEY')
     GOOGLE_SHEETS_SCHEDULE_WORKSHEET_NAME = os.getenv('GOOGLE_SHEETS_SCHEDULE_WORKSHEET_NAME', 'スケジュール')
     GOOGLE_SHEETS_ATTENDEES_WORKSHEET_NAME = os.getenv('GOOGLE_SHEETS_ATTENDEES_WORKSHEET_NAME', '参加者')
 
@@ -14,6 +31,83 @@ class Config:
     # 本番環境ではKMSなどで暗号化することを推奨
     GOOGLE_SHEETS_CREDENTIALS = os.getenv('GOOGLE_SHEETS_CREDENTIALS')
 
+    # Google Sheets API への HTTP Keep-Alive 接続プールのサイズ
+    GOOGLE_SHEETS_HTTP_POOL_SIZE = int(os.getenv('GOOGLE_SHEETS_HTTP_POOL_SIZE', '10'))
+    # Google Sheets API 1リクエストあたりのHTTPタイムアウト（秒）
+    GOOGLE_SHEETS_HTTP_TIMEOUT_SECONDS = float(os.getenv('GOOGLE_SHEETS_HTTP_TIMEOUT_SECONDS', '10'))
+
+    # Google Sheets API のクォータ（1分あたりの読み取り・書き込み回数）と再試行の設定
+    GOOGLE_SHEETS_READ_QUOTA_PER_MINUTE = int(os.getenv('GOOGLE_SHEETS_READ_QUOTA_PER_MINUTE', '60'))
+    GOOGLE_SHEETS_WRITE_QUOTA_PER_MINUTE = int(os.getenv('GOOGLE_SHEETS_WRITE_QUOTA_PER_MINUTE', '60'))
+    GOOGLE_SHEETS_RETRY_BASE_SECONDS = float(os.getenv('GOOGLE_SHEETS_RETRY_BASE_SECONDS', '1'))
+    GOOGLE_SHEETS_RETRY_MAX_SECONDS = float(os.getenv('GOOGLE_SHEETS_RETRY_MAX_SECONDS', '16'))
+    # 1回のAPI呼び出し（クォータ待ち・再試行を含む）の期限（秒）
+    GOOGLE_SHEETS_CALL_DEADLINE_SECONDS = float(os.getenv('GOOGLE_SHEETS_CALL_DEADLINE_SECONDS', '30'))
+
+    # get_all_records の読み取りキャッシュの有効期間（秒）。0 でキャッシュ無効
+    GOOGLE_SHEETS_CACHE_TTL_SECONDS = float(os.getenv('GOOGLE_SHEETS_CACHE_TTL_SECONDS', '30'))
+    # TTL切れの際、スプレッドシートの最終更新日時を確認して変更がなければ再取得を省略する
+    GOOGLE_SHEETS_CHANGE_PROBE = os.getenv('GOOGLE_SHEETS_CHANGE_PROBE', 'true').lower() in ('1', 'true', 'yes')
+    # 変更確認の有無にかかわらず、この秒数を超えたキャッシュは必ず全件を取り直す
+    GOOGLE_SHEETS_CACHE_MAX_AGE_SECONDS = float(os.getenv('GOOGLE_SHEETS_CACHE_MAX_AGE_SECONDS', '600'))
+
+    # 行番号を指定する書き込み（更新・削除）の直前に、対象行の主キー列がシート上でキャッシュと一致するかを確認する
+    GOOGLE_SHEETS_VERIFY_ROWS = os.getenv('GOOGLE_SHEETS_VERIFY_ROWS', 'true').lower() in ('1', 'true', 'yes')
+    # 一致しなかった（行がずれていた）場合に、シートを読み込み直して行を特定し直す回数
+    GOOGLE_SHEETS_ROW_VERIFY_ATTEMPTS = int(os.getenv('GOOGLE_SHEETS_ROW_VERIFY_ATTEMPTS', '3'))
+
+    # ローカルSQLiteミラーのファイルパス。設定すると読み取りはミラーから行い、書き込みはバックグラウンドでシートへ反映する
+    GOOGLE_SHEETS_MIRROR_PATH = os.getenv('GOOGLE_SHEETS_MIRROR_PATH')
+    # ミラーがシートの内容を取り込み直す間隔（秒）
+    GOOGLE_SHEETS_MIRROR_PULL_INTERVAL_SECONDS = float(os.getenv('GOOGLE_SHEETS_MIRROR_PULL_INTERVAL_SECONDS', '60'))
+    # 1件の書き込みのシートへの反映を諦めて outbox_dead_letters テーブルへ移すまでの回数
+    GOOGLE_SHEETS_MIRROR_MAX_ATTEMPTS = int(os.getenv('GOOGLE_SHEETS_MIRROR_MAX_ATTEMPTS', '20'))
+
+    # スプレッドシートへの書き込みを記録する追記専用ジャーナルのパス。空にすると無効（ローカルミラーが有効な場合も無効）
+    # シートへ書き込めなかった書き込みはジャーナルに残り、バックグラウンドで再送される
+    # ジャーナルは1つのプロセスだけが使う。複数のワーカープロセスで起動した場合、2つ目以降のプロセスはシートへ直接書き込む
+    GOOGLE_SHEETS_JOURNAL_PATH = os.getenv('GOOGLE_SHEETS_JOURNAL_PATH', os.path.join(_BASE_DIR, 'sheets_journal.jsonl'))
+    # 再送時に1度に読み出す書き込みの件数
+    GOOGLE_SHEETS_JOURNAL_BATCH_SIZE = int(os.getenv('GOOGLE_SHEETS_JOURNAL_BATCH_SIZE', '50'))
+    # 1件の書き込みの再送を諦めるまでの回数
+    GOOGLE_SHEETS_JOURNAL_MAX_ATTEMPTS = int(os.getenv('GOOGLE_SHEETS_JOURNAL_MAX_ATTEMPTS', '20'))
+    # 完了した書き込みがこの件数溜まったら、ジャーナルを未完了の書き込みだけに書き直す
+    GOOGLE_SHEETS_JOURNAL_COMPACT_THRESHOLD = int(os.getenv('GOOGLE_SHEETS_JOURNAL_COMPACT_THRESHOLD', '1000'))
+
+    # 参加予定の登録・更新をまとめてシートへ反映するまでの待ち時間（秒）。0 で無効（ローカルミラーが有効な場合も無効）
+    # 有効にすると、登録・更新はローカルのジャーナルに記録した時点で応答し、待ち時間内の書き込みを
+    # 1回の append_rows と1回の batch_update にまとめて反映する
+    ATTENDEE_WRITE_BEHIND_SECONDS = float(os.getenv('ATTENDEE_WRITE_BEHIND_SECONDS', '0'))
+    # 未反映の参加予定の書き込みを記録するSQLiteファイルのパス
+    ATTENDEE_WRITE_BEHIND_JOURNAL_PATH = os.getenv('ATTENDEE_WRITE_BEHIND_JOURNAL_PATH', os.path.join(_BASE_DIR, 'attendee_write_behind.db'))
+    # 未反映の書き込みがこの件数に達したら、待ち時間を待たずに反映する
+    ATTENDEE_WRITE_BEHIND_MAX_PENDING = int(os.getenv('ATTENDEE_WRITE_BEHIND_MAX_PENDING', '100'))
+    # 1件の書き込みの反映を諦めて pending_attendees_dead_letters テーブルへ移すまでの回数
+    ATTENDEE_WRITE_BEHIND_MAX_ATTEMPTS = int(os.getenv('ATTENDEE_WRITE_BEHIND_MAX_ATTEMPTS', '20'))
+
+    # Webhookを受信したら署名検証のみ行って即座に200を返し、イベントはワーカースレッドで処理する
+    WEBHOOK_ASYNC_PROCESSING = os.getenv('WEBHOOK_ASYNC_PROCESSING', 'false').lower() in ('1', 'true', 'yes')
+    # イベント処理ワーカーの数と、ワーカー1つあたりの待ち行列の上限
+    WEBHOOK_WORKER_COUNT = int(os.getenv('WEBHOOK_WORKER_COUNT', '4'))
+    WEBHOOK_WORKER_QUEUE_SIZE = int(os.getenv('WEBHOOK_WORKER_QUEUE_SIZE', '100'))
+    # 再送されたWebhookイベントを重複とみなす期間（秒）と、記録しておくイベントIDの上限数
+    # 処理済みイベントIDの記録は SESSION_STORE_PATH が設定されていればそのファイルで複数プロセス間で共有し、なければプロセスごとに持つ
+    WEBHOOK_DEDUP_WINDOW_SECONDS = float(os.getenv('WEBHOOK_DEDUP_WINDOW_SECONDS', '600'))
+    WEBHOOK_DEDUP_MAX_ENTRIES = int(os.getenv('WEBHOOK_DEDUP_MAX_ENTRIES', '10000'))
+
+    # セッション（会話状態とデータ）と処理済みWebhookイベントIDを保存するSQLiteファイルのパス。設定すると複数のワーカープロセス間で共有できる
+    SESSION_STORE_PATH = os.getenv('SESSION_STORE_PATH')
+    # 最後のアクセスからこの秒数を過ぎた会話（放置されたセッション）を破棄する。0 で無期限
+    SESSION_IDLE_TTL_SECONDS = float(os.getenv('SESSION_IDLE_TTL_SECONDS', '1800'))
+    # 保持するセッション数の上限。超えた場合は最後のアクセスが古いものから破棄する。0 で無制限
+    SESSION_MAX_ENTRIES = int(os.getenv('SESSION_MAX_ENTRIES', '10000'))
+
+    # セッション・キャッシュ・ワーカーなどの統計（main.collect_stats）をログに出力する間隔（秒）。0 で出力しない
+    STATS_LOG_INTERVAL_SECONDS = float(os.getenv('STATS_LOG_INTERVAL_SECONDS', '600'))
+
+    # スケジュール一覧・参加者一覧の1ページ（1回の返信）に表示する最大件数
+    LIST_PAGE_SIZE = int(os.getenv('LIST_PAGE_SIZE', '20'))
+
     # デフォルト応答メッセージ
     DEFAULT_REPLY_MESSAGE = "認識できないコマンドです。メニューから選択するか、正しいコマンドを入力してください。"
 
@@ -75,20 +169,25 @@ class SessionState:
     ASKING_FOR_ANOTHER_ATTENDEE_EDIT = "asking_for_another_attendee_edit"
 
 
-    _state_store = {} # {user_id: current_state_string}
+    # 状態は utils/session_store.py のセッションストアにセッションデータと同じレコードで保存する
+
+    @staticmethod
+    def _store():
+        from utils.session_store import get_session_store # utils.session_store が Config を参照するため遅延インポート
+        return get_session_store()
 
     @classmethod
     def set_state(cls, user_id, state):
-        cls._state_store[user_id] = state
+        cls._store().set_state(user_id, state)
         print(f"DEBUG: User {user_id} state changed to: {state}")
 
     @classmethod
     def get_state(cls, user_id):
-        return cls._state_store.get(user_id, cls.NONE)
+        state, _ = cls._store().get(user_id)
+        return state if state is not None else cls.NONE
 
     @classmethod
     def clear_state(cls, user_id):
-        if user_id in cls._state_store:
-            del cls._state_store[user_id]
+        if cls._store().get(user_id)[0] is not None:
+            cls._store().clear_state(user_id)
             print(f"DEBUG: User {user_id} state cleared.")
-
@@ -1,72 +1,122 @@
-import os
 import json
+import threading
+
 import gspread
-from oauth2client.service_account import ServiceAccountCredentials
+from requests.adapters import HTTPAdapter
+
 from config import Config # config.py から設定をインポート
+from google_sheets import rate_limiter
 
-# グローバル変数としてgspreadクライアントとスプレッドシートインスタンスを保持
-# モジュールが読み込まれた際に一度だけ初期化を試みる
+# プロセス全体で共有するgspreadクライアント・スプレッドシート・ワークシートのハンドル
+# 初回アクセス時に一度だけ認証とスプレッドシートのオープンを行い、以降は使い回す
+_lock = threading.RLock()
 _client = None
 _spreadsheet = None
+_worksheets = {} # {worksheet_name: gspread.Worksheet}
+
+
+def _mount_connection_pool(client):
+    """
+    gspreadが内部で使用するrequests.Sessionに、Keep-Alive用の接続プールをマウントします。
+    gspread 6系は client.http_client.session、5系は client.session を持つため両方に対応します。
+    """
+    http_client = getattr(client, 'http_client', client)
+    session = getattr(http_client, 'session', None)
+    if session is None:
+        print("WARNING: Could not find HTTP session on gspread client. Connection pool not configured.")
+        return
+
+    pool_size = Config.GOOGLE_SHEETS_HTTP_POOL_SIZE
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+
 
 def _initialize_google_sheets_connection():
     """
     Google Sheets APIクライアントを初期化し、指定されたスプレッドシートを開く内部関数。
-    初回呼び出し時に一度だけ実行される。
+    呼び出し元で _lock を保持していることを前提とします。
     """
     global _client, _spreadsheet
 
     if _client is not None and _spreadsheet is not None:
         return # 既に初期化済みであれば何もしない
 
-    try:
-        credentials_json = os.environ.get('GOOGLE_SHEETS_CREDENTIALS')
-        if not credentials_json:
-            raise ValueError("GOOGLE_SHEETS_CREDENTIALS environment variable not set.")
-
-        credentials_info = json.loads(credentials_json)
-        scope = [
-            'https://spreadsheets.google.com/feeds',
-            'https://www.googleapis.com/auth/drive',
-        ]
-        creds = ServiceAccountCredentials.from_json_keyfile_dict(credentials_info, scope)
-        _client = gspread.authorize(creds)
-        print("DEBUG: Google Sheets service account authenticated successfully.")
-
-        # config.py からスプレッドシート名を取得
+    credentials_json = Config.GOOGLE_SHEETS_CREDENTIALS
+    if not credentials_json:
+        raise ValueError("Google Sheets credentials (GOOGLE_SHEETS_CREDENTIALS) not set in environment variables.")
+
+    credentials_info = json.loads(credentials_json)
+
+    # service_account_from_dict は google-auth の AuthorizedSession を使用するため、
+    # アクセストークンの期限切れ時は自動的にリフレッシュされる（再認証は不要）
+    client = gspread.service_account_from_dict(credentials_info)
+    client.set_timeout(Config.GOOGLE_SHEETS_HTTP_TIMEOUT_SECONDS) # 1リクエストあたりのHTTPタイムアウト
+    _mount_connection_pool(client)
+    print("DEBUG: Google Sheets service account authenticated successfully.")
+
+    spreadsheet_key = Config.GOOGLE_SHEETS_SPREADSHEET_KEY
+    if spreadsheet_key:
+        # キー指定ならDrive検索が不要
+        spreadsheet = rate_limiter.call('read', client.open_by_key, spreadsheet_key)
+        print(f"DEBUG: Spreadsheet '{spreadsheet_key}' opened by key successfully.")
+    else:
         spreadsheet_name = Config.GOOGLE_SHEETS_SPREADSHEET_NAME
         if not spreadsheet_name:
-            raise ValueError("GOOGLE_SHEETS_SPREADSHEET_NAME is not set in config.py or environment variable.")
-
-        _spreadsheet = _client.open(spreadsheet_name)
-        print(f"DEBUG: Spreadsheet '{spreadsheet_name}' opened successfully.")
-
-    except gspread.SpreadsheetNotFound:
-        print(f"ERROR: Spreadsheet '{Config.GOOGLE_SHEETS_SPREADSHEET_NAME}' not found. Please check the name or permissions.")
-        # 致命的なエラーなので、raiseしてアプリケーションの起動を止める
-        raise FileNotFoundError(f"Spreadsheet '{Config.GOOGLE_SHEETS_SPREADSHEET_NAME}' not found.")
-    except Exception as e:
-        print(f"ERROR: Error initializing Google Sheets client or opening spreadsheet: {e}")
-        # 致命的なエラーなので、raiseしてアプリケーションの起動を止める
-        raise
-
-# モジュールがインポートされたときに一度だけ初期化を試みる
-try:
-    _initialize_google_sheets_connection()
-except (ValueError, FileNotFoundError, Exception) as e:
-    print(f"CRITICAL ERROR: Failed to initialize Google Sheets API client: {e}")
-    # 初期化失敗時は、後続のget_google_sheets_client()などがエラーを返すようにする
-    _client = None
-    _spreadsheet = None
+            raise ValueError("GOOGLE_SHEETS_SPREADSHEET_KEY or GOOGLE_SHEETS_SPREADSHEET_NAME must be set.")
+        try:
+            spreadsheet = rate_limiter.call('drive', client.open, spreadsheet_name)
+        except gspread.SpreadsheetNotFound:
+            print(f"ERROR: Spreadsheet '{spreadsheet_name}' not found. Please check the name or permissions.")
+            raise FileNotFoundError(f"Spreadsheet '{spreadsheet_name}' not found.")
+        print(f"DEBUG: Spreadsheet '{spreadsheet_name}' opened successfully. "
+              f"Set GOOGLE_SHEETS_SPREADSHEET_KEY={spreadsheet.id} to skip the Drive search.")
+
+    _client = client
+    _spreadsheet = spreadsheet
 
 
 def get_google_sheets_client_and_spreadsheet():
     """
     初期化されたgspreadクライアントとスプレッドシートインスタンスを返します。
+    未初期化の場合はここで一度だけ初期化します（スレッドセーフ）。
     """
     if _client is None or _spreadsheet is None:
-        # 初期化が失敗している場合、またはまだ実行されていない場合（通常はモジュールロード時に実行されるはず）
-        # ここで再度初期化を試みるか、エラーを返すか選択。ここではエラーを返す。
-        raise RuntimeError("Google Sheets client or spreadsheet not initialized.")
+        with _lock:
+            try:
+                _initialize_google_sheets_connection()
+            except Exception as e:
+                print(f"ERROR: Error initializing Google Sheets client or opening spreadsheet: {e}")
+                raise
     return _client, _spreadsheet
 
+
+def get_worksheet(worksheet_name: str) -> gspread.Worksheet:
+    """
+    指定された名前のワークシートを返します。ハンドルはキャッシュされ、2回目以降はAPI呼び出しを行いません。
+    :param worksheet_name: ワークシートの名前
+    :return: gspread.Worksheet
+    """
+    worksheet = _worksheets.get(worksheet_name)
+    if worksheet is not None:
+        return worksheet
+
+    with _lock:
+        worksheet = _worksheets.get(worksheet_name)
+        if worksheet is None:
+            _, spreadsheet = get_google_sheets_client_and_spreadsheet()
+            worksheet = rate_limiter.call('read', spreadsheet.worksheet, worksheet_name) # 見つからない場合は WorksheetNotFound
+            _worksheets[worksheet_name] = worksheet
+            print(f"DEBUG: Worksheet '{worksheet_name}' handle cached.")
+    return worksheet
+
+
+def reset_google_sheets_connection():
+    """
+    保持しているクライアント・スプレッドシート・ワークシートのハンドルを破棄します。
+    次回アクセス時に再初期化されます。（認証情報の変更時やテスト用）
+    """
+    global _client, _spreadsheet
+    with _lock:
+        _client = None
+        _spreadsheet = None
+        _worksheets.clear()
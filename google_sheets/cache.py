@@ -0,0 +1,395 @@
+import threading
+import time
+
+import pandas as pd
+from gspread.utils import numericise_all
+
+from config import Config
+from google_sheets import rate_limiter, schema
+from google_sheets.api_client import get_google_sheets_client_and_spreadsheet
+
+# ワークシート名ごとの読み取りキャッシュ
+# get_all_records() の結果をTTLの間保持し、書き込み系の関数から明示的に無効化される
+# 各エントリは主キー → シート行番号 のインデックスと、副インデックス列（参加者ID など）の値 → シート行番号 の索引を持ち、
+# 書き込み時は再取得せずに差分で更新される
+# TTLが切れたエントリは、スプレッドシートの最終更新日時（Drive APIの modifiedTime）を確認し、
+# 変わっていなければ全件を取り直さずにそのまま使い続ける
+# modifiedTime が変わっていた場合は、このプロセス自身の書き込み（差分更新済み）によるものでも読み込み直す。
+# 同じ間に人がシートを直接編集していても、modifiedTime からは区別できないため
+
+
+def normalize_key_value(column: str, value) -> str:
+    """
+    主キーの比較用に値を正規化します。日付列は YYYY/MM/DD 形式に揃え、それ以外は文字列化します。
+    """
+    if column == '日付':
+        date_value = pd.to_datetime(value, errors='coerce')
+        if not pd.isna(date_value):
+            return date_value.strftime(Config.DATE_FORMAT)
+    return str(value)
+
+
+def schedule_date_sort_key(value):
+    """
+    スケジュールの並び順に使うソートキー。日付として解釈できない値は末尾に並べます。
+    """
+    date_value = pd.to_datetime(value, errors='coerce')
+    if pd.isna(date_value):
+        return (1, pd.Timestamp.min)
+    return (0, date_value.normalize())
+
+
+class _CacheEntry:
+    """1ワークシート分のキャッシュ内容（ヘッダー行・レコード・主キーインデックス・副インデックス）。"""
+
+    def __init__(self, worksheet_schema: schema.WorksheetSchema, records: list, version: str = None):
+        self.lock = threading.RLock()
+        self.version = version # 読み込み時点のスプレッドシートの modifiedTime
+        self.schema = worksheet_schema
+        self.headers = worksheet_schema.headers
+        self.records = records # [{ヘッダー: 値, ...}, ...] records[i] はシートの i+2 行目
+        self.key_columns = worksheet_schema.key_columns
+        self.index_columns = worksheet_schema.index_columns
+        self.loaded_at = time.monotonic()
+        self.checked_at = self.loaded_at # 最後にシートと一致していることを確認した時刻
+        self._df = None
+        self._rebuild_index()
+
+    def is_fresh(self, ttl: float) -> bool:
+        return ttl > 0 and (time.monotonic() - self.checked_at) < ttl
+
+    def can_revalidate(self) -> bool:
+        max_age = Config.GOOGLE_SHEETS_CACHE_MAX_AGE_SECONDS
+        return self.version is not None and (time.monotonic() - self.loaded_at) < max_age
+
+    def dataframe(self) -> pd.DataFrame:
+        with self.lock:
+            if self._df is None:
+                self._df = pd.DataFrame(self.records) if self.records else pd.DataFrame()
+            return self._df
+
+    def _record_key(self, values: dict) -> tuple:
+        return tuple(normalize_key_value(column, values.get(column, '')) for column in self.key_columns)
+
+    def _rebuild_index(self):
+        self.key_index = {} # {主キー: [シート行番号, ...]} 行番号は昇順
+        self.column_indexes = {column: {} for column in self.index_columns} # {列名: {値: [シート行番号, ...]}} 行番号は昇順
+        for i, record in enumerate(self.records):
+            self.key_index.setdefault(self._record_key(record), []).append(i + 2)
+            for column, index in self.column_indexes.items():
+                index.setdefault(str(record.get(column, '')), []).append(i + 2)
+
+    def _shift_rows(self, from_row: int, delta: int):
+        for index in [self.key_index, *self.column_indexes.values()]:
+            for rows in index.values():
+                for i, row_index in enumerate(rows):
+                    if row_index >= from_row:
+                        rows[i] = row_index + delta
+
+    @staticmethod
+    def _index_add(index: dict, value, row_index: int):
+        rows = index.setdefault(value, [])
+        rows.append(row_index)
+        rows.sort()
+
+    @staticmethod
+    def _index_remove(index: dict, value, row_index: int):
+        rows = index.get(value, [])
+        if row_index in rows:
+            rows.remove(row_index)
+        if not rows:
+            index.pop(value, None)
+
+    def find_row(self, key_values: dict):
+        """
+        主キー列の値が一致する最初の行のシート行番号を返します。見つからない場合は None。
+        :param key_values: 主キー列を含む辞書 (例: {'日付': '2025/06/15', 'タイトル': '会議'})
+        """
+        if not self.key_columns:
+            return None
+        with self.lock:
+            rows = self.key_index.get(self._record_key(key_values))
+            return rows[0] if rows else None
+
+    def find_records(self, column: str, value) -> list:
+        """
+        副インデックス列の値が一致する全ての行のレコードを、シートの行順に返します。
+        全件を走査せず、一致した件数分の処理で済みます。
+        :param column: 副インデックス列の名前 (例: '参加者ID')
+        :return: レコードのコピーのリスト。列が副インデックスでない場合は KeyError
+        """
+        with self.lock:
+            rows = self.column_indexes[column].get(str(value), [])
+            return [dict(self.records[row_index - 2]) for row_index in rows]
+
+    def insert_record(self, row_index: int, record: dict):
+        with self.lock:
+            self._shift_rows(row_index, 1)
+            self.records.insert(row_index - 2, record)
+            self._index_add(self.key_index, self._record_key(record), row_index)
+            for column, index in self.column_indexes.items():
+                self._index_add(index, str(record.get(column, '')), row_index)
+            self._df = None
+
+    def delete_record(self, row_index: int):
+        with self.lock:
+            record = self.records.pop(row_index - 2)
+            self._index_remove(self.key_index, self._record_key(record), row_index)
+            for column, index in self.column_indexes.items():
+                self._index_remove(index, str(record.get(column, '')), row_index)
+            self._shift_rows(row_index + 1, -1)
+            self._df = None
+
+    def update_record(self, row_index: int, changes: dict):
+        with self.lock:
+            record = self.records[row_index - 2]
+            old_key = self._record_key(record)
+            old_values = {column: str(record.get(column, '')) for column in self.index_columns}
+            record.update(changes)
+            new_key = self._record_key(record)
+            if new_key != old_key:
+                self._index_remove(self.key_index, old_key, row_index)
+                self._index_add(self.key_index, new_key, row_index)
+            for column, index in self.column_indexes.items():
+                new_value = str(record.get(column, ''))
+                if new_value != old_values[column]:
+                    self._index_remove(index, old_values[column], row_index)
+                    self._index_add(index, new_value, row_index)
+            self._df = None
+
+
+_lock = threading.Lock()
+_load_locks = {} # {worksheet_name: threading.Lock} 同一シートの同時ミスを1回の読み込みにまとめる
+_entries = {} # {worksheet_name: _CacheEntry}
+_stats = {'hits': 0, 'misses': 0, 'invalidations': 0, 'probes': 0, 'revalidations': 0}
+_data_versions = {} # {worksheet_name: int} ワークシートの内容が変わる（読み込み直し・書き込み）たびに増える番号
+_all_data_version = 0 # 全ワークシートをまとめて進めた回数
+
+
+def values_to_records(values: list) -> tuple[list, list]:
+    """
+    get_all_values() の結果（ヘッダー行を含む二次元配列）を、
+    gspread の get_all_records() と同じ形式のレコードに変換します。
+    :return: (ヘッダーのリスト, レコードのリスト)
+    """
+    if not values:
+        return [], []
+    headers = values[0]
+    records = []
+    for row in values[1:]:
+        padded = list(row) + [''] * (len(headers) - len(row))
+        records.append(dict(zip(headers, numericise_all(padded[:len(headers)], empty2zero=False, default_blank=''))))
+    return headers, records
+
+
+def _get_load_lock(worksheet_name: str) -> threading.Lock:
+    with _lock:
+        load_lock = _load_locks.get(worksheet_name)
+        if load_lock is None:
+            load_lock = _load_locks[worksheet_name] = threading.Lock()
+        return load_lock
+
+
+def _probe_version():
+    """
+    スプレッドシートの最終更新日時を取得します。全件の読み込みに比べて非常に軽いリクエストです。
+    確認が無効、または失敗した場合は None を返します。
+    """
+    if not Config.GOOGLE_SHEETS_CHANGE_PROBE:
+        return None
+    try:
+        _, spreadsheet = get_google_sheets_client_and_spreadsheet()
+        version = rate_limiter.call('drive', spreadsheet.get_lastUpdateTime)
+    except Exception as e:
+        print(f"WARNING: Failed to probe spreadsheet modified time: {e}")
+        return None
+
+    with _lock:
+        _stats['probes'] += 1
+    return version
+
+
+def get_entry(worksheet_name: str, loader, revalidate: bool = False) -> _CacheEntry:
+    """
+    キャッシュエントリを返します。期限切れまたは未取得の場合は loader() で読み込みます。
+    期限切れでも、スプレッドシートの最終更新日時が読み込み時から変わっていなければ読み込みを省略します。
+    :param worksheet_name: ワークシート名
+    :param loader: ヘッダー行を含む全セル値（二次元配列）を返す関数
+    :param revalidate: True の場合はTTL内でもシートの変更有無を確認する
+    """
+    return get_entries([worksheet_name], lambda names: {worksheet_name: loader()}, revalidate)[worksheet_name]
+
+
+def peek_entry(worksheet_name: str):
+    """
+    読み込み済みのキャッシュエントリを、期限・変更の確認や読み込みを行わずに返します。未読み込みの場合は None。
+    内容が古い可能性があるため、応答の文言の選択など、多少古くても構わない用途にだけ使うこと。
+    """
+    return _entries.get(worksheet_name)
+
+
+def get_entries(worksheet_names: list, batch_loader, revalidate: bool = False) -> dict:
+    """
+    複数のワークシートのキャッシュエントリをまとめて返します。
+    読み込みが必要なワークシートは、batch_loader の1回の呼び出しでまとめて読み込みます。
+    :param worksheet_names: ワークシート名のリスト
+    :param batch_loader: ワークシート名のリストを受け取り、{ワークシート名: 全セル値（二次元配列）} を返す関数
+    :param revalidate: True の場合はTTL内でもシートの変更有無を確認する
+    :return: {ワークシート名: _CacheEntry}
+    """
+    ttl = 0 if revalidate else Config.GOOGLE_SHEETS_CACHE_TTL_SECONDS
+
+    entries = {}
+    stale_names = []
+    for name in dict.fromkeys(worksheet_names):
+        entry = _entries.get(name)
+        if entry is not None and entry.is_fresh(ttl):
+            entries[name] = entry
+        else:
+            stale_names.append(name)
+    with _lock:
+        _stats['hits'] += len(entries)
+    if not stale_names:
+        return entries
+
+    # 読み込みロックは名前順に取得し、複数シートを同時に読み込むスレッド同士がデッドロックしないようにする
+    load_locks = [_get_load_lock(name) for name in sorted(stale_names)]
+    for load_lock in load_locks:
+        load_lock.acquire()
+    try:
+        # 待っている間に他のスレッドが読み込んでいれば、それを使う
+        to_check = []
+        for name in stale_names:
+            entry = _entries.get(name)
+            if entry is not None and entry.is_fresh(ttl):
+                entries[name] = entry
+                with _lock:
+                    _stats['hits'] += 1
+            else:
+                to_check.append(name)
+        if not to_check:
+            return entries
+
+        # 読み込みより先に確認し、読み込み中の変更は次回の確認で検出されるようにする
+        version = _probe_version()
+        to_load = []
+        for name in to_check:
+            entry = _entries.get(name)
+            if entry is not None and version is not None and entry.can_revalidate() and entry.version == version:
+                entry.checked_at = time.monotonic()
+                entries[name] = entry
+                with _lock:
+                    _stats['revalidations'] += 1
+            else:
+                to_load.append(name)
+        if not to_load:
+            return entries
+
+        with _lock:
+            _stats['misses'] += len(to_load)
+        values_by_name = batch_loader(to_load)
+        for name in to_load:
+            headers, records = values_to_records(values_by_name.get(name) or [])
+            # 読み込んだヘッダー行をスキーマレジストリに渡し、変更があればそこで検出させる
+            entry = _CacheEntry(schema.observe_headers(name, headers), records, version)
+            with _lock:
+                previous = _entries.get(name)
+                _entries[name] = entry
+            # TTL切れで読み込み直しても内容が同じであれば、版番号は進めない（表示結果などを使い回せるようにする）
+            if previous is None or previous.headers != entry.headers or previous.records != records:
+                bump_data_version(name)
+            entries[name] = entry
+            print(f"DEBUG: Cache loaded for worksheet '{name}' ({len(records)} records).")
+        return entries
+    finally:
+        for load_lock in load_locks:
+            load_lock.release()
+
+
+def bump_data_version(worksheet_name: str = None):
+    """
+    ワークシートの内容の版番号を進めます。名前を省略した場合は全てのワークシートの版番号を進めます。
+    """
+    global _all_data_version
+    with _lock:
+        if worksheet_name is None:
+            _all_data_version += 1
+        else:
+            _data_versions[worksheet_name] = _data_versions.get(worksheet_name, 0) + 1
+
+
+def get_data_version(worksheet_name: str) -> int:
+    """
+    ワークシートの内容の版番号を返します。内容から作った表示結果などを、内容が変わるまで使い回すためのキーです。
+    """
+    # どちらの番号も増える一方なので、和もどちらかが進むたびに必ず増える
+    return _data_versions.get(worksheet_name, 0) + _all_data_version
+
+
+def get_dataframe(worksheet_name: str, loader) -> pd.DataFrame:
+    """
+    キャッシュ経由でワークシートのDataFrameを返します。
+    呼び出し元が列を書き換えてもキャッシュに影響しないよう、コピーを返します。
+    """
+    return get_entry(worksheet_name, loader).dataframe().copy()
+
+
+def get_dataframes(worksheet_names: list, batch_loader) -> dict:
+    """
+    キャッシュ経由で複数のワークシートのDataFrameをまとめて返します。（get_entries を参照）
+    :return: {ワークシート名: DataFrame}
+    """
+    return {name: entry.dataframe().copy() for name, entry in get_entries(worksheet_names, batch_loader).items()}
+
+
+def invalidate(worksheet_name: str = None):
+    """
+    指定されたワークシートのキャッシュを破棄します。名前を省略した場合は全て破棄します。
+    書き込みの成否が不明でキャッシュを差分更新できない場合に使用します。
+    """
+    with _lock:
+        if worksheet_name is None:
+            _entries.clear()
+        else:
+            _entries.pop(worksheet_name, None)
+        _stats['invalidations'] += 1
+    bump_data_version(worksheet_name)
+
+
+def patch_insert(worksheet_name: str, row_index: int, record: dict):
+    """
+    シートへの行挿入をキャッシュに反映します。以降の行番号は1つずつ後ろにずれます。
+    キャッシュが無い場合は何もしません。
+    """
+    entry = _entries.get(worksheet_name)
+    if entry is not None:
+        entry.insert_record(row_index, record)
+    bump_data_version(worksheet_name)
+
+
+def patch_delete(worksheet_name: str, row_index: int):
+    """
+    シートからの行削除をキャッシュに反映します。以降の行番号は1つずつ前にずれます。
+    """
+    entry = _entries.get(worksheet_name)
+    if entry is not None:
+        entry.delete_record(row_index)
+    bump_data_version(worksheet_name)
+
+
+def patch_update(worksheet_name: str, row_index: int, changes: dict):
+    """
+    シートのセル更新をキャッシュに反映します。主キー列が変わった場合はインデックスも付け替えます。
+    """
+    entry = _entries.get(worksheet_name)
+    if entry is not None:
+        entry.update_record(row_index, changes)
+    bump_data_version(worksheet_name)
+
+
+def get_cache_stats() -> dict:
+    """
+    キャッシュのヒット数・ミス数・無効化回数を返します。（監視・デバッグ用）
+    """
+    with _lock:
+        return dict(_stats, worksheets=len(_entries))
@@ -0,0 +1,338 @@
+import json
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError: # Windows
+    fcntl = None
+
+from config import Config
+from google_sheets import rate_limiter
+
+# スプレッドシートへの書き込みの追記専用ジャーナル
+# Config.GOOGLE_SHEETS_JOURNAL_PATH が設定されていて、ローカルミラーが無効な場合に有効になる（ミラーは独自の outbox を持つ）。
+# 書き込みは1件ずつJSONの1行としてジャーナルに追記・fsync してからシートへ書き込み、成功したら完了の行を追記する。
+# シートへの書き込みが失敗した（Google Sheets に接続できない等）書き込みはジャーナルに残り、
+# バックグラウンドの再送スレッドが登録順にまとめてシートへ反映する。失敗が続く間は指数的に間隔を空けて再試行する。
+# 完了した書き込みが溜まったら、未完了の書き込みだけを残してファイルを書き直す（コンパクション）。
+# 400 などの再送しても成功しない失敗はジャーナルに残さず、呼び出し元に失敗として返す。
+# ジャーナルは1つのプロセスだけが使う（書き込みIDの採番とコンパクションがプロセス内で完結しているため）。
+# 複数のワーカープロセスで起動した場合は、ロックファイルを最初に取得したプロセスだけが使い、
+# 他のプロセスではジャーナルを無効にしてシートへ直接書き込む。
+
+_lock = threading.RLock()
+_file = None
+_lock_file = None # 他のプロセスと同じジャーナルを使わないための排他ロック（path + '.lock'）
+_unavailable = False # 他のプロセスがジャーナルを使用中のため、このプロセスでは使えない
+_replay_thread = None
+_wake_event = threading.Event()
+_pending = {} # {書き込みID: {'id', 'operation', 'arguments', 'created_at'}} 登録順
+_in_flight = set() # 呼び出し元のスレッドがシートへ直接書き込み中の書き込みID。再送の対象にしない
+_attempts = {} # {書き込みID: 再送に失敗した回数}
+_next_id = 1
+_completed_since_compaction = 0
+_writers = {} # {操作名: シートへ直接書き込む関数}
+_batch_writers = {} # {操作名: 同じ操作の複数回分の引数のリストを受け取り、まとめてシートへ書き込む関数}
+_stats = {'appended': 0, 'direct': 0, 'replayed': 0, 'rejected': 0, 'dropped': 0, 'failures': 0, 'compactions': 0}
+
+
+def is_enabled() -> bool:
+    return bool(Config.GOOGLE_SHEETS_JOURNAL_PATH) and not Config.GOOGLE_SHEETS_MIRROR_PATH and not _unavailable
+
+
+def register_writers(writers: dict, batch_writers: dict = None):
+    """
+    再送に使う関数を登録します。（google_sheets/utils.py から呼ばれる）
+    :param writers: {操作名: シートへ直接書き込む関数} 関数はAPI呼び出しの失敗を例外として送出すること
+    :param batch_writers: {操作名: 引数のリストを受け取り、まとめて書き込む関数} 連続する同じ操作の再送に使う
+    """
+    _writers.update(writers)
+    _batch_writers.update(batch_writers or {})
+
+
+def _write_line(entry: dict):
+    """1行を追記し、ディスクに書き込まれるまで待ちます。呼び出し元で _lock を保持していること。"""
+    _file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+    _file.flush()
+    os.fsync(_file.fileno())
+
+
+def _load(path: str):
+    """
+    既存のジャーナルを読み込み、未完了の書き込みを復元します。
+    プロセスが追記の途中で落ちた場合の、末尾の不完全な行は読み飛ばします。
+    """
+    global _next_id
+    if not os.path.exists(path):
+        return
+    with open(path, encoding='utf-8') as f:
+        for line_number, line in enumerate(f, start=1):
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                print(f"WARNING: Skipping unreadable line {line_number} in journal '{path}'.")
+                continue
+            if 'done' in entry:
+                for entry_id in entry['done']:
+                    _pending.pop(entry_id, None)
+            else:
+                _pending[entry['id']] = entry
+                _next_id = max(_next_id, entry['id'] + 1)
+
+
+def _acquire_file_lock(path: str) -> bool:
+    """
+    ジャーナルの排他ロックを取得します。他のプロセスが取得済みの場合は False。
+    """
+    global _lock_file
+    if fcntl is None:
+        return True
+    lock_file = open(path + '.lock', 'a')
+    try:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return False
+    _lock_file = lock_file
+    return True
+
+
+def _ensure_open() -> bool:
+    """
+    ジャーナルを開き、再送スレッドを起動します。2回目以降は何もしません。
+    :return: ジャーナルを使える場合はTrue。他のプロセスが使用中の場合は False
+    """
+    global _file, _replay_thread, _unavailable
+    if _file is not None:
+        return True
+    with _lock:
+        if _unavailable:
+            return False
+        if _file is None:
+            path = Config.GOOGLE_SHEETS_JOURNAL_PATH
+            if not _acquire_file_lock(path):
+                _unavailable = True
+                print(f"WARNING: Sheets journal '{path}' is used by another process. "
+                      f"Writing to Google Sheets directly from this process.")
+                return False
+            _load(path)
+            _file = open(path, 'a', encoding='utf-8')
+            print(f"DEBUG: Sheets journal opened at '{path}' ({len(_pending)} pending).")
+        if _replay_thread is None:
+            _replay_thread = threading.Thread(target=_replay_loop, name='sheets-journal-replay', daemon=True)
+            _replay_thread.start()
+    return True
+
+
+def resume():
+    """
+    ジャーナルを開き、前回のプロセスで反映できなかった書き込みがあれば再送を始めます。（起動時に呼び出す）
+    """
+    if _ensure_open():
+        _wake_event.set()
+
+
+def append(operation: str, arguments: dict) -> tuple:
+    """
+    書き込みをジャーナルに追記します。戻った時点でディスクに書き込まれています。
+    :return: (書き込みID, 再送待ちの書き込みが他にあるか)
+        再送待ちの書き込みがある場合、呼び出し元はシートへ直接書き込まず、順序を保つため再送に任せること
+    """
+    global _next_id
+    if not _ensure_open():
+        raise RuntimeError("The sheets journal is used by another process.")
+    with _lock:
+        backlog = any(entry_id not in _in_flight for entry_id in _pending)
+        entry = {'id': _next_id, 'operation': operation, 'arguments': arguments, 'created_at': time.time()}
+        _next_id += 1
+        _write_line(entry)
+        _pending[entry['id']] = entry
+        if not backlog:
+            _in_flight.add(entry['id'])
+        _stats['appended'] += 1
+    if backlog:
+        _wake_event.set()
+    return entry['id'], backlog
+
+
+def complete(entry_id: int):
+    """
+    呼び出し元がシートへ直接書き込んだ書き込みを完了として記録します。
+    """
+    with _lock:
+        _in_flight.discard(entry_id)
+        _stats['direct'] += 1
+        _mark_done([entry_id])
+
+
+def discard(entry_id: int):
+    """
+    呼び出し元がシートへ直接書き込めず、再送しても成功しない（400 など）書き込みを、再送せずに取り除きます。
+    """
+    with _lock:
+        _in_flight.discard(entry_id)
+        _stats['rejected'] += 1
+        _mark_done([entry_id])
+
+
+def defer(entry_id: int):
+    """
+    呼び出し元がシートへ直接書き込めなかった書き込みを、再送に任せます。
+    """
+    with _lock:
+        _in_flight.discard(entry_id)
+    _wake_event.set()
+
+
+def _mark_done(entry_ids: list):
+    """完了した書き込みを1行で記録し、必要であればコンパクションを行います。呼び出し元で _lock を保持していること。"""
+    global _completed_since_compaction
+    if not entry_ids:
+        return
+    _write_line({'done': entry_ids})
+    for entry_id in entry_ids:
+        _pending.pop(entry_id, None)
+        _attempts.pop(entry_id, None)
+    _completed_since_compaction += len(entry_ids)
+    if _completed_since_compaction >= Config.GOOGLE_SHEETS_JOURNAL_COMPACT_THRESHOLD:
+        _compact()
+
+
+def _compact():
+    """
+    未完了の書き込みだけを書いた新しいファイルで、ジャーナルを置き換えます。呼び出し元で _lock を保持していること。
+    一時ファイルへの書き込みと fsync が終わってから置き換えるため、途中で落ちても元のジャーナルが残る。
+    """
+    global _file, _completed_since_compaction
+    path = Config.GOOGLE_SHEETS_JOURNAL_PATH
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        for entry in _pending.values():
+            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+    _file.close()
+    os.replace(temp_path, path)
+    directory_fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(directory_fd) # ファイル名の置き換えもディスクに残す
+    finally:
+        os.close(directory_fd)
+    _file = open(path, 'a', encoding='utf-8')
+    _completed_since_compaction = 0
+    _stats['compactions'] += 1
+    print(f"DEBUG: Sheets journal compacted ({len(_pending)} pending).")
+
+
+def _is_success(result) -> bool:
+    return result[0] if isinstance(result, tuple) else bool(result)
+
+
+def _next_batch() -> list:
+    """
+    再送する書き込みを登録順に最大 Config.GOOGLE_SHEETS_JOURNAL_BATCH_SIZE 件返します。
+    直接書き込み中の書き込みに当たったら、順序を保つためそこで止めます。
+    """
+    batch = []
+    with _lock:
+        for entry_id, entry in _pending.items():
+            if entry_id in _in_flight or len(batch) >= Config.GOOGLE_SHEETS_JOURNAL_BATCH_SIZE:
+                break
+            batch.append(entry)
+    return batch
+
+
+def _group_batch(batch: list) -> list:
+    """連続する同じ操作のうち、まとめて書き込める操作を1つのグループにまとめます。"""
+    groups = []
+    for entry in batch:
+        if groups and entry['operation'] in _batch_writers and groups[-1][0]['operation'] == entry['operation']:
+            groups[-1].append(entry)
+        else:
+            groups.append([entry])
+    return groups
+
+
+def _replay_group(group: list):
+    """1グループ分の書き込みをシートへ反映します。API呼び出しの失敗は例外のまま送出します。"""
+    operation = group[0]['operation']
+    if operation in _batch_writers:
+        _batch_writers[operation]([entry['arguments'] for entry in group])
+        return
+    result = _writers[operation](**group[0]['arguments'])
+    if not _is_success(result):
+        # シート側で人が直接編集した等で対象が見つからない場合。再試行しても解消しないため破棄する
+        print(f"WARNING: Replay of '{operation}' was rejected by Google Sheets: {result}. Dropping it.")
+        with _lock:
+            _stats['rejected'] += 1
+
+
+def _drain() -> bool:
+    """
+    再送待ちの書き込みを登録順にまとめてシートへ反映します。失敗した時点で中断し、順序を保ったまま次回に再試行します。
+    :return: 全て反映できた場合はTrue
+    """
+    while True:
+        batch = _next_batch()
+        if not batch:
+            return True
+
+        replayed = []
+        for group in _group_batch(batch):
+            try:
+                _replay_group(group)
+            except Exception as e:
+                with _lock:
+                    _stats['failures'] += 1
+                    _stats['replayed'] += len(replayed)
+                    _mark_done(replayed)
+                    attempts = _attempts[group[0]['id']] = _attempts.get(group[0]['id'], 0) + 1
+                print(f"ERROR: Failed to replay '{group[0]['operation']}' to Google Sheets (attempt {attempts}): {e}")
+                # 400 などは再送しても成功しないため、後続の書き込みを待たせずにすぐ破棄する
+                if attempts < Config.GOOGLE_SHEETS_JOURNAL_MAX_ATTEMPTS and not rate_limiter.is_permanent(e):
+                    return False
+                # 何度再試行しても反映できない書き込みが、後続の書き込みを止め続けないようにする
+                print(f"ERROR: Giving up on journaled '{group[0]['operation']}': {[entry['arguments'] for entry in group]}")
+                with _lock:
+                    _stats['dropped'] += len(group)
+                    _mark_done([entry['id'] for entry in group])
+                break
+            replayed.extend(entry['id'] for entry in group)
+        else:
+            with _lock:
+                _stats['replayed'] += len(replayed)
+                _mark_done(replayed)
+
+
+def _replay_loop():
+    failures = 0
+    retry_at = 0.0
+    while True:
+        _wake_event.clear()
+        timeout = None # 全て反映できていれば、次に起こされるまで待つ
+        now = time.monotonic()
+        if now < retry_at:
+            timeout = retry_at - now # 失敗後の待ち時間中は、新しい書き込みで起こされても再試行しない
+        else:
+            try:
+                drained = _drain()
+            except Exception as e:
+                print(f"ERROR: Sheets journal replay failed: {e}")
+                drained = False
+            if drained:
+                failures = 0
+            else:
+                failures += 1
+                timeout = min(Config.GOOGLE_SHEETS_RETRY_BASE_SECONDS * 2 ** failures, 60) # 失敗が続く間は指数的に間隔を空ける
+                retry_at = time.monotonic() + timeout
+        _wake_event.wait(timeout)
+
+
+def get_journal_stats() -> dict:
+    """
+    再送待ちの書き込み件数と、追記・直接書き込み・再送・破棄・コンパクションの統計を返します。（監視・デバッグ用）
+    """
+    with _lock:
+        return dict(_stats, pending=len(_pending) - len(_in_flight))
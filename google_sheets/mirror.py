@@ -0,0 +1,483 @@
+import bisect
+import json
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+import pandas as pd
+
+from config import Config
+from google_sheets import rate_limiter
+from google_sheets.cache import bump_data_version, invalidate, normalize_key_value, schedule_date_sort_key
+
+# スケジュール・参加者ワークシートのローカルSQLiteミラー（任意機能）
+# Config.GOOGLE_SHEETS_MIRROR_PATH が設定されている場合のみ有効になる。
+# 読み取りはミラーから返し、書き込みはミラーに同期的に反映した上で outbox に積み、
+# バックグラウンドの同期スレッドがシートへ順番に反映する。outbox が空のときは定期的にシートの内容を取り込み直すため、
+# 人が直接編集したシートが引き続き正となる。
+# シートへの反映が Config.GOOGLE_SHEETS_MIRROR_MAX_ATTEMPTS 回失敗した書き込み（400 などはすぐ）は outbox_dead_letters に移し、
+# 後続の書き込みを止めないようにする。移した書き込みのローカルの変更は、次の取り込みでシートの内容に戻る。
+
+_SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS sheet_rows (
+    worksheet TEXT NOT NULL,
+    position REAL NOT NULL,
+    date TEXT NOT NULL,
+    title TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_sheet_rows_key ON sheet_rows (worksheet, date, title);
+CREATE INDEX IF NOT EXISTS idx_sheet_rows_user ON sheet_rows (worksheet, user_id);
+CREATE INDEX IF NOT EXISTS idx_sheet_rows_position ON sheet_rows (worksheet, position);
+CREATE TABLE IF NOT EXISTS sheet_headers (
+    worksheet TEXT PRIMARY KEY,
+    headers TEXT NOT NULL,
+    pulled_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    operation TEXT NOT NULL,
+    arguments TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS outbox_dead_letters (
+    id INTEGER PRIMARY KEY,
+    operation TEXT NOT NULL,
+    arguments TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    attempts INTEGER NOT NULL,
+    error TEXT NOT NULL,
+    failed_at REAL NOT NULL
+);
+"""
+
+_lock = threading.RLock()
+_conn = None
+_sync_thread = None
+_wake_event = threading.Event()
+_sheets_writers = {} # {operation: シートへ直接書き込む関数}
+_sheets_loader = None # worksheet_name -> (headers, records) をシートから読み込む関数
+_stats = {'replayed': 0, 'conflicts': 0, 'failures': 0, 'dead_lettered': 0, 'pulls': 0}
+
+
+def is_enabled() -> bool:
+    return bool(Config.GOOGLE_SHEETS_MIRROR_PATH)
+
+
+def register_sheets_backend(writers: dict, loader):
+    """
+    同期スレッドがシートへの反映・取り込みに使う関数を登録します。（google_sheets/utils.py から呼ばれる）
+    :param writers: {操作名: シートへ直接書き込む関数} 関数はAPI呼び出しの失敗を例外として送出すること
+    :param loader: ワークシート名を受け取り、シートの最新の (ヘッダー, レコード) を返す関数
+    """
+    global _sheets_loader
+    _sheets_writers.update(writers)
+    _sheets_loader = loader
+
+
+def _get_connection() -> sqlite3.Connection:
+    """SQLite接続を開き、同期スレッドを起動します。2回目以降は既存の接続を返します。"""
+    global _conn, _sync_thread
+    if _conn is not None:
+        return _conn
+    with _lock:
+        if _conn is None:
+            conn = sqlite3.connect(Config.GOOGLE_SHEETS_MIRROR_PATH, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA_SQL)
+            _conn = conn
+            print(f"DEBUG: Local mirror opened at '{Config.GOOGLE_SHEETS_MIRROR_PATH}'.")
+        if _sync_thread is None:
+            _sync_thread = threading.Thread(target=_sync_loop, name='sheets-mirror-sync', daemon=True)
+            _sync_thread.start()
+    return _conn
+
+
+def _row_columns(record: dict) -> tuple:
+    """インデックス列 (date, title, user_id) の値を返します。"""
+    return (
+        normalize_key_value('日付', record.get('日付', '')),
+        str(record.get('タイトル', '')),
+        str(record.get('参加者ID', '')),
+    )
+
+
+def _get_headers(conn, worksheet_name: str):
+    row = conn.execute("SELECT headers FROM sheet_headers WHERE worksheet = ?", (worksheet_name,)).fetchone()
+    return json.loads(row[0]) if row else None
+
+
+def _replace_rows(conn, worksheet_name: str, headers: list, records: list):
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("DELETE FROM sheet_rows WHERE worksheet = ?", (worksheet_name,))
+        conn.executemany(
+            "INSERT INTO sheet_rows (worksheet, position, date, title, user_id, data) VALUES (?, ?, ?, ?, ?, ?)",
+            [(worksheet_name, i) + _row_columns(record) + (json.dumps(record, ensure_ascii=False),)
+             for i, record in enumerate(records)]
+        )
+        conn.execute(
+            "INSERT OR REPLACE INTO sheet_headers (worksheet, headers, pulled_at) VALUES (?, ?, ?)",
+            (worksheet_name, json.dumps(headers, ensure_ascii=False), time.time())
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def _has_same_content(conn, worksheet_name: str, headers: list, records: list) -> bool:
+    """ミラーの内容がシートから読み込んだ内容と同じかどうか。"""
+    if _get_headers(conn, worksheet_name) != headers:
+        return False
+    rows = conn.execute(
+        "SELECT data FROM sheet_rows WHERE worksheet = ? ORDER BY position", (worksheet_name,)
+    ).fetchall()
+    return [json.loads(row[0]) for row in rows] == records
+
+
+def pull(worksheet_name: str, force: bool = False) -> bool:
+    """
+    シートの内容をミラーに取り込みます。未反映の書き込みが outbox に残っている間は、
+    ローカルの変更を上書きしないよう取り込みを見送ります（force=True の場合を除く）。
+    内容が変わっていない場合は取り込み時刻だけを更新し、版番号は進めません。
+    :return: 取り込んだ場合はTrue
+    """
+    conn = _get_connection()
+    headers, records = _sheets_loader(worksheet_name)
+    with _lock:
+        if not force and conn.execute("SELECT 1 FROM outbox LIMIT 1").fetchone():
+            return False
+        _stats['pulls'] += 1
+        if _has_same_content(conn, worksheet_name, headers, records):
+            conn.execute("UPDATE sheet_headers SET pulled_at = ? WHERE worksheet = ?", (time.time(), worksheet_name))
+            print(f"DEBUG: Local mirror pulled worksheet '{worksheet_name}' (unchanged).")
+            return True
+        _replace_rows(conn, worksheet_name, headers, records)
+    bump_data_version(worksheet_name)
+    print(f"DEBUG: Local mirror pulled worksheet '{worksheet_name}' ({len(records)} records).")
+    return True
+
+
+def get_dataframe(worksheet_name: str) -> pd.DataFrame:
+    """
+    ミラーからワークシートの全レコードをDataFrameとして返します。未取り込みの場合はここで取り込みます。
+    """
+    conn = _get_connection()
+    with _lock:
+        headers = _get_headers(conn, worksheet_name)
+    if headers is None:
+        pull(worksheet_name, force=True)
+    with _lock:
+        rows = conn.execute(
+            "SELECT data FROM sheet_rows WHERE worksheet = ? ORDER BY position", (worksheet_name,)
+        ).fetchall()
+    if not rows:
+        return pd.DataFrame()
+    return pd.DataFrame([json.loads(row[0]) for row in rows])
+
+
+def get_user_dataframe(worksheet_name: str, user_id: str) -> pd.DataFrame:
+    """
+    ミラーから参加者IDが一致するレコードだけを、シートの行順にDataFrameとして返します。
+    (worksheet, user_id) のインデックスで検索するため、全件は読み込みません。
+    """
+    conn = _get_connection()
+    with _lock:
+        headers = _get_headers(conn, worksheet_name)
+    if headers is None:
+        pull(worksheet_name, force=True)
+        with _lock:
+            headers = _get_headers(conn, worksheet_name)
+    with _lock:
+        rows = conn.execute(
+            "SELECT data FROM sheet_rows WHERE worksheet = ? AND user_id = ? ORDER BY position", (worksheet_name, str(user_id))
+        ).fetchall()
+    return pd.DataFrame([json.loads(row[0]) for row in rows], columns=headers or None)
+
+
+# --- ミラーへのローカル書き込み ---
+# 戻り値は google_sheets/utils.py の同名の公開関数と同じ形式
+
+def _find_row(conn, worksheet_name: str, date, title, user_id=None):
+    sql = "SELECT rowid, data FROM sheet_rows WHERE worksheet = ? AND date = ? AND title = ?"
+    params = [worksheet_name, normalize_key_value('日付', date), str(title)]
+    if user_id is not None:
+        sql += " AND user_id = ?"
+        params.append(str(user_id))
+    row = conn.execute(sql + " ORDER BY position LIMIT 1", params).fetchone()
+    return (row[0], json.loads(row[1])) if row else (None, None)
+
+
+def _insert_row(conn, worksheet_name: str, record: dict, position: float = None):
+    """
+    行を追加します。position を省略した場合は末尾に追加します。
+    """
+    if position is None:
+        position = conn.execute(
+            "SELECT COALESCE(MAX(position), -1) + 1 FROM sheet_rows WHERE worksheet = ?", (worksheet_name,)
+        ).fetchone()[0]
+    conn.execute(
+        "INSERT INTO sheet_rows (worksheet, position, date, title, user_id, data) VALUES (?, ?, ?, ?, ?, ?)",
+        (worksheet_name, position) + _row_columns(record) + (json.dumps(record, ensure_ascii=False),)
+    )
+
+
+def _update_row(conn, rowid: int, record: dict):
+    conn.execute(
+        "UPDATE sheet_rows SET date = ?, title = ?, user_id = ?, data = ? WHERE rowid = ?",
+        _row_columns(record) + (json.dumps(record, ensure_ascii=False), rowid)
+    )
+
+
+def _schedule_insert_position(conn, worksheet_name: str, date) -> float:
+    """
+    シートへの挿入（_add_schedule_in_sheets）と同じく、同じ日付の既存スケジュールの後ろに入る position を返します。
+    position は REAL のため、前後の行の中間の値を使い、他の行の position は変えません。
+    """
+    rows = conn.execute(
+        "SELECT position, date FROM sheet_rows WHERE worksheet = ? ORDER BY position", (worksheet_name,)
+    ).fetchall()
+    index = bisect.bisect_right(rows, schedule_date_sort_key(date), key=lambda row: schedule_date_sort_key(row[1]))
+    if not rows:
+        return 0
+    if index == 0:
+        return rows[0][0] - 1
+    if index == len(rows):
+        return rows[-1][0] + 1
+    return (rows[index - 1][0] + rows[index][0]) / 2
+
+
+def _apply_add_schedule(conn, schedule_data):
+    worksheet_name = Config.GOOGLE_SHEETS_SCHEDULE_WORKSHEET_NAME
+    headers = _get_headers(conn, worksheet_name) or list(schedule_data)
+    _insert_row(conn, worksheet_name, {header: schedule_data.get(header, '') for header in headers},
+                _schedule_insert_position(conn, worksheet_name, schedule_data.get('日付')))
+    return True, "スケジュールが正常に登録されました。"
+
+
+def _apply_update_schedule(conn, original_date_str, original_title, update_data):
+    worksheet_name = Config.GOOGLE_SHEETS_SCHEDULE_WORKSHEET_NAME
+    rowid, record = _find_row(conn, worksheet_name, original_date_str, original_title)
+    if rowid is None:
+        return False, f"日付「{original_date_str}」タイトル「{original_title}」のスケジュールは見つかりませんでした。"
+    updated_cells = [col_name for col_name in update_data if col_name in record]
+    if not updated_cells:
+        return False, "更新対象の項目が見つかりませんでした。"
+    record.update({col_name: str(update_data[col_name]) for col_name in updated_cells})
+    _update_row(conn, rowid, record)
+    return True, f"スケジュールが更新されました: {', '.join(updated_cells)}"
+
+
+def _apply_delete_schedule_by_date_title(conn, date_str, title):
+    worksheet_name = Config.GOOGLE_SHEETS_SCHEDULE_WORKSHEET_NAME
+    rowid, _ = _find_row(conn, worksheet_name, date_str, title)
+    if rowid is None:
+        return False, f"日付「{date_str}」タイトル「{title}」のスケジュールは見つかりませんでした。"
+    conn.execute("DELETE FROM sheet_rows WHERE rowid = ?", (rowid,))
+    return True, "スケジュールが正常に削除されました。"
+
+
+def _apply_update_or_add_attendee(conn, date, title, user_id, username, attendance_status, notes,
+                                  registered_at=None, updated_at=None):
+    worksheet_name = Config.GOOGLE_SHEETS_ATTENDEES_WORKSHEET_NAME
+    now = datetime.now().strftime(Config.DATETIME_FORMAT)
+    registered_at = registered_at or now
+    updated_at = updated_at or now
+    rowid, record = _find_row(conn, worksheet_name, date, title, user_id)
+    if rowid is not None:
+        record.update({'出欠': attendance_status, '備考': notes, '更新日時': updated_at})
+        _update_row(conn, rowid, record)
+        return True, "参加予定を更新しました。"
+
+    new_attendee_data = {
+        '日付': date,
+        'タイトル': title,
+        '参加者ID': user_id,
+        '参加者名': username,
+        '出欠': attendance_status,
+        '備考': notes,
+        '登録日時': registered_at,
+        '更新日時': updated_at
+    }
+    headers = _get_headers(conn, worksheet_name) or list(new_attendee_data)
+    _insert_row(conn, worksheet_name, {header: new_attendee_data.get(header, '') for header in headers})
+    return True, "参加予定を新規登録しました。"
+
+
+def _apply_delete_row_by_criteria(conn, worksheet_name, criteria):
+    headers = _get_headers(conn, worksheet_name) or []
+    if any(col not in headers for col in criteria):
+        print(f"WARNING: Criteria column not found in mirrored worksheet '{worksheet_name}': {list(criteria)}")
+        return False
+    rows = conn.execute(
+        "SELECT rowid, data FROM sheet_rows WHERE worksheet = ? ORDER BY position", (worksheet_name,)
+    ).fetchall()
+    for rowid, data in rows:
+        record = json.loads(data)
+        if all(str(record.get(col, '')) == str(val) for col, val in criteria.items()):
+            conn.execute("DELETE FROM sheet_rows WHERE rowid = ?", (rowid,))
+            return True
+    return False
+
+
+def _apply_cascade_schedule_to_attendees(conn, date_str, title, new_values=None):
+    worksheet_name = Config.GOOGLE_SHEETS_ATTENDEES_WORKSHEET_NAME
+    rows = conn.execute(
+        "SELECT rowid, data FROM sheet_rows WHERE worksheet = ? AND date = ? AND title = ?",
+        (worksheet_name, normalize_key_value('日付', date_str), str(title))
+    ).fetchall()
+    for rowid, data in rows:
+        if new_values is None:
+            conn.execute("DELETE FROM sheet_rows WHERE rowid = ?", (rowid,))
+        else:
+            record = json.loads(data)
+            record.update({col_name: str(value) for col_name, value in new_values.items()})
+            _update_row(conn, rowid, record)
+    if new_values is None:
+        return True, f"参加者シートの{len(rows)}行を削除しました。"
+    return True, f"参加者シートの{len(rows)}行を更新しました。"
+
+
+_LOCAL_APPLIERS = {
+    'add_schedule': _apply_add_schedule,
+    'update_schedule': _apply_update_schedule,
+    'delete_schedule_by_date_title': _apply_delete_schedule_by_date_title,
+    'update_or_add_attendee': _apply_update_or_add_attendee,
+    'delete_row_by_criteria': _apply_delete_row_by_criteria,
+    'cascade_schedule_to_attendees': _apply_cascade_schedule_to_attendees,
+}
+
+
+def _is_success(result) -> bool:
+    return result[0] if isinstance(result, tuple) else bool(result)
+
+
+def submit(operation: str, **kwargs):
+    """
+    書き込みをミラーに同期的に反映し、成功した場合はシートへの反映を outbox に登録します。
+    :param operation: 操作名（google_sheets/utils.py の公開関数名）
+    :return: 公開関数と同じ形式の結果。ミラーへ書き込めなかった場合は (False, "エラーメッセージ")（delete_row_by_criteria は False）
+    """
+    try:
+        conn = _get_connection()
+        with _lock:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = _LOCAL_APPLIERS[operation](conn, **kwargs)
+                if _is_success(result):
+                    conn.execute(
+                        "INSERT INTO outbox (operation, arguments, created_at) VALUES (?, ?, ?)",
+                        (operation, json.dumps(kwargs, ensure_ascii=False), time.time())
+                    )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+    except Exception as e:
+        print(f"ERROR: Failed to write '{operation}' to the local mirror: {e}")
+        if operation == 'delete_row_by_criteria':
+            return False
+        return False, f"書き込み中にエラーが発生しました: {e}"
+    bump_data_version() # 操作ごとの対象シートを判別せず、全ワークシートの版番号を進める
+    _wake_event.set()
+    return result
+
+
+# --- バックグラウンド同期 ---
+
+def _move_to_dead_letters(conn, outbox_id: int, error: str):
+    """outbox の書き込みを outbox_dead_letters へ移します。呼び出し元で _lock を保持していること。"""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute(
+            "INSERT INTO outbox_dead_letters (id, operation, arguments, created_at, attempts, error, failed_at) "
+            "SELECT id, operation, arguments, created_at, attempts, ?, ? FROM outbox WHERE id = ?",
+            (error, time.time(), outbox_id)
+        )
+        conn.execute("DELETE FROM outbox WHERE id = ?", (outbox_id,))
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def _drain_outbox(conn) -> bool:
+    """
+    outbox の書き込みを登録順にシートへ反映します。失敗した時点で中断し、順序を保ったまま次回に再試行します。
+    :return: 全て反映できた場合はTrue
+    """
+    while True:
+        with _lock:
+            row = conn.execute("SELECT id, operation, arguments, attempts FROM outbox ORDER BY id LIMIT 1").fetchone()
+        if row is None:
+            return True
+
+        outbox_id, operation, arguments, attempts = row
+        try:
+            result = _sheets_writers[operation](**json.loads(arguments))
+        except Exception as e:
+            attempts += 1
+            invalidate() # 書き込みがシートに届いたかどうか分からないため、再試行の前にシートを読み直させる
+            with _lock:
+                conn.execute("UPDATE outbox SET attempts = ? WHERE id = ?", (attempts, outbox_id))
+                _stats['failures'] += 1
+            print(f"ERROR: Failed to replicate '{operation}' to Google Sheets (attempt {attempts}): {e}")
+            # 400 などは再送しても成功しないため、後続の書き込みを待たせずにすぐ移す
+            if attempts < Config.GOOGLE_SHEETS_MIRROR_MAX_ATTEMPTS and not rate_limiter.is_permanent(e):
+                return False
+            print(f"ERROR: Giving up on '{operation}': {arguments}. Moving it to the dead letter table.")
+            with _lock:
+                _move_to_dead_letters(conn, outbox_id, str(e))
+                _stats['dead_lettered'] += 1
+            continue
+
+        if not _is_success(result):
+            # シート側で人が直接編集した等で対象が見つからない場合。再試行しても解消しないため破棄する
+            print(f"WARNING: Replication of '{operation}' was rejected by Google Sheets: {result}. Dropping it.")
+            _stats['conflicts'] += 1
+        else:
+            _stats['replayed'] += 1
+        with _lock:
+            conn.execute("DELETE FROM outbox WHERE id = ?", (outbox_id,))
+
+
+def _sync_loop():
+    conn = _conn
+    failures = 0
+    last_pull = 0.0
+    while True:
+        try:
+            if _drain_outbox(conn):
+                failures = 0
+                if time.monotonic() - last_pull >= Config.GOOGLE_SHEETS_MIRROR_PULL_INTERVAL_SECONDS:
+                    for worksheet_name in (Config.GOOGLE_SHEETS_SCHEDULE_WORKSHEET_NAME,
+                                           Config.GOOGLE_SHEETS_ATTENDEES_WORKSHEET_NAME):
+                        pull(worksheet_name)
+                    last_pull = time.monotonic()
+                timeout = Config.GOOGLE_SHEETS_MIRROR_PULL_INTERVAL_SECONDS
+            else:
+                failures += 1
+                timeout = min(2 ** failures, 60) # 失敗が続く間は指数的に間隔を空ける
+        except Exception as e:
+            print(f"ERROR: Local mirror sync failed: {e}")
+            failures += 1
+            timeout = min(2 ** failures, 60)
+        _wake_event.wait(timeout)
+        _wake_event.clear()
+
+
+def get_mirror_stats() -> dict:
+    """
+    未反映の書き込み件数、反映を諦めた書き込みの件数と同期の統計を返します。（監視・デバッグ用）
+    """
+    if not is_enabled() or _conn is None:
+        return dict(_stats, pending=0, dead_letters=0)
+    with _lock:
+        pending = _conn.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+        dead_letters = _conn.execute("SELECT COUNT(*) FROM outbox_dead_letters").fetchone()[0]
+    return dict(_stats, pending=pending, dead_letters=dead_letters)
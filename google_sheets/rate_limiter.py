@@ -0,0 +1,160 @@
+import random
+import threading
+import time
+
+import gspread
+import requests
+
+from config import Config
+from utils.event_context import current_deadline
+
+# Google Sheets API 呼び出しの共通ゲート
+# 読み取り・書き込みそれぞれの1分あたりのクォータに合わせたトークンバケットで呼び出しを平準化し、
+# 429 / 5xx は指数バックオフ（ジッター付き）で再試行する。呼び出しごとに期限を持ち、期限を過ぎたら諦める。
+# 行の挿入・削除・追加のように、同じリクエストを2回送ると結果が変わる書き込み（idempotent=False）は、
+# シートに届いていないことが確実な失敗（429・接続の確立前のタイムアウト）の場合のみ再試行する。
+
+_RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+class DeadlineExceededError(Exception):
+    """Sheets API 呼び出しが期限内に完了しなかったことを表す例外。"""
+
+
+class TokenBucket:
+    """1分あたり per_minute 回の呼び出しを許可するトークンバケット。"""
+
+    def __init__(self, per_minute: int):
+        self.capacity = max(per_minute, 1)
+        self.rate = self.capacity / 60.0 # 1秒あたりの補充量
+        self.tokens = float(self.capacity)
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, deadline: float) -> float:
+        """
+        トークンを1つ取得します。取得できるまで待ち、期限を過ぎる場合は DeadlineExceededError。
+        :return: 待った秒数
+        """
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                wait = (1 - self.tokens) / self.rate
+            if now + wait > deadline:
+                raise DeadlineExceededError("Timed out waiting for Google Sheets API quota.")
+            time.sleep(wait)
+            waited += wait
+
+
+_buckets = {
+    'read': TokenBucket(Config.GOOGLE_SHEETS_READ_QUOTA_PER_MINUTE),
+    'write': TokenBucket(Config.GOOGLE_SHEETS_WRITE_QUOTA_PER_MINUTE),
+}
+_stats_lock = threading.Lock()
+_stats = {} # {kind: {'calls': n, 'retries': n, 'failures': n, 'deadline_exceeded': n, 'throttled_seconds': s}}
+
+
+def _record(kind: str, **increments):
+    with _stats_lock:
+        kind_stats = _stats.setdefault(kind, {'calls': 0, 'retries': 0, 'failures': 0, 'deadline_exceeded': 0, 'throttled_seconds': 0.0})
+        for name, value in increments.items():
+            kind_stats[name] += value
+
+
+def _status_code(error: Exception):
+    if isinstance(error, gspread.exceptions.APIError):
+        response = getattr(error, 'response', None)
+        return getattr(response, 'status_code', None)
+    return None
+
+
+def _is_retryable(error: Exception) -> bool:
+    if isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+        return True
+    return _status_code(error) in _RETRYABLE_STATUS_CODES
+
+
+def _was_not_applied(error: Exception) -> bool:
+    """
+    リクエストがシートに反映されていないことが確実な失敗かを返します。
+    5xx や読み取りのタイムアウト・接続断は、シート側で反映済みの可能性があるため含めない。
+    """
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    return _status_code(error) == 429
+
+
+def is_transient(error: Exception) -> bool:
+    """
+    時間をおいて再送すれば成功する見込みのある失敗（クォータ超過・5xx・通信エラー・期限切れ）かを返します。
+    400 などそれ以外の 4xx は、同じリクエストを再送しても成功しないため False。
+    """
+    return isinstance(error, DeadlineExceededError) or _is_retryable(error)
+
+
+def is_permanent(error: Exception) -> bool:
+    """
+    同じリクエストを何度再送しても成功しない失敗（429 以外の 4xx）かを返します。
+    """
+    status_code = _status_code(error)
+    return status_code is not None and 400 <= status_code < 500 and status_code != 429
+
+
+def call(kind: str, func, *args, deadline: float = None, idempotent: bool = True, **kwargs):
+    """
+    Sheets API 呼び出しをクォータ制御・再試行付きで実行します。
+    :param kind: 'read' / 'write' のいずれか。それ以外（'drive' など）はクォータ制御せず再試行のみ行う
+    :param func: 実行する gspread のメソッド
+    :param deadline: time.monotonic() 基準の期限。省略時は Config.GOOGLE_SHEETS_CALL_DEADLINE_SECONDS 後
+                     （Webhookイベントの処理中は、そのイベント全体の期限を超えない）
+    :param idempotent: False の場合、シートに反映済みの可能性がある失敗では再試行せずに例外を送出する
+                       （行の挿入・削除・追加など、2回反映されると別の行を消したり重複させたりする書き込み）
+    :return: func の戻り値
+    """
+    if deadline is None:
+        deadline = time.monotonic() + Config.GOOGLE_SHEETS_CALL_DEADLINE_SECONDS
+        event_deadline = current_deadline()
+        if event_deadline is not None:
+            deadline = min(deadline, event_deadline)
+    bucket = _buckets.get(kind)
+
+    attempt = 0
+    while True:
+        try:
+            if bucket is not None:
+                waited = bucket.acquire(deadline)
+                if waited:
+                    _record(kind, throttled_seconds=waited)
+            _record(kind, calls=1)
+            return func(*args, **kwargs)
+        except DeadlineExceededError:
+            _record(kind, deadline_exceeded=1)
+            raise
+        except Exception as e:
+            if not _is_retryable(e) or (not idempotent and not _was_not_applied(e)):
+                _record(kind, failures=1)
+                raise
+            # 指数バックオフ（上限あり）に 0.5〜1.5 倍のジッターをかける
+            backoff = min(Config.GOOGLE_SHEETS_RETRY_BASE_SECONDS * (2 ** attempt), Config.GOOGLE_SHEETS_RETRY_MAX_SECONDS)
+            backoff *= random.uniform(0.5, 1.5)
+            if time.monotonic() + backoff > deadline:
+                _record(kind, failures=1, deadline_exceeded=1)
+                raise
+            print(f"WARNING: Google Sheets {kind} call failed ({e}). Retrying in {backoff:.1f}s (attempt {attempt + 1}).")
+            _record(kind, retries=1)
+            time.sleep(backoff)
+            attempt += 1
+
+
+def get_rate_limiter_stats() -> dict:
+    """
+    種類ごとの呼び出し数・再試行数・失敗数・期限切れ数・クォータ待ち秒数を返します。（監視・デバッグ用）
+    """
+    with _stats_lock:
+        return {kind: dict(kind_stats) for kind, kind_stats in _stats.items()}
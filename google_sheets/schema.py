@@ -0,0 +1,130 @@
+import threading
+
+import gspread
+
+from config import Config
+from google_sheets import rate_limiter
+from google_sheets.api_client import get_worksheet
+
+# ワークシートごとのヘッダー行と列位置のレジストリ
+# ヘッダーは初回に一度だけ読み込み、キャッシュの再読み込み時にヘッダーの変更が検出された場合のみ差し替える
+
+# 各ワークシートに必須の列
+REQUIRED_COLUMNS = {
+    Config.GOOGLE_SHEETS_SCHEDULE_WORKSHEET_NAME: ('日付', '開始時刻', 'タイトル', '開催場所', '詳細', '申込締切日', '規模'),
+    Config.GOOGLE_SHEETS_ATTENDEES_WORKSHEET_NAME: ('日付', 'タイトル', '参加者ID', '参加者名', '出欠', '備考', '登録日時', '更新日時'),
+}
+
+# ワークシートごとの主キー列
+KEY_COLUMNS = {
+    Config.GOOGLE_SHEETS_SCHEDULE_WORKSHEET_NAME: ('日付', 'タイトル'),
+    Config.GOOGLE_SHEETS_ATTENDEES_WORKSHEET_NAME: ('日付', 'タイトル', '参加者ID'),
+}
+
+# ワークシートごとの副インデックス列（値 → 行番号 の索引をキャッシュに持つ列）
+INDEX_COLUMNS = {
+    Config.GOOGLE_SHEETS_ATTENDEES_WORKSHEET_NAME: ('参加者ID',),
+}
+
+
+class WorksheetSchema:
+    """1ワークシート分のヘッダー行と、列名 → 列番号・列記号 の対応表。"""
+
+    def __init__(self, worksheet_name: str, headers: list):
+        self.worksheet_name = worksheet_name
+        self.headers = list(headers)
+        self.key_columns = KEY_COLUMNS.get(worksheet_name, ())
+        self.index_columns = INDEX_COLUMNS.get(worksheet_name, ())
+        # 同名の列が複数ある場合は、gspread と同様に左端の列を使う
+        self._indices = {}
+        for i, header in enumerate(self.headers):
+            self._indices.setdefault(header, i + 1) # gspreadは1-based index
+        self._letters = {header: gspread.utils.rowcol_to_a1(1, index)[:-1] for header, index in self._indices.items()}
+        self.last_column_letter = gspread.utils.rowcol_to_a1(1, max(len(self.headers), 1))[:-1]
+
+    def has_column(self, column: str) -> bool:
+        return column in self._indices
+
+    def column_index(self, column: str) -> int:
+        """列名の列番号（1-based）を返します。存在しない列の場合は KeyError。"""
+        return self._indices[column]
+
+    def column_letter(self, column: str) -> str:
+        """列名の列記号（例: 'C'）を返します。存在しない列の場合は KeyError。"""
+        return self._letters[column]
+
+    def cell_a1(self, row_index: int, column: str) -> str:
+        """指定行・列名のセルのA1表記（例: 'C5'）を返します。"""
+        return f"{self._letters[column]}{row_index}"
+
+    def row_a1(self, row_index: int) -> str:
+        """指定行全体のA1範囲（例: 'A5:H5'）を返します。"""
+        return f"A{row_index}:{self.last_column_letter}{row_index}"
+
+    def missing_columns(self) -> list:
+        return [column for column in REQUIRED_COLUMNS.get(self.worksheet_name, ()) if column not in self._indices]
+
+
+_lock = threading.Lock()
+_schemas = {} # {worksheet_name: WorksheetSchema}
+
+
+def get_schema(worksheet_name: str) -> WorksheetSchema:
+    """
+    ワークシートのスキーマを返します。未登録の場合のみヘッダー行を1回取得します。
+    """
+    schema = _schemas.get(worksheet_name)
+    if schema is None:
+        headers = rate_limiter.call('read', get_worksheet(worksheet_name).row_values, 1)
+        schema = observe_headers(worksheet_name, headers)
+    return schema
+
+
+def observe_headers(worksheet_name: str, headers: list) -> WorksheetSchema:
+    """
+    取得済みのヘッダー行をレジストリに反映します。登録済みのヘッダーと同じであれば何もしません。
+    ヘッダーが変わっていた場合はスキーマを差し替え、必須列の不足を警告します。
+    """
+    with _lock:
+        schema = _schemas.get(worksheet_name)
+        if schema is not None and schema.headers == list(headers):
+            return schema
+
+        if schema is not None:
+            print(f"WARNING: Header change detected in worksheet '{worksheet_name}': {schema.headers} -> {list(headers)}")
+        schema = WorksheetSchema(worksheet_name, headers)
+        missing = schema.missing_columns()
+        if missing:
+            print(f"ERROR: Worksheet '{worksheet_name}' is missing required columns: {missing}")
+        _schemas[worksheet_name] = schema
+        return schema
+
+
+def invalidate_schema(worksheet_name: str = None):
+    """
+    スキーマを破棄し、次回アクセス時にヘッダー行を再取得させます。名前を省略した場合は全て破棄します。
+    """
+    with _lock:
+        if worksheet_name is None:
+            _schemas.clear()
+        else:
+            _schemas.pop(worksheet_name, None)
+
+
+def validate_schemas() -> bool:
+    """
+    スケジュール・参加者ワークシートのヘッダーを読み込み、必須列が揃っているか検証します。
+    起動時に呼び出されます。
+    :return: 全ての必須列が揃っていればTrue
+    """
+    valid = True
+    for worksheet_name in REQUIRED_COLUMNS:
+        try:
+            missing = get_schema(worksheet_name).missing_columns()
+        except Exception as e:
+            print(f"ERROR: Failed to load headers of worksheet '{worksheet_name}': {e}")
+            valid = False
+            continue
+        if missing:
+            valid = False
+    return valid
@@ -1,183 +1,667 @@
+import bisect
+import copy
+import functools
+import re
+import threading
 import gspread
 import pandas as pd
-import json
-import os
 from datetime import datetime
+from gspread.utils import numericise
 
 from config import Config
+from google_sheets import cache, journal, mirror, rate_limiter, schema, write_behind
+from google_sheets.api_client import get_google_sheets_client_and_spreadsheet, get_worksheet
+
+# 書き込み系は、シートへ直接書き込む _xxx_in_sheets（API呼び出しの失敗は例外のまま送出）と、
+# 例外を捕捉してユーザー向けのメッセージを返す公開関数の2層になっている。
+# ローカルミラーが有効な場合、公開関数はミラーに書き込み、シートへの反映はバックグラウンド同期が
+# _xxx_in_sheets を再実行して行う。
+# ジャーナルが有効な場合（既定）、公開関数は書き込みをジャーナルに記録してから _xxx_in_sheets を呼び出し、
+# シートへ書き込めなかった書き込みはジャーナルの再送スレッドが後から反映する。
+
+# 行番号を指定する書き込み（更新・削除）は、書き込む直前にその行の識別列（主キー列など）がシート上で
+# キャッシュの内容と一致することを確認する。他のプロセスや手動編集で行がずれていた場合は読み込み直して特定し直す。
+# 同じワークシートへの「行の特定 → 確認 → 書き込み → キャッシュへの反映」はプロセス内でワークシートごとのロックで直列化する。
+_write_locks_guard = threading.Lock()
+_write_locks = {} # {worksheet_name: threading.RLock}
+
+# シートへの反映を再送に任せた場合に、応答メッセージに添える文
+_DEFERRED_NOTE = "\n（Google Sheetsに接続できないため、反映は後ほど自動で行います）"
 
-def _get_sheets_client():
-    """Google Sheets APIクライアントを認証して取得します。"""
-    try:
-        # 環境変数からJSON文字列として認証情報を取得
-        credentials_json = Config.GOOGLE_SHEETS_CREDENTIALS
-        if not credentials_json:
-            raise ValueError("Google Sheets credentials (GOOGLE_SHEETS_CREDENTIALS) not set in environment variables.")
-
-        # JSON文字列をPython辞書に変換
-        credentials_info = json.loads(credentials_json)
-
-        gc = gspread.service_account_from_dict(credentials_info)
-        spreadsheet = gc.open(Config.GOOGLE_SHEETS_SPREADSHEET_NAME)
-        print("DEBUG: Google Sheets service account authenticated successfully.")
-        print(f"DEBUG: Spreadsheet '{Config.GOOGLE_SHEETS_SPREADSHEET_NAME}' opened successfully.")
-        return gc, spreadsheet
-    except Exception as e:
-        print(f"ERROR: Failed to authenticate or open spreadsheet: {e}")
-        raise
 
 def get_all_records(worksheet_name: str) -> pd.DataFrame:
     """
     指定されたワークシートの全てのレコードをDataFrameとして取得します。
+    結果は Config.GOOGLE_SHEETS_CACHE_TTL_SECONDS の間キャッシュされ、書き込み時に無効化されます。
     :param worksheet_name: 取得するワークシートの名前
+    ローカルミラーが有効な場合はミラーから返します。
     :return: レコードを含むPandas DataFrame。エラー時は空のDataFrameを返します。
+        処理中のイベントの期限を過ぎた場合は rate_limiter.DeadlineExceededError を送出します（他の読み取り関数も同様）。
     """
     try:
-        gc, spreadsheet = _get_sheets_client()
-        worksheet = spreadsheet.worksheet(worksheet_name)
-        records = worksheet.get_all_records()
-        if not records:
-            return pd.DataFrame() # レコードがない場合は空のDataFrameを返す
-        df = pd.DataFrame(records)
-        return df
+        if mirror.is_enabled():
+            return mirror.get_dataframe(worksheet_name)
+        worksheet = get_worksheet(worksheet_name)
+        # レコードがない場合は空のDataFrameが返る
+        return _with_pending_writes(worksheet_name, cache.get_dataframe(worksheet_name, _values_loader(worksheet)))
     except gspread.exceptions.WorksheetNotFound:
         print(f"ERROR: Worksheet '{worksheet_name}' not found.")
         return pd.DataFrame()
+    except rate_limiter.DeadlineExceededError:
+        raise # イベントの期限切れは呼び出し元（message_processors）で時間切れとして応答する
     except Exception as e:
         print(f"ERROR: Failed to get records from '{worksheet_name}': {e}")
         return pd.DataFrame()
 
-def add_schedule(schedule_data: dict) -> tuple[bool, str]:
+
+def get_all_records_batch(worksheet_names: list) -> dict:
     """
-    新しいスケジュールをスプレッドシートに追加します。
-    :param schedule_data: スケジュールデータを含む辞書。キーは列名と一致する必要があります。
-    :return: 成功した場合は (True, "成功メッセージ")、失敗した場合は (False, "エラーメッセージ")
+    複数のワークシートの全てのレコードを、それぞれDataFrameとしてまとめて取得します。
+    キャッシュに無いワークシートは values_batch_get の1回のリクエストでまとめて読み込むため、
+    スケジュールと参加者の両方を使うコマンドでもシートへの往復は1回で済みます。
+    :param worksheet_names: 取得するワークシートの名前のリスト
+    :return: {ワークシート名: DataFrame}。エラー時は全て空のDataFrameを返します。
     """
     try:
-        gc, spreadsheet = _get_sheets_client()
-        worksheet = spreadsheet.worksheet(Config.GOOGLE_SHEETS_SCHEDULE_WORKSHEET_NAME)
+        if mirror.is_enabled():
+            return {name: mirror.get_dataframe(name) for name in worksheet_names}
+        dataframes = cache.get_dataframes(worksheet_names, _batch_values_loader)
+        return {name: _with_pending_writes(name, df) for name, df in dataframes.items()}
+    except rate_limiter.DeadlineExceededError:
+        raise
+    except Exception as e:
+        print(f"ERROR: Failed to get records from {worksheet_names}: {e}")
+        return {name: pd.DataFrame() for name in worksheet_names}
+
+
+def _with_pending_writes(worksheet_name: str, df: pd.DataFrame) -> pd.DataFrame:
+    """
+    参加者シートの場合、まだシートへ反映していない参加予定の書き込み（write_behind）を重ねて返します。
+    """
+    if worksheet_name == Config.GOOGLE_SHEETS_ATTENDEES_WORKSHEET_NAME and write_behind.is_enabled():
+        return write_behind.overlay_attendees(df)
+    return df
+
+
+def _batch_values_loader(worksheet_names: list) -> dict:
+    """
+    複数のワークシートの全セル値を values_batch_get の1回のリクエストで取得します。（クォータ制御・再試行付き）
+    :return: {ワークシート名: ヘッダー行を含む全セル値（二次元配列）}
+    """
+    _, spreadsheet = get_google_sheets_client_and_spreadsheet()
+    ranges = [gspread.utils.absolute_range_name(name) for name in worksheet_names]
+    response = rate_limiter.call('read', spreadsheet.values_batch_get, ranges)
+    value_ranges = response.get('valueRanges', [])
+    # valueRanges はリクエストした範囲と同じ順で返る。get_all_values() と同じく、行の長さを揃えて返す
+    return {
+        name: gspread.utils.fill_gaps(value_range.get('values', [[]]))
+        for name, value_range in zip(worksheet_names, value_ranges)
+    }
+
+
+def _values_loader(worksheet: gspread.Worksheet):
+    """
+    キャッシュの読み込みに使う、クォータ制御・再試行付きの全セル取得関数を返します。
+    """
+    return functools.partial(rate_limiter.call, 'read', worksheet.get_all_values)
+
+
+def _get_cache_entry(worksheet_name: str):
+    """
+    ワークシートとそのキャッシュエントリ（ヘッダー・レコード・主キーインデックス）を返します。
+    """
+    worksheet = get_worksheet(worksheet_name)
+    return worksheet, cache.get_entry(worksheet_name, _values_loader(worksheet))
+
 
-        # スプレッドシートのヘッダーを取得
-        headers = worksheet.row_values(1)
+def _write_lock(worksheet_name: str) -> threading.RLock:
+    """
+    ワークシートへの書き込みをプロセス内で直列化するロックを返します。
+    """
+    with _write_locks_guard:
+        lock = _write_locks.get(worksheet_name)
+        if lock is None:
+            lock = _write_locks[worksheet_name] = threading.RLock()
+        return lock
+
+
+def _mismatched_rows(worksheet: gspread.Worksheet, worksheet_schema: schema.WorksheetSchema, expected: dict) -> list:
+    """
+    指定した行のセルが、期待する値と一致するかをシートから1回の batch_get で読み込んで確認します。
+    :param expected: {シートの行番号: {列名: 期待する値, ...}, ...}
+    :return: 一致しなかった行番号のリスト
+    """
+    ranges = [worksheet_schema.row_a1(row_index) for row_index in expected]
+    value_ranges = rate_limiter.call('read', worksheet.batch_get, ranges)
+    mismatched = []
+    for (row_index, expected_values), value_range in zip(expected.items(), value_ranges):
+        row = value_range[0] if value_range else []
+        for col_name, expected_value in expected_values.items():
+            position = worksheet_schema.column_index(col_name) - 1
+            actual_value = row[position] if position < len(row) else ''
+            # キャッシュと同じく数値に変換してから、主キーと同じ正規化で比較する
+            actual_value = numericise(actual_value, empty2zero=False, default_blank='')
+            if cache.normalize_key_value(col_name, actual_value) != cache.normalize_key_value(col_name, expected_value):
+                mismatched.append(row_index)
+                break
+    return mismatched
+
+
+class _RowsShiftedError(Exception):
+    """書き込み直前の確認で、対象の行がシート上でキャッシュと一致しなかったことを表す例外。"""
+
+
+def _write_verified_rows(worksheet_name: str, locate, write, columns=None, idempotent: bool = True):
+    """
+    locate(entry) でキャッシュから対象の行番号を求め、write(worksheet, entry, 行番号のリスト) で書き込みます。
+    書き込みの各試行（rate_limiter による再試行を含む）の直前に、それらの行の識別列が今もシート上で一致することを確認し、
+    一致しない行があれば（行がずれていれば）キャッシュを破棄して読み込み直し、
+    Config.GOOGLE_SHEETS_ROW_VERIFY_ATTEMPTS 回まで特定し直します。
+    呼び出し元は _write_lock(worksheet_name) を保持していること。
+    :param locate: キャッシュエントリを受け取り、対象の行番号のリストを返す関数
+    :param write: シートへ書き込む関数。クォータ制御・再試行はここで行うため、rate_limiter を通さずにAPIを呼び出すこと
+    :param columns: 確認に使う列名のリスト。省略時はワークシートの主キー列
+    :param idempotent: rate_limiter.call に渡す。行の削除など、2回反映されると結果が変わる書き込みでは False
+    :return: (entry, 行番号のリスト, write の戻り値)。対象の行がない場合は write を呼ばずに (entry, [], None)
+    """
+    for attempt in range(1, Config.GOOGLE_SHEETS_ROW_VERIFY_ATTEMPTS + 1):
+        worksheet, entry = _get_cache_entry(worksheet_name)
+        row_indices = locate(entry)
+        if not row_indices:
+            return entry, row_indices, None
+
+        check_columns = [col for col in (columns or entry.key_columns) if entry.schema.has_column(col)]
+        expected = {
+            row_index: {col: entry.records[row_index - 2].get(col, '') for col in check_columns}
+            for row_index in row_indices
+        }
+
+        def verified_write():
+            if Config.GOOGLE_SHEETS_VERIFY_ROWS:
+                mismatched = _mismatched_rows(worksheet, entry.schema, expected)
+                if mismatched:
+                    raise _RowsShiftedError(mismatched)
+            return write(worksheet, entry, row_indices)
+
+        try:
+            return entry, row_indices, rate_limiter.call('write', verified_write, idempotent=idempotent)
+        except _RowsShiftedError as e:
+            print(f"WARNING: Rows {e.args[0]} in worksheet '{worksheet_name}' no longer match the cache "
+                  f"(attempt {attempt}). Reloading and locating them again.")
+            cache.invalidate(worksheet_name)
+    raise RuntimeError(f"Could not locate stable rows in worksheet '{worksheet_name}' "
+                       f"after {Config.GOOGLE_SHEETS_ROW_VERIFY_ATTEMPTS} attempts.")
+
+
+def _appended_row_index(response: dict):
+    """
+    append_row / append_rows のレスポンス (updates.updatedRange 例: "'参加者'!A12:H12") から追加された（先頭の）行番号を返します。
+    """
+    updated_range = (response or {}).get('updates', {}).get('updatedRange', '')
+    match = re.search(r'![A-Z]+(\d+)', updated_range)
+    return int(match.group(1)) if match else None
+
+
+def _write_through_journal(operation: str, arguments: dict, worksheet_name: str, deferred_result):
+    """
+    書き込みをジャーナルに記録してから、シートへ直接書き込みます。
+    シートへ書き込めなかった場合と、先に再送待ちの書き込みがある場合（順序を保つため）は、再送に任せて deferred_result を返します。
+    再送しても成功しない失敗（400 など）はジャーナルから取り除き、例外をそのまま送出します。
+    :return: (書き込みの結果, 再送に任せたか)。ジャーナルに記録できなかった場合は None（呼び出し元は従来どおり直接書き込む）
+    """
+    try:
+        entry_id, backlog = journal.append(operation, arguments)
+    except Exception as e:
+        print(f"ERROR: Failed to append '{operation}' to the journal: {e}")
+        return None
+    if backlog:
+        print(f"DEBUG: '{operation}' queued behind earlier journaled writes.")
+        return deferred_result, True
+    try:
+        result = _SHEETS_WRITERS[operation](**arguments)
+    except Exception as e:
+        cache.invalidate(worksheet_name)
+        if not rate_limiter.is_transient(e):
+            journal.discard(entry_id)
+            raise
+        print(f"ERROR: Failed to write '{operation}' to Google Sheets. It will be retried from the journal: {e}")
+        journal.defer(entry_id)
+        return deferred_result, True
+    journal.complete(entry_id)
+    return result, False
+
+
+def _add_schedule_in_sheets(schedule_data: dict) -> tuple[bool, str]:
+    """
+    日付順の位置にスケジュール行を1行挿入します。API呼び出しの失敗は例外として送出します。
+    """
+    with _write_lock(Config.GOOGLE_SHEETS_SCHEDULE_WORKSHEET_NAME):
+        worksheet, entry = _get_cache_entry(Config.GOOGLE_SHEETS_SCHEDULE_WORKSHEET_NAME)
 
-        # schedule_dataをヘッダーの順序に並べ替えてリストにする
+        # スキーマのヘッダー順に schedule_data を並べ替えてリストにする
+        headers = entry.schema.headers
         row_to_insert = [schedule_data.get(header, '') for header in headers]
 
-        worksheet.append_row(row_to_insert)
+        # 同じ日付の既存スケジュールの後ろに入るよう bisect_right で挿入位置を求める
+        # （挿入は他の行を上書きしないため、行がずれていても並び順が前後するだけで済む）
+        position = bisect.bisect_right(
+            entry.records,
+            cache.schedule_date_sort_key(schedule_data.get('日付')),
+            key=lambda record: cache.schedule_date_sort_key(record.get('日付'))
+        )
+        row_index_to_insert = position + 2 # +2 はヘッダー行と0-based indexのため
 
-        # 日付カラムでソート（日付がYYYY/MM/DD形式であると仮定）
-        # まず全てのレコードを取得
-        all_records_df = get_all_records(Config.GOOGLE_SHEETS_SCHEDULE_WORKSHEET_NAME)
-        if not all_records_df.empty:
-            # 日付をdatetime型に変換し、変換できないものはNaT (Not a Time) とする
-            all_records_df['日付'] = pd.to_datetime(all_records_df['日付'], errors='coerce')
-            # 日付でソートし、日付がNaTのものを最後に持ってくる
-            sorted_df = all_records_df.sort_values(by='日付', ascending=True, na_position='last')
+        rate_limiter.call('write', worksheet.insert_row, row_to_insert, index=row_index_to_insert, idempotent=False)
+        cache.patch_insert(Config.GOOGLE_SHEETS_SCHEDULE_WORKSHEET_NAME, row_index_to_insert, dict(zip(headers, row_to_insert)))
+    print(f"DEBUG: Inserted schedule at row {row_index_to_insert}.")
 
-            # ソートされたDataFrameをスプレッドシートに書き戻す
-            # ヘッダー行を再度含めて書き込む必要がある
-            worksheet.clear()
-            worksheet.update([sorted_df.columns.values.tolist()] + sorted_df.fillna('').values.tolist())
+    return True, "スケジュールが正常に登録されました。"
 
 
-        return True, "スケジュールが正常に登録されました。"
+def add_schedule(schedule_data: dict) -> tuple[bool, str]:
+    """
+    新しいスケジュールをスプレッドシートに追加します。
+    シートは日付順に並んでいる前提で、二分探索で求めた位置に1行だけ挿入します。
+    :param schedule_data: スケジュールデータを含む辞書。キーは列名と一致する必要があります。
+    :return: 成功した場合は (True, "成功メッセージ")、失敗した場合は (False, "エラーメッセージ")
+    """
+    if mirror.is_enabled():
+        return mirror.submit('add_schedule', schedule_data=dict(schedule_data)) # セッションレコードもJSONにできるよう辞書に変換
+    try:
+        if journal.is_enabled():
+            journaled = _write_through_journal('add_schedule', {'schedule_data': dict(schedule_data)},
+                                               Config.GOOGLE_SHEETS_SCHEDULE_WORKSHEET_NAME,
+                                               (True, "スケジュールの登録を受け付けました。" + _DEFERRED_NOTE))
+            if journaled is not None:
+                return journaled[0]
+        return _add_schedule_in_sheets(schedule_data)
     except Exception as e:
         print(f"ERROR: Failed to add schedule: {e}")
+        cache.invalidate(Config.GOOGLE_SHEETS_SCHEDULE_WORKSHEET_NAME)
         return False, f"スケジュールの登録中にエラーが発生しました: {e}"
 
 
+def batch_update_rows(worksheet_name: str, row_updates: dict) -> list[str]:
+    """
+    複数行・複数列のセルを1回の batch_update リクエストでまとめて更新します。
+    列位置はスキーマレジストリから求めるため、ヘッダー行の取得は行いません。
+    :param worksheet_name: 更新対象のワークシート名
+    :param row_updates: {シートの行番号(1-based): {列名: 新しい値, ...}, ...}
+    :return: 更新した列名のリスト（重複なし、指定順）
+    """
+    data, updated_columns = _row_update_payload(schema.get_schema(worksheet_name), row_updates)
+    if data:
+        rate_limiter.call('write', _send_row_updates, get_worksheet(worksheet_name), data)
+    return updated_columns
+
+
+def _row_update_payload(worksheet_schema: schema.WorksheetSchema, row_updates: dict) -> tuple[list, list]:
+    """
+    batch_update_rows のリクエスト本体を組み立てます。
+    :return: (batch_update に渡す data, 更新する列名のリスト（重複なし、指定順）)
+    """
+    data = []
+    updated_columns = []
+    for row_index, update_data in row_updates.items():
+        for col_name, new_value in update_data.items():
+            if not worksheet_schema.has_column(col_name):
+                print(f"WARNING: Column '{col_name}' not found in worksheet '{worksheet_schema.worksheet_name}'. Skipping update for this column.")
+                continue
+            data.append({
+                'range': worksheet_schema.cell_a1(row_index, col_name),
+                'values': [[str(new_value)]]
+            })
+            if col_name not in updated_columns:
+                updated_columns.append(col_name)
+    return data, updated_columns
+
+
+def _send_row_updates(worksheet: gspread.Worksheet, data: list):
+    """
+    batch_update_rows で組み立てた更新内容を送信します。
+    gspread の batch_update は渡した data の range をシート名付きに書き換えるため、再試行のたびに複製を渡す。
+    """
+    # update_cell と同じく、入力値はユーザー入力としてシートに解釈させる
+    return worksheet.batch_update(copy.deepcopy(data), value_input_option='USER_ENTERED')
+
+
+def _update_schedule_in_sheets(original_date_str: str, original_title: str, update_data: dict) -> tuple[bool, str]:
+    """
+    主キーインデックスで行を特定し、シート上の行と一致することを確認してから update_data の列を一括更新します。
+    """
+    with _write_lock(Config.GOOGLE_SHEETS_SCHEDULE_WORKSHEET_NAME):
+        # 主キー（日付・タイトル）インデックスから行番号を取得
+        key_values = {'日付': original_date_str, 'タイトル': original_title}
+
+        def write(worksheet, entry, row_indices):
+            # update_data の全項目を1回のリクエストで更新
+            data, updated_columns = _row_update_payload(entry.schema, {row_indices[0]: update_data})
+            if data:
+                _send_row_updates(worksheet, data)
+            return updated_columns
+
+        entry, row_indices, updated_cells = _write_verified_rows(
+            Config.GOOGLE_SHEETS_SCHEDULE_WORKSHEET_NAME,
+            lambda entry: [row_index for row_index in [entry.find_row(key_values)] if row_index is not None],
+            write
+        )
+
+        if not entry.records:
+            return False, "スケジュールデータが見つかりません。"
+        if not row_indices:
+            return False, f"日付「{original_date_str}」タイトル「{original_title}」のスケジュールは見つかりませんでした。"
+        row_index_to_update = row_indices[0]
+        cache.patch_update(Config.GOOGLE_SHEETS_SCHEDULE_WORKSHEET_NAME, row_index_to_update,
+                           {col_name: str(update_data[col_name]) for col_name in updated_cells})
+
+    if updated_cells:
+        return True, f"スケジュールが更新されました: {', '.join(updated_cells)}"
+    else:
+        return False, "更新対象の項目が見つかりませんでした。"
+
+
 def update_schedule(original_date_str: str, original_title: str, update_data: dict) -> tuple[bool, str]:
     """
     指定された日付とタイトルのスケジュールを検索し、update_dataに基づいて更新します。
     日付とタイトルは既存レコードの特定に使用されます。
+    日付・タイトルが変わった場合は、参加者シートの該当する行の日付・タイトルもまとめて書き換えます。
     :param original_date_str: 検索するスケジュールの元のYYYY/MM/DD形式の日付文字列
     :param original_title: 検索するスケジュールの元のタイトル
     :param update_data: 更新するカラムとその新しい値を含む辞書 (例: {'開催場所': '新しい場所'})
     :return: 成功した場合は (True, "更新成功メッセージ")、失敗した場合は (False, "エラーメッセージ")
     """
-    try:
-        gc, spreadsheet = _get_sheets_client()
-        worksheet = spreadsheet.worksheet(Config.GOOGLE_SHEETS_SCHEDULE_WORKSHEET_NAME)
-        records = worksheet.get_all_records()
+    result, deferred = _submit_update_schedule(original_date_str, original_title, update_data)
+    new_values = _changed_key_values(original_date_str, original_title, update_data)
+    # 再送に任せた場合は、スケジュールの更新がシートに反映されてから再送スレッドが参加者シートに反映する
+    if result[0] and new_values and not deferred:
+        result = _with_attendee_cascade(result, original_date_str, original_title, new_values)
+    return result
 
-        if not records:
-            return False, "スケジュールデータが見つかりません。"
 
-        df = pd.DataFrame(records)
+def _changed_key_values(original_date_str: str, original_title: str, update_data: dict) -> dict:
+    """
+    update_data のうち、実際に値が変わる日付・タイトルだけを返します。（参加者シートへの反映に使う）
+    """
+    original_values = {'日付': original_date_str, 'タイトル': original_title}
+    return {
+        col_name: update_data[col_name] for col_name in original_values
+        if col_name in update_data
+        and cache.normalize_key_value(col_name, update_data[col_name]) != cache.normalize_key_value(col_name, original_values[col_name])
+    }
 
-        # 厳密に比較するために、元の文字列形式の日付とタイトルでフィルタリング
-        # .copy() を使用して SettingWithCopyWarning を回避
-        matching_rows = df[(df['日付'] == original_date_str) & (df['タイトル'] == original_title)].copy()
 
-        if matching_rows.empty:
-            return False, f"日付「{original_date_str}」タイトル「{original_title}」のスケジュールは見つかりませんでした。"
+def _submit_update_schedule(original_date_str: str, original_title: str, update_data: dict) -> tuple[tuple, bool]:
+    """
+    スケジュールの更新を、設定に応じてミラー・ジャーナル経由、またはシートへ直接書き込みます。
+    :return: (書き込みの結果, ジャーナルの再送に任せたか)
+    """
+    if mirror.is_enabled():
+        return mirror.submit('update_schedule', original_date_str=original_date_str, original_title=original_title, update_data=update_data), False
+    try:
+        if journal.is_enabled():
+            journaled = _write_through_journal('update_schedule',
+                                               {'original_date_str': original_date_str, 'original_title': original_title, 'update_data': dict(update_data)},
+                                               Config.GOOGLE_SHEETS_SCHEDULE_WORKSHEET_NAME,
+                                               (True, "スケジュールの更新を受け付けました。" + _DEFERRED_NOTE))
+            if journaled is not None:
+                return journaled
+        return _update_schedule_in_sheets(original_date_str, original_title, update_data), False
+    except Exception as e:
+        print(f"ERROR: Error updating schedule: {e}")
+        cache.invalidate(Config.GOOGLE_SHEETS_SCHEDULE_WORKSHEET_NAME)
+        return (False, f"スケジュールの更新中にエラーが発生しました: {e}"), False
 
-        # 最初のマッチした行を更新対象とする（通常は一意であることを期待）
-        # gspreadは1-based index (ヘッダー行が1行目なのでデータは2行目から)
-        row_index_to_update = matching_rows.index[0] + 2 # +2 はヘッダー行と0-based indexのため
 
-        # update_data を元にセルを更新
-        updated_cells = []
-        for col_name, new_value in update_data.items():
-            if col_name in df.columns:
-                col_index = df.columns.get_loc(col_name) + 1 # gspreadは1-based index
-                worksheet.update_cell(row_index_to_update, col_index, str(new_value))
-                updated_cells.append(col_name)
-            else:
-                print(f"WARNING: Column '{col_name}' not found in schedule worksheet. Skipping update for this column.")
+def _delete_schedule_in_sheets(date_str: str, title: str) -> tuple[bool, str]:
+    """
+    主キーインデックスで特定し、シート上の行と一致することを確認したスケジュール行を削除します。
+    """
+    with _write_lock(Config.GOOGLE_SHEETS_SCHEDULE_WORKSHEET_NAME):
+        # 主キー（日付・タイトル）インデックスから行番号を取得（日付は正規化して比較される）
+        key_values = {'日付': date_str, 'タイトル': title}
+        entry, row_indices, _ = _write_verified_rows(
+            Config.GOOGLE_SHEETS_SCHEDULE_WORKSHEET_NAME,
+            lambda entry: [row_index for row_index in [entry.find_row(key_values)] if row_index is not None],
+            lambda worksheet, entry, row_indices: worksheet.delete_rows(row_indices[0]),
+            idempotent=False
+        )
+
+        if not entry.records:
+            return False, "スケジュールデータが見つかりません。"
+        if not row_indices:
+            return False, f"日付「{date_str}」タイトル「{title}」のスケジュールは見つかりませんでした。"
+        row_index_to_delete = row_indices[0]
+        cache.patch_delete(Config.GOOGLE_SHEETS_SCHEDULE_WORKSHEET_NAME, row_index_to_delete)
 
-        if updated_cells:
-            return True, f"スケジュールが更新されました: {', '.join(updated_cells)}"
-        else:
-            return False, "更新対象の項目が見つかりませんでした。"
-
-    except Exception as e:
-        print(f"ERROR: Error updating schedule: {e}")
-        return False, f"スケジュールの更新中にエラーが発生しました: {e}"
+    return True, "スケジュールが正常に削除されました。"
 
 
 def delete_schedule_by_date_title(date_str: str, title: str) -> tuple[bool, str]:
     """
     指定された日付とタイトルのスケジュールをスプレッドシートから削除します。
+    参加者シートの、このスケジュールの行もまとめて削除します。
     :param date_str: 削除するスケジュールのYYYY/MM/DD形式の日付文字列
     :param title: 削除するスケジュールのタイトル
     :return: 成功した場合は (True, "成功メッセージ")、失敗した場合は (False, "エラーメッセージ")
     """
-    try:
-        gc, spreadsheet = _get_sheets_client()
-        worksheet = spreadsheet.worksheet(Config.GOOGLE_SHEETS_SCHEDULE_WORKSHEET_NAME)
-        records = worksheet.get_all_records()
+    result, deferred = _submit_delete_schedule(date_str, title)
+    # 再送に任せた場合は、スケジュールの削除がシートに反映されてから再送スレッドが参加者シートに反映する
+    if result[0] and not deferred:
+        result = _with_attendee_cascade(result, date_str, title, None)
+    return result
 
-        if not records:
-            return False, "スケジュールデータが見つかりません。"
 
-        df = pd.DataFrame(records)
+def _submit_delete_schedule(date_str: str, title: str) -> tuple[tuple, bool]:
+    """
+    スケジュールの削除を、設定に応じてミラー・ジャーナル経由、またはシートへ直接書き込みます。
+    :return: (書き込みの結果, ジャーナルの再送に任せたか)
+    """
+    if mirror.is_enabled():
+        return mirror.submit('delete_schedule_by_date_title', date_str=date_str, title=title), False
+    try:
+        if journal.is_enabled():
+            journaled = _write_through_journal('delete_schedule_by_date_title', {'date_str': date_str, 'title': title},
+                                               Config.GOOGLE_SHEETS_SCHEDULE_WORKSHEET_NAME,
+                                               (True, "スケジュールの削除を受け付けました。" + _DEFERRED_NOTE))
+            if journaled is not None:
+                return journaled
+        return _delete_schedule_in_sheets(date_str, title), False
+    except Exception as e:
+        print(f"ERROR: Error deleting schedule: {e}")
+        cache.invalidate(Config.GOOGLE_SHEETS_SCHEDULE_WORKSHEET_NAME)
+        return (False, f"スケジュールの削除中にエラーが発生しました: {e}"), False
 
-        # 検索条件に合致する行を見つける
-        # `errors='coerce'` を使用して無効な日付をNaTに変換し、それを除外して比較
-        df['日付_dt'] = pd.to_datetime(df['日付'], errors='coerce')
 
-        # 削除対象日付をdatetimeオブジェクトに変換して正規化
-        target_date_dt = pd.to_datetime(date_str).normalize()
+def _cascade_schedule_to_attendees_in_sheets(date_str: str, title: str, new_values: dict = None) -> tuple[bool, str]:
+    """
+    スケジュールの変更・削除を、参加者シートのそのスケジュールの全ての行に反映します。
+    行の確認は1回の batch_get、書き換えは1回の batch_update、削除は1回の spreadsheet.batch_update で行うため、
+    参加者の人数にかかわらずAPI呼び出しの回数は変わりません。
+    :param new_values: 新しい {'日付': ..., 'タイトル': ...}（変わった列のみ）。None の場合は行を削除する
+    """
+    event_key = (cache.normalize_key_value('日付', date_str), cache.normalize_key_value('タイトル', title))
 
-        matching_rows = df[
-            (df['日付_dt'].dt.normalize() == target_date_dt) &
-            (df['タイトル'] == title)
+    def locate(entry):
+        return [
+            i + 2 for i, record in enumerate(entry.records) # +2 はヘッダー行と0-based indexのため
+            if (cache.normalize_key_value('日付', record.get('日付', '')),
+                cache.normalize_key_value('タイトル', record.get('タイトル', ''))) == event_key
         ]
 
-        if matching_rows.empty:
-            return False, f"日付「{date_str}」タイトル「{title}」のスケジュールは見つかりませんでした。"
+    def write(worksheet, entry, row_indices):
+        if new_values is None:
+            # 下の行から削除し、削除によって上の行の行番号がずれないようにする
+            requests = [
+                {'deleteDimension': {'range': {
+                    'sheetId': worksheet.id, 'dimension': 'ROWS', 'startIndex': row_index - 1, 'endIndex': row_index
+                }}}
+                for row_index in sorted(row_indices, reverse=True)
+            ]
+            worksheet.spreadsheet.batch_update({'requests': requests})
+            return None
+        data, updated_columns = _row_update_payload(entry.schema, {row_index: new_values for row_index in row_indices})
+        if data:
+            _send_row_updates(worksheet, data)
+        return updated_columns
+
+    with _write_lock(Config.GOOGLE_SHEETS_ATTENDEES_WORKSHEET_NAME):
+        try:
+            # 行の削除は、シートに反映済みかもしれない失敗で再送すると他の参加者の行を消してしまうため再試行しない
+            _, row_indices, updated_cells = _write_verified_rows(Config.GOOGLE_SHEETS_ATTENDEES_WORKSHEET_NAME, locate, write,
+                                                                 idempotent=new_values is not None)
+            if not row_indices:
+                return True, "参加者シートに該当する行はありませんでした。"
+            if new_values is None:
+                for row_index in sorted(row_indices, reverse=True):
+                    cache.patch_delete(Config.GOOGLE_SHEETS_ATTENDEES_WORKSHEET_NAME, row_index)
+                message = f"参加者シートの{len(row_indices)}行を削除しました。"
+            else:
+                for row_index in row_indices:
+                    cache.patch_update(Config.GOOGLE_SHEETS_ATTENDEES_WORKSHEET_NAME, row_index,
+                                       {col_name: str(new_values[col_name]) for col_name in updated_cells})
+                message = f"参加者シートの{len(row_indices)}行を更新しました。"
+        except Exception:
+            cache.invalidate(Config.GOOGLE_SHEETS_ATTENDEES_WORKSHEET_NAME)
+            raise
+    print(f"DEBUG: Cascaded schedule '{date_str}' '{title}' to attendees: {message}")
+    return True, message
+
+
+def cascade_schedule_to_attendees(date_str: str, title: str, new_values: dict = None) -> tuple[bool, str]:
+    """
+    スケジュールの日付・タイトルの変更、または削除を、参加者シートのそのスケジュールの全ての行にまとめて反映します。
+    （update_schedule / delete_schedule_by_date_title から呼ばれる）
+    :param date_str: スケジュールの元の日付
+    :param title: スケジュールの元のタイトル
+    :param new_values: 新しい {'日付': ..., 'タイトル': ...}（変わった列のみ）。None の場合は参加者の行を削除する
+    :return: 成功した場合は (True, "成功メッセージ")、失敗した場合は (False, "エラーメッセージ")
+    """
+    if mirror.is_enabled():
+        return mirror.submit('cascade_schedule_to_attendees', date_str=date_str, title=title, new_values=new_values)
+    if write_behind.is_enabled() and not write_behind.flush():
+        # 未反映の登録より先に書き換えると、後から反映された登録が元の日付・タイトルのまま残ってしまう
+        return False, "未反映の参加予定をシートへ反映できませんでした。"
+    try:
+        if journal.is_enabled():
+            journaled = _write_through_journal('cascade_schedule_to_attendees',
+                                               {'date_str': date_str, 'title': title, 'new_values': new_values},
+                                               Config.GOOGLE_SHEETS_ATTENDEES_WORKSHEET_NAME,
+                                               (True, "参加者シートへの反映を受け付けました。" + _DEFERRED_NOTE))
+            if journaled is not None:
+                return journaled[0]
+        return _cascade_schedule_to_attendees_in_sheets(date_str, title, new_values)
+    except Exception as e:
+        print(f"ERROR: Failed to cascade schedule change to attendees: {e}")
+        cache.invalidate(Config.GOOGLE_SHEETS_ATTENDEES_WORKSHEET_NAME)
+        return False, f"参加者シートの更新中にエラーが発生しました: {e}"
 
-        # 最初のマッチした行を削除対象とする
-        # gspreadは1-based index (ヘッダー行が1行目なのでデータは2行目から)
-        row_index_to_delete = matching_rows.index[0] + 2 # +2 はヘッダー行と0-based indexのため
 
-        worksheet.delete_rows(row_index_to_delete)
+def _with_attendee_cascade(result: tuple, date_str: str, title: str, new_values: dict = None) -> tuple[bool, str]:
+    """
+    スケジュールの更新・削除に成功した結果に、参加者シートへの反映を続けて行います。
+    反映に失敗してもスケジュール自体の変更は成功しているため、成功のままメッセージに失敗を添えます。
+    """
+    cascaded, message = cascade_schedule_to_attendees(date_str, title, new_values)
+    if not cascaded:
+        return True, f"{result[1]}\n（参加者シートへの反映に失敗しました: {message}）"
+    return result
 
-        return True, "スケジュールが正常に削除されました。"
-    except Exception as e:
-        print(f"ERROR: Error deleting schedule: {e}")
-        return False, f"スケジュールの削除中にエラーが発生しました: {e}"
+
+def _update_or_add_attendee_in_sheets(date: str, title: str, user_id: str, username: str, attendance_status: str, notes: str,
+                                      registered_at: str = None, updated_at: str = None) -> tuple[bool, str]:
+    """
+    参加予定の行を更新し、なければ末尾に追加します。
+    :param registered_at: 登録日時・更新日時。再送時に、利用者が登録した時刻を書き込むために渡す。省略時は現在時刻
+    """
+    now = datetime.now().strftime(Config.DATETIME_FORMAT)
+    updated_count = _flush_attendee_upserts_in_sheets([{
+        'date': date,
+        'title': title,
+        'user_id': user_id,
+        'username': username,
+        'attendance_status': attendance_status,
+        'notes': notes,
+        'registered_at': registered_at or now,
+        'updated_at': updated_at or now
+    }])
+    if updated_count:
+        return True, "参加予定を更新しました。"
+    return True, "参加予定を新規登録しました。"
+
+
+def _flush_attendee_upserts_in_sheets(upserts: list) -> int:
+    """
+    参加予定の登録・更新（write_behind の待ち行列・ジャーナルの再送では複数件）をシートへまとめて反映します。
+    既存の行の更新は、行がずれていないことを確認してから1回の batch_update、新規の行は1回の append_rows にまとめます。
+    :param upserts: {'date', 'title', 'user_id', 'username', 'attendance_status', 'notes', 'registered_at', 'updated_at'} のリスト
+    :return: 既存の行を更新した件数
+    """
+    def key_values(upsert):
+        # 日付とタイトルと参加者IDが一致する行を主キーインデックスから探す
+        return {'日付': upsert['date'], 'タイトル': upsert['title'], '参加者ID': upsert['user_id']}
+
+    def row_updates_for(entry):
+        # 既存の行は出欠・備考・更新日時を更新する
+        row_updates = {}
+        for upsert in upserts:
+            row_index = entry.find_row(key_values(upsert))
+            if row_index is not None:
+                row_updates[row_index] = {
+                    '出欠': upsert['attendance_status'],
+                    '備考': upsert['notes'],
+                    '更新日時': upsert['updated_at']
+                }
+        return row_updates
+
+    def write(worksheet, entry, row_indices):
+        # 出欠・備考・更新日時を1回のリクエストで更新
+        data, updated_columns = _row_update_payload(entry.schema, row_updates_for(entry))
+        if data:
+            _send_row_updates(worksheet, data)
+        return updated_columns
+
+    with _write_lock(Config.GOOGLE_SHEETS_ATTENDEES_WORKSHEET_NAME):
+        try:
+            entry, _, updated_cells = _write_verified_rows(
+                Config.GOOGLE_SHEETS_ATTENDEES_WORKSHEET_NAME, lambda entry: list(row_updates_for(entry)), write
+            )
+            row_updates = row_updates_for(entry)
+            for row_index, update_data in row_updates.items():
+                cache.patch_update(Config.GOOGLE_SHEETS_ATTENDEES_WORKSHEET_NAME, row_index,
+                                   {col_name: str(update_data[col_name]) for col_name in updated_cells})
+
+            headers = entry.schema.headers
+            rows_to_append = []
+            for upsert in upserts:
+                if entry.find_row(key_values(upsert)) is not None:
+                    continue
+                new_attendee_data = {
+                    '日付': upsert['date'],
+                    'タイトル': upsert['title'],
+                    '参加者ID': upsert['user_id'],
+                    '参加者名': upsert['username'],
+                    '出欠': upsert['attendance_status'],
+                    '備考': upsert['notes'],
+                    '登録日時': upsert['registered_at'],
+                    '更新日時': upsert['updated_at']
+                }
+                # スキーマのヘッダーの順序に合わせてデータを整形
+                rows_to_append.append([new_attendee_data.get(header, '') for header in headers])
+            if rows_to_append:
+                worksheet = get_worksheet(Config.GOOGLE_SHEETS_ATTENDEES_WORKSHEET_NAME)
+                response = rate_limiter.call('write', worksheet.append_rows, rows_to_append, idempotent=False)
+                first_row_index = _appended_row_index(response)
+                if first_row_index is not None:
+                    for i, row in enumerate(rows_to_append):
+                        cache.patch_insert(Config.GOOGLE_SHEETS_ATTENDEES_WORKSHEET_NAME, first_row_index + i, dict(zip(headers, row)))
+                else:
+                    cache.invalidate(Config.GOOGLE_SHEETS_ATTENDEES_WORKSHEET_NAME)
+        except Exception:
+            # どこまで反映されたか分からないため、再試行時はシートを読み込み直して行を特定し直す
+            cache.invalidate(Config.GOOGLE_SHEETS_ATTENDEES_WORKSHEET_NAME)
+            raise
+    print(f"DEBUG: Attendee writes applied ({len(row_updates)} updated, {len(rows_to_append)} appended).")
+    return len(row_updates)
 
 
 def update_or_add_attendee(date: str, title: str, user_id: str, username: str, attendance_status: str, notes: str) -> tuple[bool, str]:
@@ -192,64 +676,76 @@ def update_or_add_attendee(date: str, title: str, user_id: str, username: str, a
     :param notes: 備考
     :return: 成功した場合は (True, "成功メッセージ")、失敗した場合は (False, "エラーメッセージ")
     """
+    # 登録日時・更新日時は、シートへの反映が後になっても利用者が登録した時刻にする
+    now = datetime.now().strftime(Config.DATETIME_FORMAT)
+    if mirror.is_enabled():
+        return mirror.submit('update_or_add_attendee', date=date, title=title, user_id=user_id, username=username,
+                             attendance_status=attendance_status, notes=notes, registered_at=now, updated_at=now)
+    if write_behind.is_enabled():
+        try:
+            # ジャーナルに記録した時点で応答し、シートへはまとめて反映する
+            queued = write_behind.enqueue_attendee(date, title, user_id, username, attendance_status, notes)
+            # 応答の文言を選ぶためだけにシートを読み込まないよう、読み込み済みのキャッシュの索引だけを引く
+            entry = cache.peek_entry(Config.GOOGLE_SHEETS_ATTENDEES_WORKSHEET_NAME)
+            if queued or (entry is not None and entry.find_row({'日付': date, 'タイトル': title, '参加者ID': user_id}) is not None):
+                return True, "参加予定を更新しました。"
+            return True, "参加予定を新規登録しました。"
+        except Exception as e:
+            print(f"ERROR: Failed to queue attendee write: {e}")
+            return False, f"参加予定の登録/更新中にエラーが発生しました: {e}"
     try:
-        gc, spreadsheet = _get_sheets_client()
-        worksheet = spreadsheet.worksheet(Config.GOOGLE_SHEETS_ATTENDEES_WORKSHEET_NAME)
-
-        # 既存のレコードを全て取得
-        records = worksheet.get_all_records()
-        df = pd.DataFrame(records)
-
-        # 検索条件に合致する行を探す
-        # 日付とタイトルと参加者IDが一致するものを探す
-        matching_row = df[
-            (df['日付'] == date) &
-            (df['タイトル'] == title) &
-            (df['参加者ID'] == user_id) # ここを「参加者ID」に修正
-        ]
+        if journal.is_enabled():
+            journaled = _write_through_journal('update_or_add_attendee',
+                                               {'date': date, 'title': title, 'user_id': user_id, 'username': username,
+                                                'attendance_status': attendance_status, 'notes': notes,
+                                                'registered_at': now, 'updated_at': now},
+                                               Config.GOOGLE_SHEETS_ATTENDEES_WORKSHEET_NAME,
+                                               (True, "参加予定を受け付けました。" + _DEFERRED_NOTE))
+            if journaled is not None:
+                return journaled[0]
+        return _update_or_add_attendee_in_sheets(date, title, user_id, username, attendance_status, notes, now, now)
+    except Exception as e:
+        print(f"ERROR: Failed to update or add attendee: {e}")
+        cache.invalidate(Config.GOOGLE_SHEETS_ATTENDEES_WORKSHEET_NAME)
+        return False, f"参加予定の登録/更新中にエラーが発生しました: {e}"
 
-        if not matching_row.empty:
-            # 既存のレコードを更新
-            row_index_to_update = matching_row.index[0] + 2 # +2 はヘッダー行と0-based indexのため
-
-            update_data = {
-                '出欠': attendance_status,
-                '備考': notes,
-                '更新日時': datetime.now().strftime(Config.DATETIME_FORMAT)
-            }
-
-            # 各カラムを個別に更新
-            headers = worksheet.row_values(1)
-            for col_name, new_value in update_data.items():
-                if col_name in headers:
-                    col_index = headers.index(col_name) + 1 # gspreadは1-based index
-                    worksheet.update_cell(row_index_to_update, col_index, str(new_value))
-
-            return True, "参加予定を更新しました。"
-        else:
-            # 新規レコードとして追加
-            new_attendee_data = {
-                '日付': date,
-                'タイトル': title,
-                '参加者ID': user_id, # ここを「参加者ID」に修正
-                '参加者名': username, # ここを「参加者名」に修正
-                '出欠': attendance_status,
-                '備考': notes,
-                '登録日時': datetime.now().strftime(Config.DATETIME_FORMAT),
-                '更新日時': datetime.now().strftime(Config.DATETIME_FORMAT)
-            }
-
-            # ヘッダーの順序に合わせてデータを整形
-            headers = worksheet.row_values(1)
-            row_to_insert = [new_attendee_data.get(header, '') for header in headers]
-
-            worksheet.append_row(row_to_insert)
 
-            return True, "参加予定を新規登録しました。"
+def get_data_version(worksheet_name: str) -> int:
+    """
+    ワークシートの内容の版番号を返します。必要であればキャッシュを最新化してから返すため、
+    番号が同じであれば同じ内容とみなして、内容から作った表示結果を使い回せます。
+    このモジュールの書き込み関数でシートを変更すると番号は進みます。
+    """
+    if not mirror.is_enabled():
+        _get_cache_entry(worksheet_name) # TTL切れであれば変更を確認し、変わっていれば読み込み直す
+    return cache.get_data_version(worksheet_name)
+
 
+def get_user_attendee_records(user_id: str) -> pd.DataFrame:
+    """
+    指定されたユーザーIDの参加予定の行だけを、シートの行順にDataFrameとして取得します。
+    キャッシュ（またはローカルミラー）の参加者ID索引から引くため、参加者シート全体を走査しません。
+    :param user_id: 検索するLINEユーザーID
+    :return: 参加者シートと同じ列を持つDataFrame。参加予定がない場合・エラー時は空のDataFrameを返します。
+    """
+    worksheet_name = Config.GOOGLE_SHEETS_ATTENDEES_WORKSHEET_NAME
+    try:
+        if mirror.is_enabled():
+            return mirror.get_user_dataframe(worksheet_name, user_id)
+        _, entry = _get_cache_entry(worksheet_name)
+        if not entry.schema.has_column('参加者ID'):
+            print("WARNING: '参加者ID' column not found in attendees sheet for filtering.")
+            return pd.DataFrame()
+        df = pd.DataFrame(entry.find_records('参加者ID', user_id), columns=entry.headers)
+        if write_behind.is_enabled():
+            df = write_behind.overlay_attendees(df, user_id)
+        return df
+    except rate_limiter.DeadlineExceededError:
+        raise
     except Exception as e:
-        print(f"ERROR: Failed to update or add attendee: {e}")
-        return False, f"参加予定の登録/更新中にエラーが発生しました: {e}"
+        print(f"ERROR: Failed to get attendee records for user {user_id}: {e}")
+        return pd.DataFrame()
+
 
 def get_attendees_for_user(user_id: str) -> list[list[str]]:
     """
@@ -258,73 +754,176 @@ def get_attendees_for_user(user_id: str) -> list[list[str]]:
     :return: ユーザーの参加予定リスト (例: [['タイトル', '日付', '出欠', '備考'], ...])
     """
     try:
-        gc, spreadsheet = _get_sheets_client()
-        worksheet = spreadsheet.worksheet(Config.GOOGLE_SHEETS_ATTENDEES_WORKSHEET_NAME)
-        records = worksheet.get_all_records()
-
-        user_attendees = []
-        if records:
-            df = pd.DataFrame(records)
-            # '参加者ID' 列が存在することを確認
-            if '参加者ID' in df.columns: # ここを「参加者ID」に修正
-                filtered_df = df[df['参加者ID'] == user_id] # ここを「参加者ID」に修正
-                # 必要なカラムを抽出してリストのリストとして返す
-                # 例: 日付、タイトル、出欠、備考
-                if not filtered_df.empty:
-                    user_attendees = filtered_df[['タイトル', '日付', '出欠', '備考']].values.tolist()
-            else:
-                print("WARNING: '参加者ID' column not found in attendees sheet for filtering.") # ここを「参加者ID」に修正
-
-        return user_attendees
+        df = get_user_attendee_records(user_id)
+        if df.empty:
+            return []
+        # 必要なカラムを抽出してリストのリストとして返す
+        return df[['タイトル', '日付', '出欠', '備考']].values.tolist()
+    except rate_limiter.DeadlineExceededError:
+        raise
     except Exception as e:
         print(f"ERROR: Failed to get attendees for user {user_id}: {e}")
         return []
 
-def delete_row_by_criteria(worksheet_name: str, criteria: dict) -> bool:
+def _delete_row_by_criteria_in_sheets(worksheet_name: str, criteria: dict) -> bool:
     """
-    指定されたワークシートから、複数の条件に合致する最初の行を削除します。
-    :param worksheet_name: 操作対象のワークシート名
-    :param criteria: 削除対象を特定するためのカラム名と値の辞書 (例: {'日付': '2025/06/15', 'タイトル': '会議'})
-    :return: 削除に成功した場合はTrue、失敗した場合はFalse
+    criteria に一致する最初の行を、シート上の行と一致することを確認してから削除します。
     """
-    try:
-        gc, spreadsheet = _get_sheets_client()
-        worksheet = spreadsheet.worksheet(worksheet_name)
-        records = worksheet.get_all_records()
+    def locate(entry):
+        if entry.key_columns and set(criteria) == set(entry.key_columns):
+            # 条件が主キーと一致する場合はインデックスで検索
+            row_index = entry.find_row(criteria)
+            return [row_index] if row_index is not None else []
+        # それ以外は全ての条件を文字列として比較し、最初に一致した行を対象とする
+        for i, record in enumerate(entry.records):
+            if all(str(record.get(col, '')) == str(val) for col, val in criteria.items()):
+                return [i + 2] # +2 はヘッダー行と0-based indexのため
+        return []
 
-        if not records:
+    with _write_lock(worksheet_name):
+        _, entry = _get_cache_entry(worksheet_name)
+
+        if not entry.records:
             print(f"DEBUG: No records found in worksheet '{worksheet_name}'.")
             return False
 
-        df = pd.DataFrame(records)
-
-        # 複数条件でのフィルタリング
-        # 日付の比較は文字列で厳密に行う
-        # 他の条件も全て文字列として比較
-
-        # 各基準の条件をANDで結合
-        conditions = pd.Series([True] * len(df)) # 全ての行がTrueで初期化
-        for col, val in criteria.items():
-            if col in df.columns:
-                conditions = conditions & (df[col] == val)
-            else:
+        for col in criteria:
+            if not entry.schema.has_column(col):
                 print(f"WARNING: Criteria column '{col}' not found in worksheet '{worksheet_name}'. Skipping this criterion.")
                 return False # 存在しないカラムで削除条件を提示されたら失敗とする
 
-        matching_rows = df[conditions]
+        # 主キー列と条件の列の両方が一致することを確認する
+        entry, row_indices, _ = _write_verified_rows(
+            worksheet_name, locate,
+            lambda worksheet, entry, row_indices: worksheet.delete_rows(row_indices[0]),
+            list(dict.fromkeys([*entry.key_columns, *criteria])),
+            idempotent=False
+        )
 
-        if matching_rows.empty:
+        if not row_indices:
             print(f"DEBUG: No matching row found for deletion in worksheet '{worksheet_name}' with criteria: {criteria}")
             return False
+        row_index_to_delete = row_indices[0]
+        cache.patch_delete(worksheet_name, row_index_to_delete)
+    print(f"DEBUG: Successfully deleted row {row_index_to_delete} from worksheet '{worksheet_name}'.")
+    return True
 
-        # 最初のマッチした行を削除
-        # gspreadは1-based index (ヘッダー行が1行目なのでデータは2行目から)
-        row_index_to_delete = matching_rows.index[0] + 2 
-
-        worksheet.delete_rows(row_index_to_delete)
-        print(f"DEBUG: Successfully deleted row {row_index_to_delete} from worksheet '{worksheet_name}'.")
-        return True
 
+def delete_row_by_criteria(worksheet_name: str, criteria: dict) -> bool:
+    """
+    指定されたワークシートから、複数の条件に合致する最初の行を削除します。
+    :param worksheet_name: 操作対象のワークシート名
+    :param criteria: 削除対象を特定するためのカラム名と値の辞書 (例: {'日付': '2025/06/15', 'タイトル': '会議'})
+    :return: 削除に成功した場合はTrue、失敗した場合はFalse
+    """
+    if mirror.is_enabled():
+        return mirror.submit('delete_row_by_criteria', worksheet_name=worksheet_name, criteria=criteria)
+    if worksheet_name == Config.GOOGLE_SHEETS_ATTENDEES_WORKSHEET_NAME and write_behind.is_enabled() and not write_behind.flush():
+        # 未反映の登録より先に削除すると、後から反映された登録で行が復活してしまう
+        print(f"ERROR: Could not delete from worksheet '{worksheet_name}' because pending attendee writes failed to flush.")
+        return False
+    try:
+        if journal.is_enabled():
+            journaled = _write_through_journal('delete_row_by_criteria', {'worksheet_name': worksheet_name, 'criteria': dict(criteria)},
+                                               worksheet_name, True)
+            if journaled is not None:
+                return journaled[0]
+        return _delete_row_by_criteria_in_sheets(worksheet_name, criteria)
     except Exception as e:
         print(f"ERROR: Error deleting row from worksheet '{worksheet_name}': {e}")
+        cache.invalidate(worksheet_name)
         return False
+
+
+def _load_for_mirror(worksheet_name: str) -> tuple[list, list]:
+    """
+    ミラーへの取り込み用に、シートの最新の (ヘッダー, レコード) を返します。
+    シートが前回から変わっていなければ、全件の読み込みは行わずキャッシュの内容を返します。
+    """
+    worksheet = get_worksheet(worksheet_name)
+    entry = cache.get_entry(worksheet_name, _values_loader(worksheet), revalidate=True)
+    return entry.headers, [dict(record) for record in entry.records]
+
+
+def _replay_attendee_upserts(arguments_list: list):
+    """
+    ジャーナルに連続して記録された参加予定の登録・更新を、まとめてシートへ反映します。
+    同じ (日付, タイトル, 参加者ID) への複数回の書き込みは最後の内容にまとめ、登録日時は最初の書き込みのものを残します。
+    登録日時・更新日時は記録時のものを使います（記録していない古いジャーナルの書き込みのみ現在時刻）。
+    """
+    now = datetime.now().strftime(Config.DATETIME_FORMAT)
+    upserts = {}
+    for arguments in arguments_list:
+        key = (cache.normalize_key_value('日付', arguments['date']), str(arguments['title']), str(arguments['user_id']))
+        upsert = dict(arguments)
+        upsert['updated_at'] = upsert.get('updated_at') or now
+        upsert['registered_at'] = upsert.get('registered_at') or upsert['updated_at']
+        if key in upserts:
+            upsert['registered_at'] = upserts[key]['registered_at']
+        upserts[key] = upsert
+    _flush_attendee_upserts_in_sheets(list(upserts.values()))
+
+
+def _replay_add_schedule(schedule_data: dict) -> tuple[bool, str]:
+    """
+    ジャーナル・ローカルミラーの outbox に残ったスケジュールの登録を反映します。
+    前回の書き込みがシートに届いたかどうか分からない場合があるため、同じ日付・タイトルの行が既にあれば挿入しません。
+    """
+    with _write_lock(Config.GOOGLE_SHEETS_SCHEDULE_WORKSHEET_NAME):
+        _, entry = _get_cache_entry(Config.GOOGLE_SHEETS_SCHEDULE_WORKSHEET_NAME)
+        if entry.find_row(schedule_data) is not None:
+            print(f"DEBUG: Schedule '{schedule_data.get('日付')}' '{schedule_data.get('タイトル')}' already exists. Skipping replayed insert.")
+            return True, "スケジュールは登録済みです。"
+        return _add_schedule_in_sheets(schedule_data)
+
+
+def _replay_update_schedule(original_date_str: str, original_title: str, update_data: dict) -> tuple[bool, str]:
+    """
+    ジャーナルに残ったスケジュールの更新を反映し、日付・タイトルが変わった場合は参加者シートへの反映をジャーナルの後ろに追加します。
+    """
+    result = _update_schedule_in_sheets(original_date_str, original_title, update_data)
+    new_values = _changed_key_values(original_date_str, original_title, update_data)
+    if result[0] and new_values:
+        journal.append('cascade_schedule_to_attendees', {'date_str': original_date_str, 'title': original_title, 'new_values': new_values})
+    return result
+
+
+def _replay_delete_schedule(date_str: str, title: str) -> tuple[bool, str]:
+    """
+    ジャーナルに残ったスケジュールの削除を反映し、参加者シートからの削除をジャーナルの後ろに追加します。
+    """
+    result = _delete_schedule_in_sheets(date_str, title)
+    if result[0]:
+        journal.append('cascade_schedule_to_attendees', {'date_str': date_str, 'title': title, 'new_values': None})
+    return result
+
+
+def _replay_cascade_schedule_to_attendees(date_str: str, title: str, new_values: dict = None) -> tuple[bool, str]:
+    """
+    ジャーナルに残った参加者シートへの反映を行います。未反映の参加予定の登録（write_behind）を先にシートへ反映します。
+    """
+    if write_behind.is_enabled() and not write_behind.flush():
+        raise RuntimeError("Pending attendee writes could not be flushed before the cascade.")
+    return _cascade_schedule_to_attendees_in_sheets(date_str, title, new_values)
+
+
+# 操作名（公開関数名） → シートへ直接書き込む関数
+_SHEETS_WRITERS = {
+    'add_schedule': _add_schedule_in_sheets,
+    'update_schedule': _update_schedule_in_sheets,
+    'delete_schedule_by_date_title': _delete_schedule_in_sheets,
+    'update_or_add_attendee': _update_or_add_attendee_in_sheets,
+    'delete_row_by_criteria': _delete_row_by_criteria_in_sheets,
+    'cascade_schedule_to_attendees': _cascade_schedule_to_attendees_in_sheets,
+}
+
+mirror.register_sheets_backend(writers=dict(_SHEETS_WRITERS, add_schedule=_replay_add_schedule), loader=_load_for_mirror)
+write_behind.register_flusher(_flush_attendee_upserts_in_sheets)
+journal.register_writers(
+    dict(_SHEETS_WRITERS,
+         add_schedule=_replay_add_schedule,
+         update_schedule=_replay_update_schedule,
+         delete_schedule_by_date_title=_replay_delete_schedule,
+         cascade_schedule_to_attendees=_replay_cascade_schedule_to_attendees),
+    batch_writers={'update_or_add_attendee': _replay_attendee_upserts}
+)
@@ -0,0 +1,356 @@
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+import pandas as pd
+
+from config import Config
+from google_sheets import rate_limiter
+from google_sheets.cache import bump_data_version, normalize_key_value
+
+# 参加予定の登録・更新の書き込みをまとめてシートへ反映する待ち行列（任意機能）
+# Config.ATTENDEE_WRITE_BEHIND_SECONDS が 0 より大きく、ローカルミラーが無効な場合のみ有効になる。
+# 登録・更新はローカルのSQLiteジャーナルに記録した時点で応答し（プロセスが落ちてもジャーナルから再送される）、
+# 同じ (日付, タイトル, 参加者ID) への複数回の更新は最後の内容にまとめる。
+# 最初の書き込みから Config.ATTENDEE_WRITE_BEHIND_SECONDS 後に、溜まった分を
+# 既存行の更新は1回の batch_update、新規行は1回の append_rows でシートへ反映する。
+# 反映前の内容は読み取り時に重ねて返すため（overlay_attendees）、利用者からは書き込み済みに見える。
+# まとめた反映が 400 などで拒否された場合や Config.ATTENDEE_WRITE_BEHIND_MAX_ATTEMPTS 回失敗した場合は、1件ずつ反映し直し、
+# 反映できない書き込みだけを pending_attendees_dead_letters に移して、残りの書き込み（と後続の削除など）を止めないようにする。
+
+_SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS pending_attendees (
+    date_key TEXT NOT NULL,
+    title TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    date TEXT NOT NULL,
+    username TEXT NOT NULL,
+    attendance_status TEXT NOT NULL,
+    notes TEXT NOT NULL,
+    registered_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    revision INTEGER NOT NULL,
+    enqueued_at REAL NOT NULL,
+    PRIMARY KEY (date_key, title, user_id)
+);
+CREATE TABLE IF NOT EXISTS pending_attendees_dead_letters (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    date TEXT NOT NULL,
+    title TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    username TEXT NOT NULL,
+    attendance_status TEXT NOT NULL,
+    notes TEXT NOT NULL,
+    registered_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    revision INTEGER NOT NULL,
+    enqueued_at REAL NOT NULL,
+    attempts INTEGER NOT NULL,
+    error TEXT NOT NULL,
+    failed_at REAL NOT NULL
+);
+"""
+_COLUMNS = ('date', 'title', 'user_id', 'username', 'attendance_status', 'notes',
+            'registered_at', 'updated_at', 'revision', 'enqueued_at')
+
+_lock = threading.RLock()
+_flush_lock = threading.Lock() # シートへの反映は1度に1つだけ行う
+_conn = None
+_flush_thread = None
+_wake_event = threading.Event()
+_pending = {} # {(正規化した日付, タイトル, 参加者ID): 未反映の書き込み}
+_revision = 0 # 書き込みごとに増える番号。反映中に上書きされた書き込みを消さないために使う
+_attempts = {} # {(正規化した日付, タイトル, 参加者ID): 反映に失敗した回数}
+_flusher = None # 未反映の書き込みのリストを受け取り、シートへ反映する関数
+_stats = {'enqueued': 0, 'coalesced': 0, 'flushes': 0, 'flushed_rows': 0, 'failures': 0, 'dead_lettered': 0}
+
+
+def is_enabled() -> bool:
+    return Config.ATTENDEE_WRITE_BEHIND_SECONDS > 0 and not Config.GOOGLE_SHEETS_MIRROR_PATH
+
+
+def register_flusher(flusher):
+    """
+    溜まった書き込みをシートへ反映する関数を登録します。（google_sheets/utils.py から呼ばれる）
+    :param flusher: 未反映の書き込み（辞書）のリストを受け取る関数。API呼び出しの失敗は例外として送出すること
+    """
+    global _flusher
+    _flusher = flusher
+
+
+def _key(date, title, user_id) -> tuple:
+    return normalize_key_value('日付', date), str(title), str(user_id)
+
+
+def _get_connection() -> sqlite3.Connection:
+    """
+    ジャーナルを開き、前回のプロセスで反映できなかった書き込みを読み込んで反映用のスレッドを起動します。
+    2回目以降は既存の接続を返します。
+    """
+    global _conn, _flush_thread, _revision
+    if _conn is not None:
+        return _conn
+    with _lock:
+        if _conn is None:
+            conn = sqlite3.connect(Config.ATTENDEE_WRITE_BEHIND_JOURNAL_PATH, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=FULL") # 応答した書き込みは必ずディスクに残す
+            conn.executescript(_SCHEMA_SQL)
+            for row in conn.execute(f"SELECT {', '.join(_COLUMNS)} FROM pending_attendees"):
+                upsert = dict(zip(_COLUMNS, row))
+                _pending[_key(upsert['date'], upsert['title'], upsert['user_id'])] = upsert
+                _revision = max(_revision, upsert['revision'])
+            _conn = conn
+            print(f"DEBUG: Attendee write-behind journal opened at '{Config.ATTENDEE_WRITE_BEHIND_JOURNAL_PATH}' "
+                  f"({len(_pending)} pending).")
+        if _flush_thread is None:
+            _flush_thread = threading.Thread(target=_flush_loop, name='attendee-write-behind', daemon=True)
+            _flush_thread.start()
+    return _conn
+
+
+def resume():
+    """
+    ジャーナルを開き、前回のプロセスで反映できなかった書き込みがあれば反映を再開します。（起動時に呼び出す）
+    """
+    _get_connection()
+    _wake_event.set()
+
+
+def enqueue_attendee(date: str, title: str, user_id: str, username: str, attendance_status: str, notes: str) -> bool:
+    """
+    参加予定の登録・更新をジャーナルに記録します。戻った時点でディスクに書き込まれています。
+    同じ (日付, タイトル, 参加者ID) の未反映の書き込みがあれば、その内容を置き換えます。
+    :return: 同じ参加予定の未反映の書き込みがあった場合はTrue
+    """
+    global _revision
+    conn = _get_connection()
+    key = _key(date, title, user_id)
+    now = datetime.now().strftime(Config.DATETIME_FORMAT)
+    with _lock:
+        previous = _pending.get(key)
+        _revision += 1
+        upsert = {
+            'date': date,
+            'title': str(title),
+            'user_id': str(user_id),
+            'username': username,
+            'attendance_status': attendance_status,
+            'notes': notes,
+            'registered_at': previous['registered_at'] if previous else now,
+            'updated_at': now,
+            'revision': _revision,
+            # まとめる時間は最初の書き込みから数え、更新が続いても反映が先送りされないようにする
+            'enqueued_at': previous['enqueued_at'] if previous else time.time(),
+        }
+        conn.execute(
+            f"INSERT OR REPLACE INTO pending_attendees (date_key, {', '.join(_COLUMNS)}) "
+            f"VALUES (?, {', '.join('?' for _ in _COLUMNS)})",
+            (key[0],) + tuple(upsert[column] for column in _COLUMNS)
+        )
+        _pending[key] = upsert
+        _stats['enqueued'] += 1
+        if previous is not None:
+            _stats['coalesced'] += 1
+    bump_data_version(Config.GOOGLE_SHEETS_ATTENDEES_WORKSHEET_NAME)
+    _wake_event.set()
+    return previous is not None
+
+
+def _upsert_key(upsert: dict) -> tuple:
+    return _key(upsert['date'], upsert['title'], upsert['user_id'])
+
+
+def _remove_flushed(conn, upserts: list):
+    """
+    反映した書き込みを待ち行列とジャーナルから取り除きます。呼び出し元で _lock を保持していること。
+    反映中に再度更新された書き込みは、新しい内容を次回に反映するため残します。
+    """
+    for upsert in upserts:
+        key = _upsert_key(upsert)
+        current = _pending.get(key)
+        if current is None or current['revision'] != upsert['revision']:
+            continue
+        del _pending[key]
+        _attempts.pop(key, None)
+        conn.execute(
+            "DELETE FROM pending_attendees WHERE date_key = ? AND title = ? AND user_id = ? AND revision = ?",
+            key + (upsert['revision'],)
+        )
+
+
+def _move_to_dead_letters(conn, upsert: dict, error: str):
+    """書き込みを pending_attendees_dead_letters へ移します。呼び出し元で _lock を保持していること。"""
+    key = _upsert_key(upsert)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute(
+            f"INSERT INTO pending_attendees_dead_letters ({', '.join(_COLUMNS)}, attempts, error, failed_at) "
+            f"VALUES ({', '.join('?' for _ in _COLUMNS)}, ?, ?, ?)",
+            tuple(upsert[column] for column in _COLUMNS) + (_attempts.get(key, 0), error, time.time())
+        )
+        _remove_flushed(conn, [upsert])
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    _attempts.pop(key, None)
+    _stats['dead_lettered'] += 1
+
+
+def _record_failure(batch: list) -> int:
+    """反映に失敗した回数を数えます。呼び出し元で _lock を保持していること。:return: バッチ内で最も多い失敗回数"""
+    _stats['failures'] += 1
+    for upsert in batch:
+        key = _upsert_key(upsert)
+        _attempts[key] = _attempts.get(key, 0) + 1
+    return max(_attempts[_upsert_key(upsert)] for upsert in batch)
+
+
+def _flush_one_by_one(conn, batch: list) -> bool:
+    """
+    まとめた反映が拒否されたバッチを1件ずつ反映し直し、反映できない書き込みだけをデッドレターへ移します。
+    :return: 全て反映（またはデッドレターへ移動）できた場合はTrue。一時的な失敗で中断した場合は False
+    """
+    for upsert in batch:
+        try:
+            _flusher([upsert])
+        except Exception as e:
+            with _lock:
+                attempts = _record_failure([upsert])
+            # 400 などは再送しても成功しないため、後続の書き込みを待たせずにすぐ移す
+            if attempts < Config.ATTENDEE_WRITE_BEHIND_MAX_ATTEMPTS and not rate_limiter.is_permanent(e):
+                print(f"ERROR: Failed to flush attendee write for {upsert['user_id']} (attempt {attempts}): {e}")
+                return False
+            print(f"ERROR: Giving up on attendee write: {upsert}. Moving it to the dead letter table: {e}")
+            with _lock:
+                _move_to_dead_letters(conn, upsert, str(e))
+            continue
+        with _lock:
+            _remove_flushed(conn, [upsert])
+            _stats['flushed_rows'] += 1
+    return True
+
+
+def flush() -> bool:
+    """
+    未反映の書き込みを全てシートへ反映します。参加者シートへの他の書き込み（削除など）の前にも呼び出し、
+    書き込みの順序が入れ替わらないようにします。
+    反映しても成功しない書き込みはデッドレターへ移し、残りの書き込みの反映を止めません。
+    :return: 全て反映できた場合（未反映の書き込みがなかった場合、デッドレターへ移した場合を含む）はTrue
+    """
+    conn = _get_connection()
+    with _flush_lock:
+        with _lock:
+            batch = [dict(upsert) for upsert in _pending.values()]
+        if not batch:
+            return True
+
+        try:
+            _flusher(batch)
+        except Exception as e:
+            with _lock:
+                attempts = _record_failure(batch)
+            print(f"ERROR: Failed to flush {len(batch)} attendee writes to Google Sheets (attempt {attempts}): {e}")
+            if attempts < Config.ATTENDEE_WRITE_BEHIND_MAX_ATTEMPTS and not rate_limiter.is_permanent(e):
+                return False
+            if len(batch) == 1:
+                print(f"ERROR: Giving up on attendee write: {batch[0]}. Moving it to the dead letter table.")
+                with _lock:
+                    _move_to_dead_letters(conn, batch[0], str(e))
+                return True
+            # どの書き込みが拒否されたか分からないため、1件ずつ反映し直して特定する
+            return _flush_one_by_one(conn, batch)
+
+        with _lock:
+            _remove_flushed(conn, batch)
+            _stats['flushes'] += 1
+            _stats['flushed_rows'] += len(batch)
+    print(f"DEBUG: Flushed {len(batch)} attendee writes to Google Sheets.")
+    return True
+
+
+def _flush_loop():
+    failures = 0
+    retry_at = 0.0
+    while True:
+        _wake_event.clear()
+        with _lock:
+            oldest = min((upsert['enqueued_at'] for upsert in _pending.values()), default=None)
+            pending_count = len(_pending)
+
+        timeout = None # 未反映の書き込みがなければ、次の書き込みまで待つ
+        if oldest is not None:
+            now = time.time()
+            due = oldest + Config.ATTENDEE_WRITE_BEHIND_SECONDS
+            if pending_count >= Config.ATTENDEE_WRITE_BEHIND_MAX_PENDING:
+                due = now # 溜まりすぎた場合は待たずに反映する
+            due = max(due, retry_at)
+            if now < due:
+                timeout = due - now
+            elif flush():
+                failures = 0
+                retry_at = 0.0
+                continue
+            else:
+                failures += 1
+                timeout = min(2 ** failures, 60) # 失敗が続く間は指数的に間隔を空ける
+                retry_at = now + timeout
+        _wake_event.wait(timeout)
+
+
+def overlay_attendees(df: pd.DataFrame, user_id: str = None) -> pd.DataFrame:
+    """
+    参加者シートのDataFrameに、未反映の書き込みを重ねて返します。
+    既存の行は出欠・備考・更新日時を置き換え、シートにまだない参加予定は末尾に追加します。
+    :param user_id: 指定した場合は、その参加者IDの書き込みだけを重ねる（1人分の行だけのDataFrameに使う）
+    """
+    _get_connection()
+    with _lock:
+        pending = [dict(upsert) for upsert in _pending.values() if user_id is None or upsert['user_id'] == str(user_id)]
+    if not pending:
+        return df
+
+    positions = {}
+    if not df.empty and {'日付', 'タイトル', '参加者ID'}.issubset(df.columns):
+        for position, row_key in enumerate(zip(df['日付'], df['タイトル'], df['参加者ID'])):
+            positions.setdefault(_key(*row_key), position)
+        # 数値として読み込まれた列にも文字列を入れられるようにする
+        for column in ('出欠', '備考', '更新日時'):
+            if column in df.columns:
+                df[column] = df[column].astype(object)
+
+    new_rows = []
+    for upsert in pending:
+        position = positions.get(_key(upsert['date'], upsert['title'], upsert['user_id']))
+        if position is None:
+            new_rows.append({
+                '日付': upsert['date'],
+                'タイトル': upsert['title'],
+                '参加者ID': upsert['user_id'],
+                '参加者名': upsert['username'],
+                '出欠': upsert['attendance_status'],
+                '備考': upsert['notes'],
+                '登録日時': upsert['registered_at'],
+                '更新日時': upsert['updated_at'],
+            })
+            continue
+        for column, value in (('出欠', upsert['attendance_status']), ('備考', upsert['notes']), ('更新日時', upsert['updated_at'])):
+            if column in df.columns:
+                df.loc[df.index[position], column] = value
+
+    if new_rows:
+        df = pd.concat([df, pd.DataFrame(new_rows)], ignore_index=True) if not df.empty else pd.DataFrame(new_rows)
+    return df
+
+
+def get_write_behind_stats() -> dict:
+    """
+    未反映の書き込み件数・デッドレターへ移した書き込み件数と、記録・まとめ・反映の統計を返します。（監視・デバッグ用）
+    """
+    with _lock:
+        if _conn is None:
+            return dict(_stats, pending=len(_pending), dead_letters=0)
+        dead_letters = _conn.execute("SELECT COUNT(*) FROM pending_attendees_dead_letters").fetchone()[0]
+        return dict(_stats, pending=len(_pending), dead_letters=dead_letters)
@@ -6,50 +6,41 @@ from linebot.v3.messaging.models.postback_action import PostbackAction
 from config import Config, SessionState
 from google_sheets.utils import (
     get_all_records,
+    get_data_version,
+    get_user_attendee_records,
     update_or_add_attendee,
     delete_row_by_criteria
 )
+from line_handlers import list_pagination
 # utils/session_managerからセッション操作関数をインポート
-from utils.session_manager import get_user_session_data, set_user_session_data, delete_user_session_data
+from utils.session_manager import set_user_session
 
 
 # 参加予定一覧表示（ユーザーのIDに紐づく参加予定）
 def list_user_attendees(user_id, reply_token, line_bot_api_messaging: MessagingApi):
     print(f"DEBUG: list_user_attendees called for user_id: {user_id}")
-    all_attendees_df = get_all_records(Config.GOOGLE_SHEETS_ATTENDEES_WORKSHEET_NAME)
+    # 参加者ID索引からこのユーザーの行だけを取得（参加者シート全体は走査しない）
+    user_attendees_df = get_user_attendee_records(user_id)
 
-    if all_attendees_df.empty:
-        reply_message = "登録されている参加予定はありません。"
-        print("DEBUG: Attendees worksheet is empty. No user attendees to display.")
+    if user_attendees_df.empty:
+        reply_message = "あなたの参加予定は登録されていません。"
+        print(f"DEBUG: No attendee records found for user_id: {user_id}.")
     else:
-        # ユーザーIDでフィルタリング
-        # カラム名が「参加者ID」であることを確認
-        if '参加者ID' not in all_attendees_df.columns:
-            print(f"ERROR: '参加者ID' column not found in attendees sheet. Columns: {all_attendees_df.columns.tolist()}")
-            reply_message = "参加者シートのデータ形式に問題があります。（参加者ID列が見つかりません）"
+        reply_message = "【あなたの参加予定一覧】\n"
+        # 日付でソート（日付がdatetime型であると仮定）
+        # '日付'カラムが存在し、かつ空でないことを確認してからpd.to_datetimeを適用
+        if '日付' in user_attendees_df.columns and not user_attendees_df['日付'].empty:
+            user_attendees_df['日付'] = pd.to_datetime(user_attendees_df['日付'], errors='coerce')
+            user_attendees_df = user_attendees_df.sort_values(by='日付', ascending=True)
         else:
-            # ここを「参加者ID」に修正
-            user_attendees_df = all_attendees_df[all_attendees_df['参加者ID'] == user_id]
+            print("WARNING: '日付' column not found or is empty in user attendees DataFrame. Skipping date sort.")
+            # 日付がない場合の代替処理（例: ソートしない）
 
-            if user_attendees_df.empty:
-                reply_message = "あなたの参加予定は登録されていません。"
-                print(f"DEBUG: No attendee records found for user_id: {user_id}.")
-            else:
-                reply_message = "【あなたの参加予定一覧】\n"
-                # 日付でソート（日付がdatetime型であると仮定）
-                # '日付'カラムが存在し、かつ空でないことを確認してからpd.to_datetimeを適用
-                if '日付' in user_attendees_df.columns and not user_attendees_df['日付'].empty:
-                    user_attendees_df['日付'] = pd.to_datetime(user_attendees_df['日付'], errors='coerce')
-                    user_attendees_df = user_attendees_df.sort_values(by='日付', ascending=True)
-                else:
-                    print("WARNING: '日付' column not found or is empty in user attendees DataFrame. Skipping date sort.")
-                    # 日付がない場合の代替処理（例: ソートしない）
-
-                for index, row in user_attendees_df.iterrows():
-                    date_str = row['日付'].strftime('%Y/%m/%d') if pd.notna(row['日付']) else '日付未定'
-                    reply_message += f"日付: {date_str}, タイトル: {row['タイトル']}\n"
-                    reply_message += f"  出欠: {row.get('出欠', '未回答')}, 備考: {row.get('備考', 'なし')}\n\n"
-                print(f"DEBUG: Successfully prepared {len(user_attendees_df)} attendee records for user {user_id}.")
+        for index, row in user_attendees_df.iterrows():
+            date_str = row['日付'].strftime('%Y/%m/%d') if pd.notna(row['日付']) else '日付未定'
+            reply_message += f"日付: {date_str}, タイトル: {row['タイトル']}\n"
+            reply_message += f"  出欠: {row.get('出欠', '未回答')}, 備考: {row.get('備考', 'なし')}\n\n"
+        print(f"DEBUG: Successfully prepared {len(user_attendees_df)} attendee records for user {user_id}.")
 
     line_bot_api_messaging.reply_message(
         ReplyMessageRequest(
@@ -58,58 +49,89 @@ def list_user_attendees(user_id, reply_token, line_bot_api_messaging: MessagingA
         )
     )
 
+def _format_attendee_groups(attendees_df: pd.DataFrame) -> list:
+    """
+    参加者をイベント（日付・タイトル）ごとにまとめ、1イベントずつ表示用の文字列に整形します。
+    グループごとのループではなく、集計結果の列単位の文字列結合で組み立てます。
+    """
+    # '参加者名' カラムを使用（もし存在すれば）。なければ '参加者ID'
+    if '参加者名' in attendees_df.columns:
+        name_column = '参加者名'
+    elif '参加者ID' in attendees_df.columns:
+        name_column = '参加者ID'
+    else:
+        name_column = None
+        print("WARNING: '参加者名' and '参加者ID' columns not found in attendees group. Cannot list names.")
+
+    names = attendees_df[name_column].astype(str) if name_column else pd.Series("不明", index=attendees_df.index)
+    grouped = (
+        attendees_df.assign(_name=names)
+        .groupby(['日付_dt', 'タイトル'], sort=True)['_name']
+        .agg(attendee_count='size', attendee_names=lambda group_names: ", ".join(group_names) if name_column else "不明")
+        .reset_index()
+    )
+    entries = (
+        "日付: " + grouped['日付_dt'].dt.strftime('%Y/%m/%d') +
+        ", タイトル: " + grouped['タイトル'].astype(str) +
+        "\n  参加者人数: " + grouped['attendee_count'].astype(str) +
+        "\n  参加者名: " + grouped['attendee_names'] +
+        "\n\n"
+    )
+    return entries.tolist()
+
+
 # 参加者一覧表示（イベントごとの参加者）
-def list_attendees(user_id, reply_token, line_bot_api_messaging: MessagingApi):
-    print(f"DEBUG: list_attendees called for user_id: {user_id}")
+def _render_attendees_page(offset: int) -> tuple:
+    """
+    参加者一覧の offset 件目からのページを組み立てます。
+    :return: (TextMessageのリスト, 次のページの開始位置。続きがなければ None)
+    """
     all_attendees_df = get_all_records(Config.GOOGLE_SHEETS_ATTENDEES_WORKSHEET_NAME)
 
     if all_attendees_df.empty:
-        reply_message = "登録されている参加者情報はありません。"
         print("DEBUG: Attendees worksheet is empty. No attendees to display.")
-    else:
-        reply_message = "【参加者一覧】\n"
-
+        return [TextMessage(text="登録されている参加者情報はありません。")], None
+    if '日付' not in all_attendees_df.columns or 'タイトル' not in all_attendees_df.columns:
         # '日付'と'タイトル'カラムが存在することを確認
-        if '日付' not in all_attendees_df.columns or 'タイトル' not in all_attendees_df.columns:
-            print(f"ERROR: Missing '日付' or 'タイトル' column in attendees sheet. Columns: {all_attendees_df.columns.tolist()}")
-            reply_message = "参加者シートのデータ形式に問題があります。（日付またはタイトル列が見つかりません）"
-        else:
-            # 日付をdatetime型に変換し、NaNを除外してからグループ化
-            all_attendees_df['日付_dt'] = pd.to_datetime(all_attendees_df['日付'], errors='coerce')
-
-            # 日付が無効な行を除外
-            valid_attendees_df = all_attendees_df[pd.notna(all_attendees_df['日付_dt'])]
-
-            if valid_attendees_df.empty:
-                 reply_message = "登録されている参加者情報はありません。" # 日付が無効なデータしかない場合
-                 print("DEBUG: No valid date entries in attendees worksheet.")
-            else:
-                # 日付でソートしてからグループ化することで、出力順を保証
-                valid_attendees_df = valid_attendees_df.sort_values(by='日付_dt', ascending=True)
-                grouped_attendees = valid_attendees_df.groupby(['日付_dt', 'タイトル'])
-
-                for (date, title), group in grouped_attendees:
-                    date_str = date.strftime('%Y/%m/%d')
-                    attendee_count = len(group)
-
-                    # '参加者名' カラムを使用（もし存在すれば）
-                    if '参加者名' in group.columns:
-                        attendee_names = ", ".join(group['参加者名'].tolist())
-                    elif '参加者ID' in group.columns: # fallback to '参加者ID' if '参加者名' is missing
-                        attendee_names = ", ".join(group['参加者ID'].tolist()) # ここを「参加者ID」に修正
-                    else:
-                        attendee_names = "不明"
-                        print("WARNING: '参加者名' and '参加者ID' columns not found in attendees group. Cannot list names.")
-
-                    reply_message += f"日付: {date_str}, タイトル: {title}\n"
-                    reply_message += f"  参加者人数: {attendee_count}\n"
-                    reply_message += f"  参加者名: {attendee_names}\n\n"
-                print(f"DEBUG: Successfully prepared grouped attendee records.")
-
+        print(f"ERROR: Missing '日付' or 'タイトル' column in attendees sheet. Columns: {all_attendees_df.columns.tolist()}")
+        return [TextMessage(text="参加者シートのデータ形式に問題があります。（日付またはタイトル列が見つかりません）")], None
+
+    # 日付をdatetime型に変換し、日付が無効な行と終了したイベントを除外してからグループ化
+    all_attendees_df['日付_dt'] = pd.to_datetime(all_attendees_df['日付'], errors='coerce')
+    today = pd.Timestamp.now().normalize()
+    valid_attendees_df = all_attendees_df[all_attendees_df['日付_dt'] >= today]
+
+    if valid_attendees_df.empty:
+        print("DEBUG: No upcoming entries in attendees worksheet.")
+        return [TextMessage(text="登録されている参加者情報はありません。")], None
+
+    entries = _format_attendee_groups(valid_attendees_df)
+    messages, next_offset = list_pagination.build_page_messages("【参加者一覧】\n", entries, offset)
+    print(f"DEBUG: Successfully prepared {len(entries)} grouped attendee records (next offset: {next_offset}).")
+    return messages, next_offset
+
+
+def list_attendees(user_id, reply_token, line_bot_api_messaging: MessagingApi, offset: int = 0):
+    """
+    今日以降のイベントごとの参加者を日付順に表示します。
+    1回の返信に収まらない場合は「次へ」で続きを表示します。
+    参加者シートが変わっていなければ、組み立て済みのページを使い回します。
+    :param offset: 表示を始める位置（「次へ」で続きを表示する場合）
+    """
+    print(f"DEBUG: list_attendees called for user_id: {user_id}, offset: {offset}")
+    # 版は一覧を読み込む前に取得する（読み込み中に書き込まれた場合は、次回に組み立て直される）
+    version = list_pagination.render_version(get_data_version(Config.GOOGLE_SHEETS_ATTENDEES_WORKSHEET_NAME))
+    page = list_pagination.get_rendered_page('attendees', version, offset)
+    if page is None:
+        page = _render_attendees_page(offset)
+        list_pagination.store_rendered_page('attendees', version, offset, *page)
+    messages, next_offset = page
+
+    list_pagination.save_cursor(user_id, 'attendees', next_offset)
     line_bot_api_messaging.reply_message(
         ReplyMessageRequest(
             reply_token=reply_token,
-            messages=[TextMessage(text=reply_message)]
+            messages=messages
         )
     )
 
@@ -117,10 +139,9 @@ def list_attendees(user_id, reply_token, line_bot_api_messaging: MessagingApi):
 # 参加予定編集開始
 def start_attendee_edit(user_id, reply_token, line_bot_api_messaging: MessagingApi):
     print(f"DEBUG: start_attendee_edit called for user_id: {user_id}")
-    SessionState.set_state(user_id, SessionState.ASKING_ATTENDEE_DATE)
+    set_user_session(user_id, SessionState.ASKING_ATTENDEE_DATE, {'参加者ID': user_id}) # ここを「参加者ID」に修正
     # SessionState がデータを管理するため、Config.SESSION_DATA_KEY は不要
     # 修正: Config.SESSION_DATA_KEY を削除
-    set_user_session_data(user_id, {'参加者ID': user_id}) # ここを「参加者ID」に修正
     line_bot_api_messaging.reply_message(
         ReplyMessageRequest(
             reply_token=reply_token,
@@ -129,20 +150,17 @@ def start_attendee_edit(user_id, reply_token, line_bot_api_messaging: MessagingA
     )
 
 # 参加予定編集の次のステップ
-def process_attendee_edit_step(user_id, message_text, reply_token, line_bot_api_messaging: MessagingApi):
+def process_attendee_edit_step(user_id, message_text, reply_token, line_bot_api_messaging: MessagingApi, current_state, session_data):
     print(f"DEBUG: process_attendee_edit_step called for user_id: {user_id}, message: {message_text}")
-    current_state = SessionState.get_state(user_id)
-    # SessionState がデータを管理するため、Config.SESSION_DATA_KEY は不要
-    # 修正: Config.SESSION_DATA_KEY を削除
-    session_data = get_user_session_data(user_id) or {}
+    # 会話状態とセッションデータは message_processors.py が1回の参照で取得したものを受け取る
+    session_data = session_data or {}
 
     if current_state == SessionState.ASKING_ATTENDEE_DATE:
         try:
             pd.to_datetime(message_text, errors='raise')
             session_data['日付'] = message_text
             # 修正: Config.SESSION_DATA_KEY を削除
-            set_user_session_data(user_id, session_data)
-            SessionState.set_state(user_id, SessionState.ASKING_ATTENDEE_TITLE)
+            set_user_session(user_id, SessionState.ASKING_ATTENDEE_TITLE, session_data)
             print(f"DEBUG: User {user_id} entered date: {message_text}. Next state: ASKING_ATTENDEE_TITLE.")
             line_bot_api_messaging.reply_message(
                 ReplyMessageRequest(
@@ -160,12 +178,10 @@ def process_attendee_edit_step(user_id, message_text, reply_token, line_bot_api_
             )
     elif current_state == SessionState.ASKING_ATTENDEE_TITLE:
         session_data['タイトル'] = message_text
-        # 修正: Config.SESSION_DATA_KEY を削除
-        set_user_session_data(user_id, session_data)
         print(f"DEBUG: User {user_id} entered title: {message_text}. Next, check matching attendees.")
 
-        # 該当する参加予定が存在するか確認
-        all_attendees = get_all_records(Config.GOOGLE_SHEETS_ATTENDEES_WORKSHEET_NAME)
+        # 該当する参加予定が存在するか確認（参加者ID索引からこのユーザーの行だけを取得）
+        user_attendees = get_user_attendee_records(user_id)
 
         # 日付を正規化して比較
         try:
@@ -182,29 +198,28 @@ def process_attendee_edit_step(user_id, message_text, reply_token, line_bot_api_
                     messages=[TextMessage(text="日付の形式が正しくありません。最初からやり直してください。")]
                 )
             )
-            SessionState.set_state(user_id, SessionState.NONE)
+            set_user_session(user_id, SessionState.NONE, None)
             # 修正: Config.SESSION_DATA_KEY を削除
-            delete_user_session_data(user_id)
             return
 
         # '日付'カラムの型がdatetimeであることを確認
-        if '日付' in all_attendees.columns and pd.api.types.is_datetime64_any_dtype(all_attendees['日付']):
-            matching_attendees = all_attendees[
-                (all_attendees['参加者ID'] == user_id) & # ここを「参加者ID」に修正
-                (pd.notna(all_attendees['日付']) & (all_attendees['日付'].dt.normalize() == search_date)) &
-                (all_attendees['タイトル'] == session_data['タイトル'])
+        if user_attendees.empty:
+            matching_attendees = user_attendees
+        elif '日付' in user_attendees.columns and pd.api.types.is_datetime64_any_dtype(user_attendees['日付']):
+            matching_attendees = user_attendees[
+                (pd.notna(user_attendees['日付']) & (user_attendees['日付'].dt.normalize() == search_date)) &
+                (user_attendees['タイトル'] == session_data['タイトル'])
             ]
         else:
-            print("WARNING: '日付' column is not datetime type or missing in all_attendees_df. Attempting string comparison.")
+            print("WARNING: '日付' column is not datetime type or missing in user_attendees. Attempting string comparison.")
             # 日付カラムがdatetime型でない場合のフォールバック（文字列比較）
-            matching_attendees = all_attendees[
-                (all_attendees['参加者ID'] == user_id) & # ここを「参加者ID」に修正
-                (all_attendees['日付'] == search_date_str) & # 文字列として比較
-                (all_attendees['タイトル'] == session_data['タイトル'])
+            matching_attendees = user_attendees[
+                (user_attendees['日付'] == search_date_str) & # 文字列として比較
+                (user_attendees['タイトル'] == session_data['タイトル'])
             ]
 
         if not matching_attendees.empty:
-            SessionState.set_state(user_id, SessionState.ASKING_ATTENDEE_CONFIRM_CANCEL)
+            set_user_session(user_id, SessionState.ASKING_ATTENDEE_CONFIRM_CANCEL, session_data)
             print(f"DEBUG: Matching attendee found for {user_id}. Asking for cancel confirmation.")
             # クイックリプライを追加
             quick_reply_items = [
@@ -220,9 +235,8 @@ def process_attendee_edit_step(user_id, message_text, reply_token, line_bot_api_
             )
         else:
             print(f"DEBUG: No matching attendee found for {user_id} with date {search_date_str} and title {session_data['タイトル']}.")
-            SessionState.set_state(user_id, SessionState.NONE)
+            set_user_session(user_id, SessionState.NONE, None)
             # 修正: Config.SESSION_DATA_KEY を削除
-            delete_user_session_data(user_id)
             line_bot_api_messaging.reply_message(
                 ReplyMessageRequest(
                     reply_token=reply_token,
@@ -240,14 +254,12 @@ def process_attendee_edit_step(user_id, message_text, reply_token, line_bot_api_
             }
             if delete_row_by_criteria(Config.GOOGLE_SHEETS_ATTENDEES_WORKSHEET_NAME, criteria):
                 reply_message = "参加予定をキャンセルしました。\n他に編集したい予定はありますか？（はい/いいえ）"
-                SessionState.set_state(user_id, SessionState.ASKING_FOR_ANOTHER_ATTENDEE_EDIT)
+                set_user_session(user_id, SessionState.ASKING_FOR_ANOTHER_ATTENDEE_EDIT, None)
                 print(f"DEBUG: Attendee record for {user_id} cancelled.")
             else:
                 reply_message = "参加予定のキャンセルに失敗しました。最初からやり直してください。"
-                SessionState.set_state(user_id, SessionState.NONE)
+                set_user_session(user_id, SessionState.NONE, None)
                 print(f"ERROR: Failed to cancel attendee record for {user_id}.")
-            # 修正: Config.SESSION_DATA_KEY を削除
-            delete_user_session_data(user_id)
             line_bot_api_messaging.reply_message(
                 ReplyMessageRequest(
                     reply_token=reply_token,
@@ -288,15 +300,13 @@ def process_attendee_edit_step(user_id, message_text, reply_token, line_bot_api_
 
         if success:
             reply_message = "備考を更新しました。\n他に編集したい予定はありますか？（はい/いいえ）"
-            SessionState.set_state(user_id, SessionState.ASKING_FOR_ANOTHER_ATTENDEE_EDIT)
+            set_user_session(user_id, SessionState.ASKING_FOR_ANOTHER_ATTENDEE_EDIT, None)
             print(f"DEBUG: Notes for {user_id} updated successfully.")
         else:
             reply_message = f"備考の更新に失敗しました。{msg} 最初からやり直してください。"
-            SessionState.set_state(user_id, SessionState.NONE)
+            set_user_session(user_id, SessionState.NONE, None)
             print(f"ERROR: Failed to update notes for {user_id}: {msg}")
 
-        # 修正: Config.SESSION_DATA_KEY を削除
-        delete_user_session_data(user_id)
         line_bot_api_messaging.reply_message(
             ReplyMessageRequest(
                 reply_token=reply_token,
@@ -312,9 +322,8 @@ def process_attendee_edit_step(user_id, message_text, reply_token, line_bot_api_
         if message_text.lower() == 'はい':
             start_attendee_edit(user_id, reply_token, line_bot_api_messaging)
         else:
-            SessionState.set_state(user_id, SessionState.NONE)
+            set_user_session(user_id, SessionState.NONE, None)
             # 修正: Config.SESSION_DATA_KEY を削除
-            delete_user_session_data(user_id)
             line_bot_api_messaging.reply_message(
                 ReplyMessageRequest(
                     reply_token=reply_token,
@@ -325,10 +334,9 @@ def process_attendee_edit_step(user_id, message_text, reply_token, line_bot_api_
 # 参加予定登録開始
 def start_attendee_registration(user_id, reply_token, line_bot_api_messaging: MessagingApi):
     print(f"DEBUG: start_attendee_registration called for user_id: {user_id}")
-    SessionState.set_state(user_id, SessionState.ASKING_ATTENDEE_REGISTRATION_DATE)
+    set_user_session(user_id, SessionState.ASKING_ATTENDEE_REGISTRATION_DATE, {'参加者ID': user_id}) # ここを「参加者ID」に修正
     # SessionState がデータを管理するため、Config.SESSION_DATA_KEY は不要
     # 修正: Config.SESSION_DATA_KEY を削除
-    set_user_session_data(user_id, {'参加者ID': user_id}) # ここを「参加者ID」に修正
     line_bot_api_messaging.reply_message(
         ReplyMessageRequest(
             reply_token=reply_token,
@@ -337,20 +345,17 @@ def start_attendee_registration(user_id, reply_token, line_bot_api_messaging: Me
     )
 
 # 参加予定登録の次のステップ
-def process_attendee_registration_step(user_id, message_text, reply_token, line_bot_api_messaging: MessagingApi):
+def process_attendee_registration_step(user_id, message_text, reply_token, line_bot_api_messaging: MessagingApi, current_state, session_data):
     print(f"DEBUG: process_attendee_registration_step called for user_id: {user_id}, message: {message_text}")
-    current_state = SessionState.get_state(user_id)
-    # SessionState がデータを管理するため、Config.SESSION_DATA_KEY は不要
-    # 修正: Config.SESSION_DATA_KEY を削除
-    session_data = get_user_session_data(user_id) or {}
+    # 会話状態とセッションデータは message_processors.py が1回の参照で取得したものを受け取る
+    session_data = session_data or {}
 
     if current_state == SessionState.ASKING_ATTENDEE_REGISTRATION_DATE:
         try:
             pd.to_datetime(message_text, errors='raise')
             session_data['日付'] = message_text
             # 修正: Config.SESSION_DATA_KEY を削除
-            set_user_session_data(user_id, session_data)
-            SessionState.set_state(user_id, SessionState.ASKING_ATTENDEE_REGISTRATION_TITLE)
+            set_user_session(user_id, SessionState.ASKING_ATTENDEE_REGISTRATION_TITLE, session_data)
             print(f"DEBUG: User {user_id} entered date: {message_text}. Next state: ASKING_ATTENDEE_REGISTRATION_TITLE.")
             line_bot_api_messaging.reply_message(
                 ReplyMessageRequest(
@@ -369,8 +374,7 @@ def process_attendee_registration_step(user_id, message_text, reply_token, line_
     elif current_state == SessionState.ASKING_ATTENDEE_REGISTRATION_TITLE:
         session_data['タイトル'] = message_text
         # 修正: Config.SESSION_DATA_KEY を削除
-        set_user_session_data(user_id, session_data)
-        SessionState.set_state(user_id, SessionState.ASKING_ATTENDEE_STATUS)
+        set_user_session(user_id, SessionState.ASKING_ATTENDEE_STATUS, session_data)
         print(f"DEBUG: User {user_id} entered title: {message_text}. Next state: ASKING_ATTENDEE_STATUS.")
         line_bot_api_messaging.reply_message(
             ReplyMessageRequest(
@@ -388,8 +392,7 @@ def process_attendee_registration_step(user_id, message_text, reply_token, line_
         if attendee_status in ['〇', '○', 'x', 'X', '✕', '△', '▲']: # 許容される出欠の文字
             session_data['出欠'] = attendee_status
             # 修正: Config.SESSION_DATA_KEY を削除
-            set_user_session_data(user_id, session_data)
-            SessionState.set_state(user_id, SessionState.ASKING_ATTENDEE_NOTES)
+            set_user_session(user_id, SessionState.ASKING_ATTENDEE_NOTES, session_data)
             print(f"DEBUG: User {user_id} entered status: {message_text}. Next state: ASKING_ATTENDEE_NOTES.")
             line_bot_api_messaging.reply_message(
                 ReplyMessageRequest(
@@ -413,8 +416,7 @@ def process_attendee_registration_step(user_id, message_text, reply_token, line_
     elif current_state == SessionState.ASKING_ATTENDEE_NOTES:
         session_data['備考'] = message_text
         # 修正: Config.SESSION_DATA_KEY を削除
-        set_user_session_data(user_id, session_data)
-        SessionState.set_state(user_id, SessionState.ASKING_CONFIRM_ATTENDEE_REGISTRATION)
+        set_user_session(user_id, SessionState.ASKING_CONFIRM_ATTENDEE_REGISTRATION, session_data)
         print(f"DEBUG: User {user_id} entered notes: {message_text}. Next state: ASKING_CONFIRM_ATTENDEE_REGISTRATION.")
 
         confirm_message = "以下の内容で参加予定を登録します。よろしいですか？\n"
@@ -451,15 +453,13 @@ def process_attendee_registration_step(user_id, message_text, reply_token, line_
 
             if success:
                 reply_message = "参加予定を登録しました。\n他に登録したい参加予定はありますか？（はい/いいえ）"
-                SessionState.set_state(user_id, SessionState.ASKING_FOR_ANOTHER_ATTENDEE_REGISTRATION)
+                set_user_session(user_id, SessionState.ASKING_FOR_ANOTHER_ATTENDEE_REGISTRATION, None)
                 print(f"DEBUG: Attendee registration for {user_id} successful.")
             else:
                 reply_message = f"参加予定の登録に失敗しました。{msg} 最初からやり直してください。"
-                SessionState.set_state(user_id, SessionState.NONE)
+                set_user_session(user_id, SessionState.NONE, None)
                 print(f"ERROR: Attendee registration for {user_id} failed: {msg}")
 
-            # 修正: Config.SESSION_DATA_KEY を削除
-            delete_user_session_data(user_id)
             line_bot_api_messaging.reply_message(
                 ReplyMessageRequest(
                     reply_token=reply_token,
@@ -471,9 +471,8 @@ def process_attendee_registration_step(user_id, message_text, reply_token, line_
                 )
             )
         else:
-            SessionState.set_state(user_id, SessionState.NONE)
+            set_user_session(user_id, SessionState.NONE, None)
             # 修正: Config.SESSION_DATA_KEY を削除
-            delete_user_session_data(user_id)
             print(f"DEBUG: User {user_id} cancelled registration.")
             line_bot_api_messaging.reply_message(
                 ReplyMessageRequest(
@@ -486,9 +485,8 @@ def process_attendee_registration_step(user_id, message_text, reply_token, line_
         if message_text.lower() == 'はい':
             start_attendee_registration(user_id, reply_token, line_bot_api_messaging)
         else:
-            SessionState.set_state(user_id, SessionState.NONE)
+            set_user_session(user_id, SessionState.NONE, None)
             # 修正: Config.SESSION_DATA_KEY を削除
-            delete_user_session_data(user_id)
             line_bot_api_messaging.reply_message(
                 ReplyMessageRequest(
                     reply_token=reply_token,
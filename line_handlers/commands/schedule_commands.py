@@ -4,15 +4,15 @@ from linebot.v3.messaging import MessagingApi, ReplyMessageRequest, TextMessage,
 from linebot.v3.messaging.models import MessageAction, PostbackAction
 
 from config import Config, SessionState
-from google_sheets.utils import get_all_records, add_schedule, update_schedule, delete_schedule_by_date_title
-from utils.session_manager import get_user_session_data, set_user_session_data, delete_user_session_data
+from google_sheets.utils import get_all_records, get_data_version, add_schedule, update_schedule, delete_schedule_by_date_title
+from line_handlers import list_pagination
+from utils.session_manager import set_user_session, set_user_session_data
 
 
 def start_schedule_registration(user_id, reply_token, line_bot_api_messaging: MessagingApi):
     print(f"DEBUG: start_schedule_registration called for user_id: {user_id}")
-    SessionState.set_state(user_id, SessionState.ASKING_SCHEDULE_DATE)
+    set_user_session(user_id, SessionState.ASKING_SCHEDULE_DATE, {})  # セッションデータを初期化
     # 修正: Config.SESSION_DATA_KEY を削除
-    set_user_session_data(user_id, {})  # セッションデータを初期化
     line_bot_api_messaging.reply_message(
         ReplyMessageRequest(
             reply_token=reply_token,
@@ -20,11 +20,11 @@ def start_schedule_registration(user_id, reply_token, line_bot_api_messaging: Me
         )
     )
 
-def process_schedule_registration_step(user_id, message_text, reply_token, line_bot_api_messaging: MessagingApi):
+def process_schedule_registration_step(user_id, message_text, reply_token, line_bot_api_messaging: MessagingApi, current_state, session_data):
     print(f"DEBUG: process_schedule_registration_step called for user_id: {user_id}, message: {message_text}")
-    current_state = SessionState.get_state(user_id)
-    # 修正: Config.SESSION_DATA_KEY を削除
-    session_data = get_user_session_data(user_id) or {}
+    # 会話状態とセッションデータは message_processors.py が1回の参照で取得したものを受け取る
+    session_data = session_data or {}
+    next_state = current_state # 処理の最後に、次の状態とセッションデータをまとめて保存する
     messages = []
 
     if current_state == SessionState.ASKING_SCHEDULE_DATE:
@@ -33,7 +33,7 @@ def process_schedule_registration_step(user_id, message_text, reply_token, line_
             if not pd.isna(message_text):
                 date_obj = pd.to_datetime(message_text)
                 session_data['日付'] = date_obj.strftime('%Y/%m/%d')
-                SessionState.set_state(user_id, SessionState.ASKING_SCHEDULE_START_TIME)
+                next_state = SessionState.ASKING_SCHEDULE_START_TIME
                 messages.append(TextMessage(text="開始時刻をHH:MM形式で入力してください。（例: 10:00, 22:30）\nない場合は「なし」と入力してください。"))
             else:
                 raise ValueError("Date cannot be empty.")
@@ -42,13 +42,13 @@ def process_schedule_registration_step(user_id, message_text, reply_token, line_
     elif current_state == SessionState.ASKING_SCHEDULE_START_TIME:
         if message_text.lower() == 'なし' or pd.isna(message_text):
             session_data['開始時刻'] = 'なし'
-            SessionState.set_state(user_id, SessionState.ASKING_SCHEDULE_TITLE)
+            next_state = SessionState.ASKING_SCHEDULE_TITLE
             messages.append(TextMessage(text="次に、スケジュールのタイトルを入力してください。"))
         else:
             # 時刻の正規表現チェック
             if re.fullmatch(r'([01]?[0-9]|2[0-3]):[0-5][0-9]', message_text):
                 session_data['開始時刻'] = message_text
-                SessionState.set_state(user_id, SessionState.ASKING_SCHEDULE_TITLE)
+                next_state = SessionState.ASKING_SCHEDULE_TITLE
                 messages.append(TextMessage(text="次に、スケジュールのタイトルを入力してください。"))
             else:
                 messages.append(TextMessage(text="時刻の形式が正しくありません。HH:MM形式で入力してください。（例: 10:00, 22:30）\nない場合は「なし」と入力してください。"))
@@ -80,7 +80,7 @@ def process_schedule_registration_step(user_id, message_text, reply_token, line_
                     duplicate_entry = pd.DataFrame() # 重複なしとする
 
                 if not duplicate_entry.empty:
-                    SessionState.set_state(user_id, SessionState.ASKING_CONTINUE_ON_DUPLICATE_SCHEDULE)
+                    set_user_session(user_id, SessionState.ASKING_CONTINUE_ON_DUPLICATE_SCHEDULE, session_data)
                     messages.append(TextMessage(
                         text=f"「{session_data['日付']}」の「{session_data['タイトル']}」は既に登録されています。\n"
                              f"この内容で上書きしますか？（はい/いいえ）",
@@ -99,19 +99,18 @@ def process_schedule_registration_step(user_id, message_text, reply_token, line_
                     return # ここでreturnして重複確認の返答を待つ
 
             # 重複がなければ次の状態へ
-            SessionState.set_state(user_id, SessionState.ASKING_SCHEDULE_LOCATION)
+            next_state = SessionState.ASKING_SCHEDULE_LOCATION
             messages.append(TextMessage(text="次に、開催場所を入力してください。（ない場合は「なし」）"))
 
     elif current_state == SessionState.ASKING_CONTINUE_ON_DUPLICATE_SCHEDULE:
         if message_text.lower() == 'はい':
             # ユーザーが上書きを承諾
-            SessionState.set_state(user_id, SessionState.ASKING_SCHEDULE_LOCATION)
+            next_state = SessionState.ASKING_SCHEDULE_LOCATION
             messages.append(TextMessage(text="開催場所を入力してください。（ない場合は「なし」）"))
         else: # いいえ、またはその他の入力
             # 登録を中止しセッションをリセット
-            SessionState.set_state(user_id, SessionState.NONE)
+            set_user_session(user_id, SessionState.NONE, None)
             # 修正: Config.SESSION_DATA_KEY を削除
-            delete_user_session_data(user_id)
             messages.append(TextMessage(text="スケジュール登録を中止しました。"))
             line_bot_api_messaging.reply_message(
                 ReplyMessageRequest(
@@ -123,16 +122,16 @@ def process_schedule_registration_step(user_id, message_text, reply_token, line_
 
     elif current_state == SessionState.ASKING_SCHEDULE_LOCATION:
         session_data['開催場所'] = message_text.strip() if not pd.isna(message_text) else 'なし'
-        SessionState.set_state(user_id, SessionState.ASKING_SCHEDULE_DETAIL)
+        next_state = SessionState.ASKING_SCHEDULE_DETAIL
         messages.append(TextMessage(text="次に、詳細情報を入力してください。（ない場合は「なし」）"))
     elif current_state == SessionState.ASKING_SCHEDULE_DETAIL:
         session_data['詳細'] = message_text.strip() if not pd.isna(message_text) else 'なし'
-        SessionState.set_state(user_id, SessionState.ASKING_SCHEDULE_DEADLINE)
+        next_state = SessionState.ASKING_SCHEDULE_DEADLINE
         messages.append(TextMessage(text="次に、申込締切日をYYYY/MM/DD形式で入力してください。（ない場合は「なし」）\n例: 2025/06/01"))
     elif current_state == SessionState.ASKING_SCHEDULE_DEADLINE:
         if message_text.lower() == 'なし' or pd.isna(message_text):
             session_data['申込締切日'] = 'なし'
-            SessionState.set_state(user_id, SessionState.ASKING_SCHEDULE_SCALE)
+            next_state = SessionState.ASKING_SCHEDULE_SCALE
             messages.append(TextMessage(text="次に、規模を入力してください。（例: 100名、50人以下など。ない場合は「なし」）"))
         else:
             try:
@@ -140,7 +139,7 @@ def process_schedule_registration_step(user_id, message_text, reply_token, line_
                 if not pd.isna(message_text):
                     deadline_obj = pd.to_datetime(message_text)
                     session_data['申込締切日'] = deadline_obj.strftime('%Y/%m/%d')
-                    SessionState.set_state(user_id, SessionState.ASKING_SCHEDULE_SCALE)
+                    next_state = SessionState.ASKING_SCHEDULE_SCALE
                     messages.append(TextMessage(text="次に、規模を入力してください。（例: 100名、50人以下など。ない場合は「なし」）"))
                 else:
                     raise ValueError("Deadline cannot be empty.")
@@ -159,12 +158,11 @@ def process_schedule_registration_step(user_id, message_text, reply_token, line_
                                             QuickReplyItem(action=MessageAction(label="はい", text="はい")),
                                             QuickReplyItem(action=MessageAction(label="いいえ", text="いいえ"))
                                         ])))
-            SessionState.set_state(user_id, SessionState.ASKING_FOR_ANOTHER_SCHEDULE_REGISTRATION)
+            next_state = SessionState.ASKING_FOR_ANOTHER_SCHEDULE_REGISTRATION
         else:
             messages.append(TextMessage(text=f"スケジュールの登録に失敗しました: {msg}\n最初からやり直してください。"))
-            SessionState.set_state(user_id, SessionState.NONE)
+            next_state, session_data = SessionState.NONE, None
             # 修正: Config.SESSION_DATA_KEY を削除
-            delete_user_session_data(user_id)
 
     # 状態がASKING_FOR_ANOTHER_SCHEDULE_REGISTRATIONの時に'はい'/'いいえ'を処理するロジック
     elif current_state == SessionState.ASKING_FOR_ANOTHER_SCHEDULE_REGISTRATION:
@@ -173,12 +171,11 @@ def process_schedule_registration_step(user_id, message_text, reply_token, line_
             return # ここで処理を終了
         else:
             messages.append(TextMessage(text="スケジュール登録を終了します。"))
-            SessionState.set_state(user_id, SessionState.NONE)
+            next_state, session_data = SessionState.NONE, None
             # 修正: Config.SESSION_DATA_KEY を削除
-            delete_user_session_data(user_id)
 
     # 修正: Config.SESSION_DATA_KEY を削除
-    set_user_session_data(user_id, session_data) # 現在のセッションデータを保存
+    set_user_session(user_id, next_state, session_data) # 次の状態と現在のセッションデータを1回の操作で保存
 
     if messages:
         line_bot_api_messaging.reply_message(
@@ -189,51 +186,83 @@ def process_schedule_registration_step(user_id, message_text, reply_token, line_
         )
 
 
-def list_schedules(user_id, reply_token, line_bot_api_messaging: MessagingApi):
-    print(f"DEBUG: list_schedules called for user_id: {user_id}")
+def _format_schedule_entries(schedules_df: pd.DataFrame) -> list:
+    """
+    スケジュールを1件ずつ表示用の文字列に整形します。行ごとのループではなく列単位の文字列結合で組み立てます。
+    """
+    def column(name, default):
+        if name not in schedules_df.columns:
+            return pd.Series(default, index=schedules_df.index)
+        return schedules_df[name].astype(str)
+
+    date_str = schedules_df['日付'].dt.strftime('%Y/%m/%d').fillna('日付未定')
+    entries = (
+        "日付: " + date_str +
+        "\n開始時刻: " + column('開始時刻', 'なし') +
+        "\nタイトル: " + column('タイトル', 'タイトルなし') +
+        "\n開催場所: " + column('開催場所', 'なし') +
+        "\n詳細: " + column('詳細', 'なし') +
+        "\n申込締切日: " + column('申込締切日', 'なし') +
+        "\n規模: " + column('規模', 'なし') +
+        "\n--------------------\n"
+    )
+    return entries.tolist()
+
+
+def _render_schedules_page(offset: int) -> tuple:
+    """
+    スケジュール一覧の offset 件目からのページを組み立てます。
+    :return: (TextMessageのリスト, 次のページの開始位置。続きがなければ None)
+    """
     schedules_df = get_all_records(Config.GOOGLE_SHEETS_SCHEDULE_WORKSHEET_NAME)
 
-    if schedules_df.empty:
-        reply_message = "現在、登録されているスケジュールはありません。"
-        print("DEBUG: Schedule worksheet is empty.")
-    else:
+    if not schedules_df.empty:
         # '日付'カラムを datetime オブジェクトに変換し、変換できないものはNaT (Not a Time) とする
         schedules_df['日付'] = pd.to_datetime(schedules_df['日付'], errors='coerce')
-        # 日付でソートし、日付がNaTのものを最後に持ってくる
-        schedules_df = schedules_df.sort_values(by='日付', ascending=True, na_position='last')
-
-        reply_message = "【今後のスケジュール一覧】\n\n"
-        for index, row in schedules_df.iterrows():
-            date_str = row['日付'].strftime('%Y/%m/%d') if pd.notna(row['日付']) else '日付未定'
-            start_time = row.get('開始時刻', 'なし')
-            title = row.get('タイトル', 'タイトルなし')
-            location = row.get('開催場所', 'なし')
-            detail = row.get('詳細', 'なし')
-            deadline = row.get('申込締切日', 'なし')
-            scale = row.get('規模', 'なし')
-
-            reply_message += f"日付: {date_str}\n"
-            reply_message += f"開始時刻: {start_time}\n"
-            reply_message += f"タイトル: {title}\n"
-            reply_message += f"開催場所: {location}\n"
-            reply_message += f"詳細: {detail}\n"
-            reply_message += f"申込締切日: {deadline}\n"
-            reply_message += f"規模: {scale}\n"
-            reply_message += "--------------------\n"
-        print(f"DEBUG: Successfully prepared {len(schedules_df)} schedules.")
+        # 終了したスケジュールは表示しない（日付未定のものは残す）
+        today = pd.Timestamp.now().normalize()
+        schedules_df = schedules_df[schedules_df['日付'].isna() | (schedules_df['日付'] >= today)]
 
+    if schedules_df.empty:
+        print("DEBUG: No upcoming schedules.")
+        return [TextMessage(text="現在、登録されているスケジュールはありません。")], None
+
+    # 日付でソートし、日付がNaTのものを最後に持ってくる
+    schedules_df = schedules_df.sort_values(by='日付', ascending=True, na_position='last')
+    entries = _format_schedule_entries(schedules_df)
+    messages, next_offset = list_pagination.build_page_messages("【今後のスケジュール一覧】\n\n", entries, offset)
+    print(f"DEBUG: Successfully prepared {len(entries)} schedules (next offset: {next_offset}).")
+    return messages, next_offset
+
+
+def list_schedules(user_id, reply_token, line_bot_api_messaging: MessagingApi, offset: int = 0):
+    """
+    今日以降のスケジュール（日付未定を含む）を日付順に表示します。
+    1回の返信に収まらない場合は「次へ」で続きを表示します。
+    スケジュールシートが変わっていなければ、組み立て済みのページを使い回します。
+    :param offset: 表示を始める位置（「次へ」で続きを表示する場合）
+    """
+    print(f"DEBUG: list_schedules called for user_id: {user_id}, offset: {offset}")
+    # 版は一覧を読み込む前に取得する（読み込み中に書き込まれた場合は、次回に組み立て直される）
+    version = list_pagination.render_version(get_data_version(Config.GOOGLE_SHEETS_SCHEDULE_WORKSHEET_NAME))
+    page = list_pagination.get_rendered_page('schedules', version, offset)
+    if page is None:
+        page = _render_schedules_page(offset)
+        list_pagination.store_rendered_page('schedules', version, offset, *page)
+    messages, next_offset = page
+
+    list_pagination.save_cursor(user_id, 'schedules', next_offset)
     line_bot_api_messaging.reply_message(
         ReplyMessageRequest(
             reply_token=reply_token,
-            messages=[TextMessage(text=reply_message)]
+            messages=messages
         )
     )
 
 def start_schedule_edit(user_id, reply_token, line_bot_api_messaging: MessagingApi):
     print(f"DEBUG: start_schedule_edit called for user_id: {user_id}")
-    SessionState.set_state(user_id, SessionState.ASKING_SCHEDULE_EDIT_DATE)
+    set_user_session(user_id, SessionState.ASKING_SCHEDULE_EDIT_DATE, {})  # セッションデータを初期化
     # 修正: Config.SESSION_DATA_KEY を削除
-    set_user_session_data(user_id, {})  # セッションデータを初期化
     line_bot_api_messaging.reply_message(
         ReplyMessageRequest(
             reply_token=reply_token,
@@ -241,18 +270,18 @@ def start_schedule_edit(user_id, reply_token, line_bot_api_messaging: MessagingA
         )
     )
 
-def process_schedule_edit_step(user_id, message_text, reply_token, line_bot_api_messaging: MessagingApi):
+def process_schedule_edit_step(user_id, message_text, reply_token, line_bot_api_messaging: MessagingApi, current_state, session_data):
     print(f"DEBUG: process_schedule_edit_step called for user_id: {user_id}, message: {message_text}")
-    current_state = SessionState.get_state(user_id)
-    # 修正: Config.SESSION_DATA_KEY を削除
-    session_data = get_user_session_data(user_id) or {}
+    # 会話状態とセッションデータは message_processors.py が1回の参照で取得したものを受け取る
+    session_data = session_data or {}
+    next_state = current_state # 処理の最後に、次の状態とセッションデータをまとめて保存する
     messages = []
 
     if current_state == SessionState.ASKING_SCHEDULE_EDIT_DATE:
         try:
             pd.to_datetime(message_text, errors='raise') # 日付として有効かチェック
             session_data['編集対象日付'] = message_text
-            SessionState.set_state(user_id, SessionState.ASKING_SCHEDULE_EDIT_TITLE)
+            next_state = SessionState.ASKING_SCHEDULE_EDIT_TITLE
             messages.append(TextMessage(text="次に、編集したいスケジュールの**タイトル**を入力してください。"))
         except ValueError:
             messages.append(TextMessage(text="日付の形式が正しくありません。YYYY/MM/DD形式で入力してください。\n例: 2025/06/15"))
@@ -278,7 +307,7 @@ def process_schedule_edit_step(user_id, message_text, reply_token, line_bot_api_
         if not matching_schedules.empty:
             # 該当するスケジュールが見つかった場合、どの項目を編集するか尋ねる
             session_data['既存データ'] = matching_schedules.iloc[0].to_dict() # 既存データをセッションに保存
-            SessionState.set_state(user_id, SessionState.ASKING_SCHEDULE_EDIT_FIELD)
+            next_state = SessionState.ASKING_SCHEDULE_EDIT_FIELD
             quick_reply_items = [
                 QuickReplyItem(action=MessageAction(label="日付", text="日付")),
                 QuickReplyItem(action=MessageAction(label="開始時刻", text="開始時刻")),
@@ -291,21 +320,19 @@ def process_schedule_edit_step(user_id, message_text, reply_token, line_bot_api_
             ]
             messages.append(TextMessage(text="どの項目を編集しますか？", quick_reply=QuickReply(items=quick_reply_items)))
         else:
-            SessionState.set_state(user_id, SessionState.NONE)
+            next_state, session_data = SessionState.NONE, None
             # 修正: Config.SESSION_DATA_KEY を削除
-            delete_user_session_data(user_id)
             messages.append(TextMessage(text="指定されたスケジュールは見つかりませんでした。\n最初からやり直してください。"))
 
     elif current_state == SessionState.ASKING_SCHEDULE_EDIT_FIELD:
         editable_fields = ["日付", "開始時刻", "タイトル", "開催場所", "詳細", "申込締切日", "規模"]
         if message_text == "終了":
-            SessionState.set_state(user_id, SessionState.NONE)
+            next_state, session_data = SessionState.NONE, None
             # 修正: Config.SESSION_DATA_KEY を削除
-            delete_user_session_data(user_id)
             messages.append(TextMessage(text="スケジュール編集を終了します。"))
         elif message_text in editable_fields:
             session_data['編集フィールド'] = message_text
-            SessionState.set_state(user_id, SessionState.ASKING_SCHEDULE_EDIT_NEW_VALUE)
+            next_state = SessionState.ASKING_SCHEDULE_EDIT_NEW_VALUE
             messages.append(TextMessage(text=f"「{message_text}」の新しい値を入力してください。"))
         else:
             messages.append(TextMessage(text="無効な項目です。リストから選択するか、「終了」と入力してください。"))
@@ -332,9 +359,8 @@ def process_schedule_edit_step(user_id, message_text, reply_token, line_bot_api_
                                                 QuickReplyItem(action=MessageAction(label="規模", text="規模")),
                                                 QuickReplyItem(action=MessageAction(label="終了", text="終了"))
                                             ])))
-                SessionState.set_state(user_id, SessionState.ASKING_SCHEDULE_EDIT_FIELD) # 項目選択に戻す
+                set_user_session(user_id, SessionState.ASKING_SCHEDULE_EDIT_FIELD, session_data) # 項目選択に戻す（セッションはクリアしない）
                 # 修正: Config.SESSION_DATA_KEY を削除
-                set_user_session_data(user_id, session_data) # セッションはクリアしない
                 line_bot_api_messaging.reply_message(
                     ReplyMessageRequest(
                         reply_token=reply_token,
@@ -355,9 +381,8 @@ def process_schedule_edit_step(user_id, message_text, reply_token, line_bot_api_
                                                 QuickReplyItem(action=MessageAction(label="規模", text="規模")),
                                                 QuickReplyItem(action=MessageAction(label="終了", text="終了"))
                                             ])))
-                SessionState.set_state(user_id, SessionState.ASKING_SCHEDULE_EDIT_FIELD) # 項目選択に戻す
+                set_user_session(user_id, SessionState.ASKING_SCHEDULE_EDIT_FIELD, session_data) # 項目選択に戻す（セッションはクリアしない）
                 # 修正: Config.SESSION_DATA_KEY を削除
-                set_user_session_data(user_id, session_data) # セッションはクリアしない
                 line_bot_api_messaging.reply_message(
                     ReplyMessageRequest(
                         reply_token=reply_token,
@@ -381,7 +406,7 @@ def process_schedule_edit_step(user_id, message_text, reply_token, line_bot_api_
                                             QuickReplyItem(action=MessageAction(label="はい", text="はい")),
                                             QuickReplyItem(action=MessageAction(label="いいえ", text="いいえ"))
                                         ])))
-            SessionState.set_state(user_id, SessionState.ASKING_FOR_ANOTHER_SCHEDULE_EDIT)
+            next_state = SessionState.ASKING_FOR_ANOTHER_SCHEDULE_EDIT
             # 編集が成功した場合、セッションの編集対象日付とタイトルを更新しておく
             if field_to_edit == "日付":
                 session_data['編集対象日付'] = new_value
@@ -389,14 +414,13 @@ def process_schedule_edit_step(user_id, message_text, reply_token, line_bot_api_
                 session_data['編集対象タイトル'] = new_value
         else:
             messages.append(TextMessage(text=f"更新に失敗しました: {msg}\n最初からやり直してください。"))
-            SessionState.set_state(user_id, SessionState.NONE)
+            next_state, session_data = SessionState.NONE, None
             # 修正: Config.SESSION_DATA_KEY を削除
-            delete_user_session_data(user_id)
 
     elif current_state == SessionState.ASKING_FOR_ANOTHER_SCHEDULE_EDIT:
         if message_text.lower() == 'はい':
             # 別の項目を編集する場合、再度項目選択に戻る
-            SessionState.set_state(user_id, SessionState.ASKING_SCHEDULE_EDIT_FIELD)
+            next_state = SessionState.ASKING_SCHEDULE_EDIT_FIELD
             quick_reply_items = [
                 QuickReplyItem(action=MessageAction(label="日付", text="日付")),
                 QuickReplyItem(action=MessageAction(label="開始時刻", text="開始時刻")),
@@ -409,13 +433,12 @@ def process_schedule_edit_step(user_id, message_text, reply_token, line_bot_api_
             ]
             messages.append(TextMessage(text="他に編集したい項目はありますか？", quick_reply=QuickReply(items=quick_reply_items)))
         else:
-            SessionState.set_state(user_id, SessionState.NONE)
+            next_state, session_data = SessionState.NONE, None
             # 修正: Config.SESSION_DATA_KEY を削除
-            delete_user_session_data(user_id)
             messages.append(TextMessage(text="スケジュール編集を終了します。"))
 
     # 修正: Config.SESSION_DATA_KEY を削除
-    set_user_session_data(user_id, session_data) # 現在のセッションデータを保存
+    set_user_session(user_id, next_state, session_data) # 次の状態と現在のセッションデータを1回の操作で保存
 
     if messages:
         line_bot_api_messaging.reply_message(
@@ -427,9 +450,8 @@ def process_schedule_edit_step(user_id, message_text, reply_token, line_bot_api_
 
 def start_schedule_deletion(user_id, reply_token, line_bot_api_messaging: MessagingApi):
     print(f"DEBUG: start_schedule_deletion called for user_id: {user_id}")
-    SessionState.set_state(user_id, SessionState.ASKING_SCHEDULE_DELETE_DATE)
+    set_user_session(user_id, SessionState.ASKING_SCHEDULE_DELETE_DATE, {})
     # 修正: Config.SESSION_DATA_KEY を削除
-    set_user_session_data(user_id, {})
     line_bot_api_messaging.reply_message(
         ReplyMessageRequest(
             reply_token=reply_token,
@@ -437,18 +459,18 @@ def start_schedule_deletion(user_id, reply_token, line_bot_api_messaging: Messag
         )
     )
 
-def process_schedule_deletion_step(user_id, message_text, reply_token, line_bot_api_messaging: MessagingApi):
+def process_schedule_deletion_step(user_id, message_text, reply_token, line_bot_api_messaging: MessagingApi, current_state, session_data):
     print(f"DEBUG: process_schedule_deletion_step called for user_id: {user_id}, message: {message_text}")
-    current_state = SessionState.get_state(user_id)
-    # 修正: Config.SESSION_DATA_KEY を削除
-    session_data = get_user_session_data(user_id) or {}
+    # 会話状態とセッションデータは message_processors.py が1回の参照で取得したものを受け取る
+    session_data = session_data or {}
+    next_state = current_state # 処理の最後に、次の状態とセッションデータをまとめて保存する
     messages = []
 
     if current_state == SessionState.ASKING_SCHEDULE_DELETE_DATE:
         try:
             pd.to_datetime(message_text, errors='raise')
             session_data['削除対象日付'] = message_text
-            SessionState.set_state(user_id, SessionState.ASKING_SCHEDULE_DELETE_TITLE)
+            next_state = SessionState.ASKING_SCHEDULE_DELETE_TITLE
             messages.append(TextMessage(text="次に、削除したいスケジュールの**タイトル**を入力してください。"))
         except ValueError:
             messages.append(TextMessage(text="日付の形式が正しくありません。YYYY/MM/DD形式で入力してください。\n例: 2025/06/15"))
@@ -472,7 +494,7 @@ def process_schedule_deletion_step(user_id, message_text, reply_token, line_bot_
             matching_schedules = pd.DataFrame() # 無効な日付の場合は一致なしとする
 
         if not matching_schedules.empty:
-            SessionState.set_state(user_id, SessionState.ASKING_CONFIRM_SCHEDULE_DELETE)
+            next_state = SessionState.ASKING_CONFIRM_SCHEDULE_DELETE
             messages.append(TextMessage(
                 text=f"「{session_data['削除対象日付']}」の「{session_data['削除対象タイトル']}」を削除します。よろしいですか？（はい/いいえ）",
                 quick_reply=QuickReply(items=[
@@ -481,9 +503,8 @@ def process_schedule_deletion_step(user_id, message_text, reply_token, line_bot_
                 ])
             ))
         else:
-            SessionState.set_state(user_id, SessionState.NONE)
+            next_state, session_data = SessionState.NONE, None
             # 修正: Config.SESSION_DATA_KEY を削除
-            delete_user_session_data(user_id)
             messages.append(TextMessage(text="指定されたスケジュールは見つかりませんでした。\n最初からやり直してください。"))
 
     elif current_state == SessionState.ASKING_CONFIRM_SCHEDULE_DELETE:
@@ -500,21 +521,19 @@ def process_schedule_deletion_step(user_id, message_text, reply_token, line_bot_
                                                 QuickReplyItem(action=MessageAction(label="はい", text="はい")),
                                                 QuickReplyItem(action=MessageAction(label="いいえ", text="いいえ"))
                                             ])))
-                SessionState.set_state(user_id, SessionState.ASKING_FOR_NEXT_SCHEDULE_DELETION)
+                next_state = SessionState.ASKING_FOR_NEXT_SCHEDULE_DELETION
             else:
                 messages.append(TextMessage(text=f"スケジュールの削除に失敗しました: {msg}\n最初からやり直してください。"))
-                SessionState.set_state(user_id, SessionState.NONE)
+                next_state, session_data = SessionState.NONE, None
                 # 修正: Config.SESSION_DATA_KEY を削除
-                delete_user_session_data(user_id)
         else: # いいえ、またはその他の入力
             messages.append(TextMessage(text="スケジュール削除を中止しました。\n他に削除したい予定はありますか？（はい/いいえ）",
                                         quick_reply=QuickReply(items=[
                                             QuickReplyItem(action=MessageAction(label="はい", text="はい")),
                                             QuickReplyItem(action=MessageAction(label="いいえ", text="いいえ"))
                                         ])))
-            SessionState.set_state(user_id, SessionState.ASKING_FOR_NEXT_SCHEDULE_DELETION)
+            next_state, session_data = SessionState.ASKING_FOR_NEXT_SCHEDULE_DELETION, None # セッションデータは一度クリア
             # 修正: Config.SESSION_DATA_KEY を削除
-            delete_user_session_data(user_id) # セッションデータは一度クリア
 
     elif current_state == SessionState.ASKING_FOR_NEXT_SCHEDULE_DELETION:
         if message_text.lower() == 'はい':
@@ -522,12 +541,11 @@ def process_schedule_deletion_step(user_id, message_text, reply_token, line_bot_
             return
         else:
             messages.append(TextMessage(text="スケジュール削除を終了します。"))
-            SessionState.set_state(user_id, SessionState.NONE)
+            next_state, session_data = SessionState.NONE, None
             # 修正: Config.SESSION_DATA_KEY を削除
-            delete_user_session_data(user_id)
 
     # 修正: Config.SESSION_DATA_KEY を削除
-    set_user_session_data(user_id, session_data) # 現在のセッションデータを保存
+    set_user_session(user_id, next_state, session_data) # 次の状態と現在のセッションデータを1回の操作で保存
 
     if messages:
         line_bot_api_messaging.reply_message(
@@ -0,0 +1,128 @@
+import threading
+from datetime import date
+
+from linebot.v3.messaging import TextMessage, QuickReply, QuickReplyItem
+from linebot.v3.messaging.models import MessageAction
+
+from config import Config
+from utils.session_manager import get_user_session_data, set_user_session_data, delete_user_session_data
+
+# 一覧表示（スケジュール一覧・参加者一覧）のページ分割
+# 1件ずつ整形済みの文字列を受け取り、1回の返信（最大5メッセージ、1メッセージ最大5000文字）に収まる分だけを詰めて返す。
+# 続きがある場合は「次へ」のクイックリプライを付け、どこまで表示したか（カーソル）をセッションデータに保存する。
+
+MAX_MESSAGES_PER_REPLY = 5 # LINEの1回の返信で送れるメッセージ数の上限
+MAX_TEXT_LENGTH = 5000 # LINEのテキストメッセージ1件の文字数の上限
+NEXT_PAGE_COMMAND = '次へ'
+
+_CURSOR_KEY = '一覧カーソル' # セッションデータ上のカーソルのキー
+
+# 組み立て済みのページ（返信メッセージ）のキャッシュ
+# 一覧の内容はワークシートの版番号（google_sheets.utils.get_data_version）と、「今日以降」の絞り込みに使う日付で決まるため、
+# これらが変わらない間は同じページを組み立て直さずに使い回す。
+# ページはユーザーに依存しないため、全ユーザーで共有する。
+_render_lock = threading.Lock()
+_rendered_pages = {} # {(一覧の名前, 開始位置): (版, メッセージのリスト, 次のページの開始位置)}
+_render_stats = {'hits': 0, 'misses': 0}
+
+
+def build_page_messages(header: str, entries: list, offset: int = 0) -> tuple:
+    """
+    一覧の offset 件目から、1回の返信に収まるだけのメッセージを組み立てます。
+    :param header: 1通目の先頭に付ける見出し
+    :param entries: 1件ずつ整形済みの文字列のリスト
+    :param offset: 表示を始める位置
+    :return: (TextMessageのリスト, 次のページの開始位置。続きがなければ None)
+    """
+    page_end = min(offset + Config.LIST_PAGE_SIZE, len(entries))
+    footer_reserve = 100 # 続きがある場合の案内文の分を空けておく
+
+    texts = []
+    current = [header]
+    length = len(header)
+    position = offset
+    while position < page_end:
+        entry = entries[position][:MAX_TEXT_LENGTH - footer_reserve] # 1件で上限を超えるものは切り詰める
+        if length + len(entry) > MAX_TEXT_LENGTH - footer_reserve:
+            if len(texts) + 1 >= MAX_MESSAGES_PER_REPLY:
+                break # これ以上メッセージを増やせないので、残りは次のページへ
+            texts.append(''.join(current))
+            current = []
+            length = 0
+        current.append(entry)
+        length += len(entry)
+        position += 1
+
+    next_offset = position if position < len(entries) else None
+    if next_offset is not None:
+        current.append(f"（{position}/{len(entries)}件を表示）\n続きは「{NEXT_PAGE_COMMAND}」で表示します。")
+    texts.append(''.join(current))
+
+    messages = [TextMessage(text=text) for text in texts]
+    if next_offset is not None:
+        messages[-1].quick_reply = QuickReply(items=[
+            QuickReplyItem(action=MessageAction(label=NEXT_PAGE_COMMAND, text=NEXT_PAGE_COMMAND))
+        ])
+    return messages, next_offset
+
+
+def render_version(*data_versions) -> tuple:
+    """
+    組み立て済みのページの版を返します。一覧の元になるワークシートの版番号と今日の日付の組です。
+    """
+    return data_versions + (date.today(),)
+
+
+def get_rendered_page(list_name: str, version: tuple, offset: int):
+    """
+    組み立て済みのページを返します。
+    :return: (メッセージのリスト, 次のページの開始位置)。キャッシュになければ、または版が異なれば None
+    """
+    with _render_lock:
+        cached = _rendered_pages.get((list_name, offset))
+        if cached is None or cached[0] != version:
+            _render_stats['misses'] += 1
+            return None
+        _render_stats['hits'] += 1
+        return cached[1], cached[2]
+
+
+def store_rendered_page(list_name: str, version: tuple, offset: int, messages: list, next_offset):
+    """
+    組み立てたページをキャッシュします。版が変わっていれば、同じ一覧の他のページは破棄します。
+    """
+    with _render_lock:
+        for key in [key for key, cached in _rendered_pages.items() if key[0] == list_name and cached[0] != version]:
+            del _rendered_pages[key]
+        _rendered_pages[(list_name, offset)] = (version, messages, next_offset)
+
+
+def get_render_cache_stats() -> dict:
+    """
+    組み立て済みのページのキャッシュの件数・ヒット数・ミス数を返します。（監視・デバッグ用）
+    """
+    with _render_lock:
+        return {'entries': len(_rendered_pages), **_render_stats}
+
+
+def save_cursor(user_id: str, list_name: str, next_offset):
+    """
+    一覧の次のページの開始位置を保存します。続きがない場合は保存済みのカーソルを削除します。
+    一覧の表示はどの会話フローにも属さない（状態なし）ため、セッションデータをカーソルの保存にだけ使う。
+    """
+    if next_offset is None:
+        if load_cursor(user_id) is not None:
+            delete_user_session_data(user_id)
+        return
+    set_user_session_data(user_id, {_CURSOR_KEY: {'list': list_name, 'offset': next_offset}})
+
+
+def load_cursor(user_id: str):
+    """
+    保存済みのカーソルを返します。
+    :return: {'list': 一覧の名前, 'offset': 次のページの開始位置}。なければ None
+    """
+    session_data = get_user_session_data(user_id)
+    if not session_data:
+        return None
+    return session_data.get(_CURSOR_KEY)
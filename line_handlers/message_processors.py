@@ -1,24 +1,164 @@
-import re
-from linebot.v3.messaging import Configuration, ApiClient, MessagingApi, ReplyMessageRequest, TextMessage
-from linebot.v3.webhooks import MessageEvent, TextMessageContent
+from linebot.v3.messaging import MessagingApi, ReplyMessageRequest, TextMessage
+from linebot.v3.webhooks import MessageEvent
 
 from config import Config, SessionState
+from google_sheets.rate_limiter import DeadlineExceededError
 from line_handlers.commands import (
-    general_commands,
     schedule_commands,
     attendance_commands
 )
+from line_handlers import list_pagination
 from line_handlers.qna import attendance_qna
-from utils.session_manager import get_user_session_data, set_user_session_data, delete_user_session_data
+from utils import event_context
+from utils.line_api_client import DeadlineAwareMessagingApi, get_messaging_api, send_interim_reply
+from utils.session_manager import get_user_session, delete_user_session_data
 
-# LINE Messaging APIクライアントの初期化
-configuration = Configuration(access_token=Config.LINE_CHANNEL_ACCESS_TOKEN)
-line_bot_api_messaging = MessagingApi(ApiClient(configuration))
+# LINE Messaging APIクライアント（main.py と共有する接続プール付きのクライアント）
+# 返信の期限を過ぎたイベントへの返信は、自動的にプッシュメッセージに切り替わる
+line_bot_api_messaging = DeadlineAwareMessagingApi(get_messaging_api())
 
-def process_message(event: MessageEvent):
+# 会話フロー名 → (途中の入力を処理する関数, キャンセル時の応答メッセージ)
+# 途中の入力を処理する関数はいずれも (user_id, message_text, reply_token, line_bot_api_messaging, 会話状態, セッションデータ) を受け取る
+_FLOWS = {
+    'schedule_registration': (schedule_commands.process_schedule_registration_step, "スケジュール登録をキャンセルしました。"),
+    'schedule_edit': (schedule_commands.process_schedule_edit_step, "スケジュール編集をキャンセルしました。"),
+    'schedule_deletion': (schedule_commands.process_schedule_deletion_step, "スケジュール削除をキャンセルしました。"),
+    'attendance_qna': (attendance_qna.handle_attendance_qa_response, "参加予定登録をキャンセルしました。"),
+    'attendee_registration': (attendance_commands.process_attendee_registration_step, "参加予定登録をキャンセルしました。"),
+    'attendee_edit': (attendance_commands.process_attendee_edit_step, "参加予定編集をキャンセルしました。"),
+}
+
+# 会話状態 → 会話フロー名
+# 状態ごとに明示的に登録するため、状態名の接頭辞の重なり（asking_schedule_ と asking_schedule_edit_ など）に影響されない
+_STATE_FLOWS = {
+    # スケジュール登録
+    SessionState.ASKING_SCHEDULE_DATE: 'schedule_registration',
+    SessionState.ASKING_SCHEDULE_START_TIME: 'schedule_registration',
+    SessionState.ASKING_SCHEDULE_TITLE: 'schedule_registration',
+    SessionState.ASKING_SCHEDULE_LOCATION: 'schedule_registration',
+    SessionState.ASKING_SCHEDULE_DETAIL: 'schedule_registration',
+    SessionState.ASKING_SCHEDULE_DEADLINE: 'schedule_registration',
+    SessionState.ASKING_SCHEDULE_SCALE: 'schedule_registration',
+    SessionState.ASKING_FOR_ANOTHER_SCHEDULE_REGISTRATION: 'schedule_registration',
+    SessionState.ASKING_CONTINUE_ON_DUPLICATE_SCHEDULE: 'schedule_registration',
+    # スケジュール編集
+    SessionState.ASKING_SCHEDULE_EDIT_DATE: 'schedule_edit',
+    SessionState.ASKING_SCHEDULE_EDIT_TITLE: 'schedule_edit',
+    SessionState.ASKING_SCHEDULE_EDIT_FIELD: 'schedule_edit',
+    SessionState.ASKING_SCHEDULE_EDIT_NEW_VALUE: 'schedule_edit',
+    SessionState.ASKING_FOR_ANOTHER_SCHEDULE_EDIT: 'schedule_edit',
+    # スケジュール削除
+    SessionState.ASKING_SCHEDULE_DELETE_DATE: 'schedule_deletion',
+    SessionState.ASKING_SCHEDULE_DELETE_TITLE: 'schedule_deletion',
+    SessionState.ASKING_CONFIRM_SCHEDULE_DELETE: 'schedule_deletion',
+    SessionState.ASKING_FOR_NEXT_SCHEDULE_DELETION: 'schedule_deletion',
+    # 参加予定登録Q&A
+    SessionState.ASKING_ATTENDANCE_STATUS: 'attendance_qna',
+    SessionState.ASKING_FOR_REMARKS_CONFIRMATION: 'attendance_qna',
+    SessionState.ASKING_ATTENDANCE_REMARKS: 'attendance_qna',
+    SessionState.ASKING_ATTENDEE_REGISTRATION_CONFIRMATION: 'attendance_qna',
+    # 参加予定登録
+    SessionState.ASKING_ATTENDEE_REGISTRATION_DATE: 'attendee_registration',
+    SessionState.ASKING_ATTENDEE_REGISTRATION_TITLE: 'attendee_registration',
+    SessionState.ASKING_ATTENDEE_STATUS: 'attendee_registration',
+    SessionState.ASKING_ATTENDEE_NOTES: 'attendee_registration',
+    SessionState.ASKING_CONFIRM_ATTENDEE_REGISTRATION: 'attendee_registration',
+    SessionState.ASKING_FOR_ANOTHER_ATTENDEE_REGISTRATION: 'attendee_registration',
+    # 参加予定編集
+    SessionState.ASKING_ATTENDEE_DATE: 'attendee_edit',
+    SessionState.ASKING_ATTENDEE_TITLE: 'attendee_edit',
+    SessionState.ASKING_ATTENDEE_CONFIRM_CANCEL: 'attendee_edit',
+    SessionState.ASKING_ATTENDEE_EDIT_NOTES: 'attendee_edit',
+    SessionState.ASKING_FOR_ANOTHER_ATTENDEE_EDIT: 'attendee_edit',
+}
+
+
+def _start_attendance_qa(user_id, reply_token, line_bot_api_messaging: MessagingApi):
+    """
+    参加予定登録Q&Aを開始します。Q&Aで使う表示名はLINEのプロフィールから取得します。
+    """
+    try:
+        user_display_name = line_bot_api_messaging.get_profile(user_id).display_name
+    except Exception as e:
+        print(f"WARNING: Failed to get profile for user {user_id}: {e}")
+        user_display_name = ''
+    attendance_qna.start_attendance_qa(user_id, user_display_name, reply_token, line_bot_api_messaging)
+
+
+# 「次へ」で続きを表示できる一覧の名前 → 一覧を表示する関数 (user_id, reply_token, line_bot_api_messaging, offset)
+_PAGINATED_LISTS = {
+    'schedules': schedule_commands.list_schedules,
+    'attendees': attendance_commands.list_attendees,
+}
+
+
+def _show_next_page(user_id, reply_token, line_bot_api_messaging: MessagingApi):
+    """
+    直前に表示した一覧の続き（次のページ）を表示します。
+    """
+    cursor = list_pagination.load_cursor(user_id)
+    list_handler = _PAGINATED_LISTS.get(cursor['list']) if cursor else None
+    if list_handler is None:
+        line_bot_api_messaging.reply_message(
+            ReplyMessageRequest(
+                reply_token=reply_token,
+                messages=[TextMessage(text="表示できる続きはありません。もう一度一覧を表示してください。")]
+            )
+        )
+        return
+    list_handler(user_id, reply_token, line_bot_api_messaging, offset=cursor['offset'])
+
+
+# コマンド → 新しい処理を開始する関数 (user_id, reply_token, line_bot_api_messaging)
+_COMMANDS = {
+    'スケジュール登録': schedule_commands.start_schedule_registration,
+    'スケジュール一覧': schedule_commands.list_schedules,
+    'スケジュール編集': schedule_commands.start_schedule_edit,
+    'スケジュール削除': schedule_commands.start_schedule_deletion,
+    '参加希望登録': _start_attendance_qa,
+    '参加予定一覧': attendance_commands.list_user_attendees,
+    '参加者一覧': attendance_commands.list_attendees,
+    '参加予定編集': attendance_commands.start_attendee_edit,
+    list_pagination.NEXT_PAGE_COMMAND: _show_next_page,
+}
+
+
+def _cancel_flow(user_id, reply_token, cancel_message: str):
+    """
+    会話フロー共通のキャンセル処理。状態とセッションデータを破棄して応答します。
+    """
+    SessionState.clear_state(user_id)
+    delete_user_session_data(user_id)
+    line_bot_api_messaging.reply_message(
+        ReplyMessageRequest(
+            reply_token=reply_token,
+            messages=[TextMessage(text=cancel_message)]
+        )
+    )
+
+
+def process_message(event: MessageEvent, received_at: float = None):
     """
     受信したメッセージイベントを処理し、適切なハンドラーにルーティングします。
+    会話の途中であれば状態に対応するフローへ、そうでなければコマンドに対応する処理へ、それぞれ辞書を1回引いて振り分けます。
+    会話がアイドル期間を過ぎて破棄されている場合（utils/session_store.py）は、状態なしとしてコマンドとして扱います。
+    :param received_at: Webhookを受信した時刻（time.monotonic 基準）。イベント全体の期限の起点になる。省略時は現在時刻
     """
+    # 返信の期限を過ぎても処理が続いている場合は「処理中」の返信を先に送り、結果はプッシュで届ける
+    with event_context.handling(event, on_reply_deadline=send_interim_reply, received_at=received_at):
+        try:
+            _route_message(event)
+        except DeadlineExceededError:
+            print(f"ERROR: Event deadline exceeded for user {event.source.user_id}.")
+            line_bot_api_messaging.reply_message(
+                ReplyMessageRequest(
+                    reply_token=event.reply_token,
+                    messages=[TextMessage(text="時間内に処理を完了できませんでした。しばらくしてからもう一度お試しください。")]
+                )
+            )
+
+
+def _route_message(event: MessageEvent):
     user_id = event.source.user_id
     message_text = event.message.text
     reply_token = event.reply_token
@@ -27,131 +167,34 @@ def process_message(event: MessageEvent):
     print(f"DEBUG: User ID: {user_id}")
     print(f"DEBUG: Received Message Text: '{message_text}' (Type: {type(message_text)})")
 
-    current_state = SessionState.get_state(user_id)
+    # 会話状態とセッションデータは session_manager から1回の参照で取得
+    current_state, session_data = get_user_session(user_id)
     print(f"DEBUG: Current Session State: {current_state}")
 
-    # セッションデータは session_manager から取得
-    session_data = get_user_session_data(user_id) # 修正箇所: SessionState.get_data を削除
-
     # 既存のセッション状態に基づいて処理を続行
-    if current_state != SessionState.NONE:
-        # スケジュール登録のフロー
-        if current_state.startswith("asking_schedule_"):
-            if message_text.lower() == 'キャンセル':
-                SessionState.clear_state(user_id)
-                delete_user_session_data(user_id) # 修正箇所: Config.SESSION_DATA_KEY を削除
-                line_bot_api_messaging.reply_message(
-                    ReplyMessageRequest(
-                        reply_token=reply_token,
-                        messages=[TextMessage(text="スケジュール登録をキャンセルしました。")]
-                    )
-                )
-                return
-            schedule_commands.process_schedule_registration_step(user_id, message_text, reply_token, line_bot_api_messaging)
-            return
-
-        # スケジュール編集のフロー
-        elif current_state.startswith("asking_schedule_edit_") or current_state == SessionState.ASKING_FOR_ANOTHER_SCHEDULE_EDIT:
-            if message_text.lower() == 'キャンセル':
-                SessionState.clear_state(user_id)
-                delete_user_session_data(user_id) # 修正箇所: Config.SESSION_DATA_KEY を削除
-                line_bot_api_messaging.reply_message(
-                    ReplyMessageRequest(
-                        reply_token=reply_token,
-                        messages=[TextMessage(text="スケジュール編集をキャンセルしました。")]
-                    )
-                )
-                return
-            schedule_commands.process_schedule_edit_step(user_id, message_text, reply_token, line_bot_api_messaging)
-            return
-
-        # スケジュール削除のフロー
-        elif current_state.startswith("asking_schedule_delete_") or current_state == SessionState.ASKING_FOR_NEXT_SCHEDULE_DELETION:
-            if message_text.lower() == 'キャンセル':
-                SessionState.clear_state(user_id)
-                delete_user_session_data(user_id) # 修正箇所: Config.SESSION_DATA_KEY を削除
-                line_bot_api_messaging.reply_message(
-                    ReplyMessageRequest(
-                        reply_token=reply_token,
-                        messages=[TextMessage(text="スケジュール削除をキャンセルしました。")]
-                    )
-                )
-                return
-            schedule_commands.process_schedule_deletion_step(user_id, message_text, reply_token, line_bot_api_messaging)
+    flow = _STATE_FLOWS.get(current_state)
+    if flow is not None:
+        step_handler, cancel_message = _FLOWS[flow]
+        if message_text.lower() == 'キャンセル':
+            _cancel_flow(user_id, reply_token, cancel_message)
             return
-
-        # 参加予定登録Q&Aのフロー (message_processors.py のみで使用される状態)
-        elif current_state == SessionState.ASKING_ATTENDEE_REGISTRATION_CONFIRMATION:
-            attendance_qna.process_attendance_qna_step(user_id, message_text, reply_token, line_bot_api_messaging)
-            return
-
-        # 参加予定登録フロー (attendance_commands.py が使用する状態)
-        elif current_state.startswith("asking_attendee_registration_") or current_state == SessionState.ASKING_FOR_ANOTHER_ATTENDEE_REGISTRATION:
-            if message_text.lower() == 'キャンセル':
-                SessionState.clear_state(user_id)
-                delete_user_session_data(user_id) # 修正箇所: Config.SESSION_DATA_KEY を削除
-                line_bot_api_messaging.reply_message(
-                    ReplyMessageRequest(
-                        reply_token=reply_token,
-                        messages=[TextMessage(text="参加予定登録をキャンセルしました。")]
-                    )
-                )
-                return
-            attendance_commands.process_attendee_registration_step(user_id, message_text, reply_token, line_bot_api_messaging)
-            return
-
-        # 参加予定編集フロー
-        elif current_state.startswith("asking_attendee_") or current_state == SessionState.ASKING_FOR_ANOTHER_ATTENDEE_EDIT:
-            if message_text.lower() == 'キャンセル':
-                SessionState.clear_state(user_id)
-                delete_user_session_data(user_id) # 修正箇所: Config.SESSION_DATA_KEY を削除
-                line_bot_api_messaging.reply_message(
-                    ReplyMessageRequest(
-                        reply_token=reply_token,
-                        messages=[TextMessage(text="参加予定編集をキャンセルしました。")]
-                    )
-                )
-                return
-            attendance_commands.process_attendee_edit_step(user_id, message_text, reply_token, line_bot_api_messaging)
-            return
-
+        step_handler(user_id, message_text, reply_token, line_bot_api_messaging, current_state, session_data)
+        return
+    if current_state != SessionState.NONE:
+        print(f"WARNING: No flow registered for state '{current_state}'. Handling message as a command.")
 
     # 新しいコマンドの開始
-    print(f"DEBUG: Current state is NONE for user {user_id}")
-    if message_text == 'スケジュール登録':
-        print(f"DEBUG: Calling start_schedule_registration")
-        schedule_commands.start_schedule_registration(user_id, reply_token, line_bot_api_messaging)
-    elif message_text == 'スケジュール一覧':
-        print(f"DEBUG: Calling list_schedules")
-        schedule_commands.list_schedules(user_id, reply_token, line_bot_api_messaging)
-    elif message_text == 'スケジュール編集':
-        print(f"DEBUG: Calling start_schedule_edit")
-        schedule_commands.start_schedule_edit(user_id, reply_token, line_bot_api_messaging)
-    elif message_text == 'スケジュール削除':
-        print(f"DEBUG: Calling start_schedule_deletion")
-        schedule_commands.start_schedule_deletion(user_id, reply_token, line_bot_api_messaging)
-    elif message_text == '参加希望登録':
-        print(f"DEBUG: Calling start_attendance_registration_qna")
-        attendance_qna.start_attendance_registration_qna(user_id, reply_token, line_bot_api_messaging)
-    elif message_text == '参加予定一覧':
-        print(f"DEBUG: Calling list_user_attendances")
-        attendance_commands.list_user_attendances(user_id, reply_token, line_bot_api_messaging)
-    elif message_text == '参加者一覧':
-        print(f"DEBUG: Calling list_all_attendees")
-        attendance_commands.list_all_attendees(user_id, reply_token, line_bot_api_messaging)
-    elif message_text == '参加予定編集':
-        print(f"DEBUG: Calling start_attendee_edit")
-        attendance_commands.start_attendee_edit(user_id, reply_token, line_bot_api_messaging)
-    elif message_text == 'ヘルプ':
-        print(f"DEBUG: Calling send_help_message")
-        general_commands.send_help_message(reply_token, line_bot_api_messaging)
-    else:
-        # どのコマンドにも該当しない場合、デフォルトメッセージを送信
-        print(f"DEBUG: Sending default reply message.")
-        line_bot_api_messaging.reply_message(
-            ReplyMessageRequest(
-                reply_token=reply_token,
-                messages=[TextMessage(text=Config.DEFAULT_REPLY_MESSAGE)]
-            )
-        )
+    command_handler = _COMMANDS.get(message_text)
+    if command_handler is not None:
+        print(f"DEBUG: Calling {command_handler.__name__}")
+        command_handler(user_id, reply_token, line_bot_api_messaging)
+        return
 
+    # どのコマンドにも該当しない場合、デフォルトメッセージを送信
+    print("DEBUG: Sending default reply message.")
+    line_bot_api_messaging.reply_message(
+        ReplyMessageRequest(
+            reply_token=reply_token,
+            messages=[TextMessage(text=Config.DEFAULT_REPLY_MESSAGE)]
+        )
+    )
@@ -11,14 +11,17 @@ from linebot.v3.messaging import (
 from linebot.v3.messaging.models import QuickReply, QuickReplyItem, MessageAction
 
 from config import Config, SessionState
-from google_sheets.utils import get_all_records, update_or_add_attendee, get_attendees_for_user
+from google_sheets.rate_limiter import DeadlineExceededError
+from google_sheets.utils import get_all_records_batch, update_or_add_attendee
 
-from utils.session_manager import get_user_session_data, set_user_session_data, delete_user_session_data
+from utils.session_manager import set_user_session
 
 
 def start_attendance_qa(user_id, user_display_name, reply_token, line_bot_api_messaging: MessagingApi):
     try:
-        all_meetings_df = get_all_records(Config.GOOGLE_SHEETS_SCHEDULE_WORKSHEET_NAME)
+        # スケジュールと参加者の両シートを1回のリクエストでまとめて読み込み、参加者はこのユーザーの行だけを取り出す
+        records = get_all_records_batch([Config.GOOGLE_SHEETS_SCHEDULE_WORKSHEET_NAME, Config.GOOGLE_SHEETS_ATTENDEES_WORKSHEET_NAME])
+        all_meetings_df = records[Config.GOOGLE_SHEETS_SCHEDULE_WORKSHEET_NAME]
 
         if all_meetings_df.empty:
             line_bot_api_messaging.reply_message(
@@ -28,13 +31,16 @@ def start_attendance_qa(user_id, user_display_name, reply_token, line_bot_api_me
                 )
             )
             # 修正: Config.SESSION_DATA_KEY を削除
-            delete_user_session_data(user_id)
-            SessionState.set_state(user_id, SessionState.NONE)
+            set_user_session(user_id, SessionState.NONE, None)
             return
 
         all_meetings_df['日付'] = pd.to_datetime(all_meetings_df['日付'], errors='coerce')
 
-        user_attendees = get_attendees_for_user(user_id)
+        attendees_df = records[Config.GOOGLE_SHEETS_ATTENDEES_WORKSHEET_NAME]
+        user_attendees = []
+        if not attendees_df.empty and '参加者ID' in attendees_df.columns:
+            user_rows = attendees_df[attendees_df['参加者ID'].astype(str) == str(user_id)]
+            user_attendees = user_rows[['タイトル', '日付']].values.tolist()
         processed_attended_events = set()
         for att in user_attendees:
             if len(att) >= 2:
@@ -68,8 +74,7 @@ def start_attendance_qa(user_id, user_display_name, reply_token, line_bot_api_me
                 )
             )
             # 修正: Config.SESSION_DATA_KEY を削除
-            delete_user_session_data(user_id)
-            SessionState.set_state(user_id, SessionState.NONE)
+            set_user_session(user_id, SessionState.NONE, None)
             return
 
         session_data = {
@@ -85,8 +90,7 @@ def start_attendance_qa(user_id, user_display_name, reply_token, line_bot_api_me
             }
         }
         # 修正: Config.SESSION_DATA_KEY を削除
-        set_user_session_data(user_id, session_data)
-        SessionState.set_state(user_id, SessionState.ASKING_ATTENDANCE_STATUS)
+        set_user_session(user_id, SessionState.ASKING_ATTENDANCE_STATUS, session_data)
 
         current_event = session_data['data']['unregistered_events'][session_data['data']['current_event_index']]
 
@@ -107,6 +111,8 @@ def start_attendance_qa(user_id, user_display_name, reply_token, line_bot_api_me
         )
         print(f"DEBUG: Started attendance Q&A for user {user_id}. State: ASKING_ATTENDANCE_STATUS. First event: {current_event['title']}")
 
+    except DeadlineExceededError:
+        raise # 時間切れの応答は process_message で返す
     except Exception as e:
         error_msg = f"参加予定登録の開始中にエラーが発生しました: {e}"
         print(f"ERROR: {error_msg}")
@@ -117,13 +123,11 @@ def start_attendance_qa(user_id, user_display_name, reply_token, line_bot_api_me
             )
         )
         # 修正: Config.SESSION_DATA_KEY を削除
-        delete_user_session_data(user_id)
-        SessionState.set_state(user_id, SessionState.NONE)
+        set_user_session(user_id, SessionState.NONE, None)
 
 
-def handle_attendance_qa_response(user_id, user_message, reply_token, line_bot_api_messaging: MessagingApi):
-    # 修正: Config.SESSION_DATA_KEY を削除
-    current_session_data = get_user_session_data(user_id)
+def handle_attendance_qa_response(user_id, user_message, reply_token, line_bot_api_messaging: MessagingApi, state, current_session_data):
+    # 会話状態とセッションデータは message_processors.py が1回の参照で取得したものを受け取る
     if not current_session_data:
         line_bot_api_messaging.reply_message(
             ReplyMessageRequest(
@@ -134,7 +138,6 @@ def handle_attendance_qa_response(user_id, user_message, reply_token, line_bot_a
         SessionState.set_state(user_id, SessionState.NONE)
         return
 
-    state = SessionState.get_state(user_id)
     data = current_session_data.get('data', {})
     messages = []
 
@@ -144,8 +147,7 @@ def handle_attendance_qa_response(user_id, user_message, reply_token, line_bot_a
     if not session_user_id or not session_user_display_name:
         messages.append(TextMessage(text="ユーザー情報の取得に失敗しました。\n「参加予定登録」と入力して最初からやり直してください。"))
         # 修正: Config.SESSION_DATA_KEY を削除
-        delete_user_session_data(user_id)
-        SessionState.set_state(user_id, SessionState.NONE)
+        set_user_session(user_id, SessionState.NONE, None)
         line_bot_api_messaging.reply_message(ReplyMessageRequest(reply_token=reply_token, messages=messages))
         return
 
@@ -156,8 +158,7 @@ def handle_attendance_qa_response(user_id, user_message, reply_token, line_bot_a
         if status in ['〇', '△', '×']:
             data['attendance_status'] = status  # 参加ステータスをセッションデータに保存
             # 修正: Config.SESSION_DATA_KEY を削除
-            set_user_session_data(user_id, current_session_data)  # セッションデータを更新 (重要)
-            SessionState.set_state(user_id, SessionState.ASKING_FOR_REMARKS_CONFIRMATION)  # 状態を更新
+            set_user_session(user_id, SessionState.ASKING_FOR_REMARKS_CONFIRMATION, current_session_data)  # セッションデータと状態をまとめて更新 (重要)
 
             messages.append(TextMessage(
                 text="備考はありますか？",
@@ -186,8 +187,7 @@ def handle_attendance_qa_response(user_id, user_message, reply_token, line_bot_a
             if not unregistered_events or current_event_index >= len(unregistered_events):
                 messages.append(TextMessage(text="処理すべきイベントが見つかりませんでした。\n「参加予定登録」と入力してやり直してください。"))
                 # 修正: Config.SESSION_DATA_KEY を削除
-                delete_user_session_data(user_id)
-                SessionState.set_state(user_id, SessionState.NONE)
+                set_user_session(user_id, SessionState.NONE, None)
                 line_bot_api_messaging.reply_message(ReplyMessageRequest(reply_token=reply_token, messages=messages))
                 return
 
@@ -211,8 +211,8 @@ def handle_attendance_qa_response(user_id, user_message, reply_token, line_bot_a
                     next_event_index = current_event_index + 1
                     if next_event_index < len(unregistered_events):
                         data['current_event_index'] = next_event_index
-                        # 修正: Config.SESSION_DATA_KEY を削除
-                        set_user_session_data(user_id, current_session_data) # セッションデータを更新
+                        # 次のイベントがある場合、必ず出欠を尋ねる状態に戻し、セッションデータと一緒に更新する
+                        set_user_session(user_id, SessionState.ASKING_ATTENDANCE_STATUS, current_session_data)
 
                         next_event = unregistered_events[next_event_index]
                         messages.append(TextMessage(
@@ -223,24 +223,19 @@ def handle_attendance_qa_response(user_id, user_message, reply_token, line_bot_a
                                 QuickReplyItem(action=MessageAction(label='×', text='×'))
                             ])
                         ))
-                        # !!! 修正箇所: 次のイベントがある場合、必ずこの状態に戻す !!!
-                        SessionState.set_state(user_id, SessionState.ASKING_ATTENDANCE_STATUS)
                     else:
                         messages.append(TextMessage(text="全ての未登録イベントの参加予定登録が完了しました！\nありがとうございました。"))
                         # 修正: Config.SESSION_DATA_KEY を削除
-                        delete_user_session_data(user_id)
-                        SessionState.set_state(user_id, SessionState.NONE)
+                        set_user_session(user_id, SessionState.NONE, None)
 
                 else:
                     messages.append(TextMessage(text=f"参加予定登録中にエラーが発生しました: {msg}"))
                     # 修正: Config.SESSION_DATA_KEY を削除
-                    delete_user_session_data(user_id)
-                    SessionState.set_state(user_id, SessionState.NONE)
+                    set_user_session(user_id, SessionState.NONE, None)
             except Exception as e:
                 messages.append(TextMessage(text=f"参加予定登録中に予期せぬエラーが発生しました: {e}"))
                 # 修正: Config.SESSION_DATA_KEY を削除
-                delete_user_session_data(user_id)
-                SessionState.set_state(user_id, SessionState.NONE)
+                set_user_session(user_id, SessionState.NONE, None)
         else:
             messages.append(TextMessage(
                 text="「はい」または「いいえ」で答えてください。",
@@ -261,8 +256,7 @@ def handle_attendance_qa_response(user_id, user_message, reply_token, line_bot_a
         if not unregistered_events or current_event_index >= len(unregistered_events):
             messages.append(TextMessage(text="処理すべきイベントが見つかりませんでした。\n「参加予定登録」と入力してやり直してください。"))
             # 修正: Config.SESSION_DATA_KEY を削除
-            delete_user_session_data(user_id)
-            SessionState.set_state(user_id, SessionState.NONE)
+            set_user_session(user_id, SessionState.NONE, None)
             line_bot_api_messaging.reply_message(ReplyMessageRequest(reply_token=reply_token, messages=messages))
             return
 
@@ -286,8 +280,8 @@ def handle_attendance_qa_response(user_id, user_message, reply_token, line_bot_a
                 next_event_index = current_event_index + 1
                 if next_event_index < len(unregistered_events):
                     data['current_event_index'] = next_event_index
-                    # 修正: Config.SESSION_DATA_KEY を削除
-                    set_user_session_data(user_id, current_session_data) # セッションデータを更新
+                    # 次のイベントがある場合、必ず出欠を尋ねる状態に戻し、セッションデータと一緒に更新する
+                    set_user_session(user_id, SessionState.ASKING_ATTENDANCE_STATUS, current_session_data)
 
                     next_event = unregistered_events[next_event_index]
                     messages.append(TextMessage(
@@ -298,40 +292,33 @@ def handle_attendance_qa_response(user_id, user_message, reply_token, line_bot_a
                             QuickReplyItem(action=MessageAction(label='×', text='×'))
                         ])
                     ))
-                    # !!! 修正箇所: 次のイベントがある場合、必ずこの状態に戻す !!!
-                    SessionState.set_state(user_id, SessionState.ASKING_ATTENDANCE_STATUS)
                 else:
                     messages.append(TextMessage(text="全ての未登録イベントの参加予定登録が完了しました！\nありがとうございました。"))
                     # 修正: Config.SESSION_DATA_KEY を削除
-                    delete_user_session_data(user_id)
-                    SessionState.set_state(user_id, SessionState.NONE)
+                    set_user_session(user_id, SessionState.NONE, None)
 
             else:
                 messages.append(TextMessage(text=f"参加予定登録中にエラーが発生しました: {msg}"))
                 # 修正: Config.SESSION_DATA_KEY を削除
-                delete_user_session_data(user_id)
-                SessionState.set_state(user_id, SessionState.NONE)
+                set_user_session(user_id, SessionState.NONE, None)
         except Exception as e:
             messages.append(TextMessage(text=f"参加予定登録中に予期せぬエラーが発生しました: {e}"))
             # 修正: Config.SESSION_DATA_KEY を削除
-            delete_user_session_data(user_id)
-            SessionState.set_state(user_id, SessionState.NONE)
+            set_user_session(user_id, SessionState.NONE, None)
 
     else: # どの状態にも当てはまらない場合（エラーまたは不明な状態）
         # この部分が、意図しない「不明な状態です」メッセージの原因となることがあるため、
         # より慎重なハンドリングが必要。基本的には、このブロックに来る前に適切な状態遷移が行われているべき。
         messages.append(TextMessage(text="現在、参加予定登録の処理が中断されているようです。\n「参加予定登録」と入力して最初からやり直してください。"))
         # 修正: Config.SESSION_DATA_KEY を削除
-        delete_user_session_data(user_id)
-        SessionState.set_state(user_id, SessionState.NONE)
+        set_user_session(user_id, SessionState.NONE, None)
 
     # 応答メッセージが空の場合のガード
     if not messages:
         print(f"WARNING: No messages generated for user {user_id} at state {state} with message {user_message}. Sending default reset message.")
         messages.append(TextMessage(text="予期せぬエラーが発生しました。セッションをリセットします。\n「参加予定登録」と入力して最初からやり直してください。"))
         # 修正: Config.SESSION_DATA_KEY を削除
-        delete_user_session_data(user_id)
-        SessionState.set_state(user_id, SessionState.NONE)
+        set_user_session(user_id, SessionState.NONE, None)
 
     line_bot_api_messaging.reply_message(
         ReplyMessageRequest(
@@ -1,22 +1,69 @@
 import os
+import threading
+import time
 from flask import Flask, request, abort
 from linebot.v3 import WebhookHandler
 from linebot.v3.exceptions import InvalidSignatureError
-from linebot.v3.messaging import Configuration, ApiClient, MessagingApi
 from linebot.v3.webhooks import MessageEvent, TextMessageContent # ★追加
 
 from config import Config
+from google_sheets import cache, journal, mirror, rate_limiter, write_behind
+from google_sheets.schema import validate_schemas
+from line_handlers import list_pagination
 from line_handlers.message_processors import process_message
+from utils import event_dedup, worker_pool
+from utils.line_api_client import get_messaging_api, get_reply_stats
+from utils.session_store import get_session_stats
 
 # Flaskアプリケーションの初期化
 app = Flask(__name__)
 
 # LINE Bot SDKの設定
-configuration = Configuration(access_token=Config.LINE_CHANNEL_ACCESS_TOKEN)
 handler = WebhookHandler(Config.LINE_CHANNEL_SECRET)
 
-# MessagingApiの初期化 (必要に応じて他の場所でもインスタンス化される可能性があるが、ここで定義)
-line_bot_api_messaging = MessagingApi(ApiClient(configuration))
+# MessagingApi はプロセス全体で共有するクライアントを使う（utils/line_api_client.py）
+line_bot_api_messaging = get_messaging_api()
+
+# 起動時にスケジュール・参加者ワークシートのヘッダーを読み込み、必須列が揃っているか検証する
+if not validate_schemas():
+    app.logger.error("Google Sheets schema validation failed. Check worksheet headers and credentials.")
+
+# 前回のプロセスでシートへ反映できなかった書き込みがあれば、起動時に反映を再開する
+if journal.is_enabled():
+    journal.resume()
+if write_behind.is_enabled():
+    write_behind.resume()
+
+def collect_stats() -> dict:
+    """
+    各機能の統計をまとめて返します。（監視・デバッグ用）
+    """
+    return {
+        'sessions': get_session_stats(),
+        'webhook_dedup': event_dedup.get_dedup_stats(),
+        'worker_pool': worker_pool.get_worker_pool_stats(),
+        'replies': get_reply_stats(),
+        'sheets_cache': cache.get_cache_stats(),
+        'sheets_rate_limiter': rate_limiter.get_rate_limiter_stats(),
+        'sheets_journal': journal.get_journal_stats(),
+        'attendee_write_behind': write_behind.get_write_behind_stats(),
+        'sheets_mirror': mirror.get_mirror_stats(),
+        'list_render_cache': list_pagination.get_render_cache_stats(),
+    }
+
+def _log_stats_loop():
+    """
+    Config.STATS_LOG_INTERVAL_SECONDS ごとに統計をログに出力します。
+    """
+    while True:
+        time.sleep(Config.STATS_LOG_INTERVAL_SECONDS)
+        try:
+            app.logger.info("Stats: %s", collect_stats())
+        except Exception as e:
+            app.logger.error(f"Failed to collect stats: {e}")
+
+if Config.STATS_LOG_INTERVAL_SECONDS > 0:
+    threading.Thread(target=_log_stats_loop, name='stats-logger', daemon=True).start()
 
 @app.route("/callback", methods=['POST'])
 def callback():
@@ -24,6 +71,9 @@ def callback():
     body = request.get_data(as_text=True)
     app.logger.info("Request body: %s", body)
 
+    if Config.WEBHOOK_ASYNC_PROCESSING:
+        return _enqueue_events(body, signature)
+
     try:
         handler.handle(body, signature)
     except InvalidSignatureError:
@@ -35,15 +85,62 @@ def callback():
 
     return 'OK'
 
+def _event_order_key(event) -> str:
+    """
+    イベントの処理順序を保証する単位（送信元ユーザー）のキーを返します。
+    """
+    source = event.source
+    return getattr(source, 'user_id', None) or getattr(source, 'group_id', None) or getattr(source, 'room_id', None) or ''
+
+def _enqueue_events(body: str, signature: str):
+    """
+    署名を検証してイベントをワーカープールに投入し、処理の完了を待たずに応答します。
+    同じユーザーのイベントは同じワーカーで受信順に処理されます。
+    """
+    received_at = time.monotonic() # 待ち行列で待った時間もイベント全体の期限に含める
+    try:
+        events = handler.parser.parse(body, signature)
+    except InvalidSignatureError:
+        app.logger.error("Invalid signature. Please check your channel access token/channel secret.")
+        abort(400)
+
+    for event in events:
+        if not (isinstance(event, MessageEvent) and isinstance(event.message, TextMessageContent)):
+            continue # handle_message が対象とするイベント以外は同期モードと同様に無視する
+        if not event_dedup.mark_if_new(event):
+            continue # 再送された処理済みイベントは投入しない
+        if not worker_pool.submit(_event_order_key(event), _process_event_in_worker, event, received_at):
+            # 待ち行列が満杯の場合は503を返し、LINE側の再送に任せる
+            event_dedup.forget(event)
+            app.logger.error("Worker queue is full. Rejecting webhook.")
+            abort(503)
+
+    return 'OK'
+
+def _process_event_in_worker(event, received_at: float):
+    """
+    ワーカースレッドでメッセージイベントを処理します。リクエストコンテキスト外のため、エラーはログ出力のみ行います。
+    """
+    try:
+        process_message(event, received_at)
+    except Exception as e:
+        event_dedup.forget(event) # 再送された場合に改めて処理させる
+        app.logger.error(f"Error in worker: {e}", exc_info=True)
+
 @handler.add(MessageEvent, message=TextMessageContent)
 def handle_message(event):
     """
     メッセージイベントを処理するハンドラー
     """
+    # 再送された処理済みイベントは、シートへの読み書きを行う前に捨てる
+    if not event_dedup.mark_if_new(event):
+        return
+
     try:
         # process_message 関数に event オブジェクト全体を渡す
         process_message(event)
     except Exception as e:
+        event_dedup.forget(event) # 再送時に改めて処理させる
         app.logger.error(f"Error in main: {e}", exc_info=True)
         # エラー発生時もLINEに500応答を返す
         abort(500)
@@ -0,0 +1,289 @@
+import os
+import re
+import sys
+import threading
+from datetime import datetime
+
+import gspread
+import pytest
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# LINEのクライアントをインポート時に生成するモジュール（message_processors など）を読み込めるよう、ダミーの認証情報を設定する
+os.environ.setdefault('LINE_CHANNEL_ACCESS_TOKEN', 'test-access-token')
+os.environ.setdefault('LINE_CHANNEL_SECRET', 'test-channel-secret')
+
+from config import Config # noqa: E402
+
+SCHEDULE_VALUES = [
+    ['日付', '開始時刻', 'タイトル', '開催場所', '詳細', '申込締切日', '規模'],
+    ['2025/06/01', '10:00', 'A', '会議室', '', '', ''],
+    ['2025/06/10', '10:00', 'B', '会議室', '', '', ''],
+    ['2025/06/20', '10:00', 'C', '会議室', '', '', ''],
+]
+ATTENDEE_VALUES = [
+    ['日付', 'タイトル', '参加者ID', '参加者名', '出欠', '備考', '登録日時', '更新日時'],
+    ['2025/06/01', 'A', 'U1', 'u1', '〇', '', '', ''],
+    ['2025/06/10', 'B', 'U1', 'u1', '△', '', '', ''],
+    ['2025/06/10', 'B', 'U2', 'u2', '〇', '', '', ''],
+]
+
+
+class FakeAPIError(gspread.exceptions.APIError):
+    """ステータスコードだけを持つ gspread の APIError。"""
+
+    def __init__(self, status_code: int):
+        Exception.__init__(self, f"HTTP {status_code}")
+        self.response = type('Response', (), {'status_code': status_code})()
+        self.error = {'code': status_code, 'message': f"HTTP {status_code}"}
+        self.code = status_code
+
+
+class FakeSpreadsheet:
+    def __init__(self):
+        self.worksheets = {}
+        self.version = 'v1'
+
+    def get_lastUpdateTime(self):
+        return self.version
+
+    def values_batch_get(self, ranges, **kwargs):
+        value_ranges = []
+        for range_name in ranges:
+            worksheet = self.worksheets[range_name.strip("'")]
+            worksheet.calls.append('values_batch_get')
+            value_ranges.append({'values': [list(row) for row in worksheet.values]})
+        return {'valueRanges': value_ranges}
+
+    def batch_update(self, body):
+        requests_ = body['requests']
+        sheet_ids = {request['deleteDimension']['range']['sheetId'] for request in requests_}
+        worksheet = next(ws for ws in self.worksheets.values() if ws.id in sheet_ids)
+
+        def apply():
+            for request in requests_:
+                sheet_range = request['deleteDimension']['range']
+                del worksheet.values[sheet_range['startIndex']:sheet_range['endIndex']]
+            return {}
+        return worksheet._call('spreadsheet.batch_update', apply)
+
+
+class FakeWorksheet:
+    """
+    gspread.Worksheet の代わりに使う、メモリ上のワークシート。
+    fail_before[メソッド名] の例外は反映前に、fail_after[メソッド名] の例外は反映後に送出する（1回ずつ取り出す）。
+    """
+
+    def __init__(self, spreadsheet: FakeSpreadsheet, title: str, sheet_id: int, values: list):
+        self.spreadsheet = spreadsheet
+        self.title = title
+        self.id = sheet_id
+        self.values = [list(row) for row in values]
+        self.calls = []
+        self.fail_before = {}
+        self.fail_after = {}
+
+    def _run(self, name: str, apply):
+        self.calls.append(name)
+        errors = self.fail_before.get(name)
+        if errors:
+            raise errors.pop(0)
+        return apply()
+
+    def _after(self, name: str):
+        errors = self.fail_after.get(name)
+        if errors:
+            raise errors.pop(0)
+
+    def _call(self, name: str, apply):
+        result = self._run(name, apply)
+        self._after(name)
+        return result
+
+    def get_all_values(self, *args, **kwargs):
+        return self._call('get_all_values', lambda: [list(row) for row in self.values])
+
+    def row_values(self, row_index):
+        return self._call('row_values', lambda: list(self.values[row_index - 1]))
+
+    def batch_get(self, ranges, **kwargs):
+        def apply():
+            value_ranges = []
+            for range_name in ranges:
+                row_index = int(re.match(r'[A-Z]+(\d+)', range_name).group(1))
+                value_ranges.append([list(self.values[row_index - 1])] if row_index - 1 < len(self.values) else [])
+            return value_ranges
+        return self._call('batch_get', apply)
+
+    def insert_row(self, values, index=1, **kwargs):
+        return self._call('insert_row', lambda: self.values.insert(index - 1, [str(value) for value in values]))
+
+    def delete_rows(self, start_index, end_index=None):
+        def apply():
+            del self.values[start_index - 1:end_index or start_index]
+        return self._call('delete_rows', apply)
+
+    def append_rows(self, rows, **kwargs):
+        def apply():
+            start = len(self.values) + 1
+            self.values.extend([str(value) for value in row] for row in rows)
+            return {'updates': {'updatedRange': f"'{self.title}'!A{start}:H{len(self.values)}"}}
+        return self._call('append_rows', apply)
+
+    def batch_update(self, data, **kwargs):
+        def apply():
+            for item in data:
+                # gspread と同じく、range をシート名付きに書き換える
+                range_name = item['range']
+                item['range'] = gspread.utils.absolute_range_name(self.title, range_name)
+                if '!' in range_name:
+                    raise FakeAPIError(400)
+                row_index, col_index = gspread.utils.a1_to_rowcol(range_name)
+                row = self.values[row_index - 1]
+                row.extend([''] * (col_index - len(row)))
+                row[col_index - 1] = item['values'][0][0]
+            return {}
+        return self._call('batch_update', apply)
+
+    def column(self, name: str) -> list:
+        position = self.values[0].index(name)
+        return [row[position] for row in self.values[1:]]
+
+
+class FakeClock:
+    """google_sheets.utils の datetime の代わりに使う、テストから進められる時計。"""
+    current = datetime(2025, 6, 1, 9, 0)
+
+    @classmethod
+    def now(cls):
+        return cls.current
+
+
+def connection_timeout():
+    return requests.exceptions.ConnectTimeout("connect timed out")
+
+
+def read_timeout():
+    return requests.exceptions.ReadTimeout("read timed out")
+
+
+@pytest.fixture(autouse=True)
+def _fast_config(monkeypatch):
+    """再試行・クォータの待ち時間をなくし、テストごとに任意機能を無効にした状態から始めます。"""
+    from google_sheets import rate_limiter
+
+    monkeypatch.setattr(rate_limiter, '_buckets', {kind: rate_limiter.TokenBucket(100000) for kind in ('read', 'write')})
+    monkeypatch.setattr(Config, 'GOOGLE_SHEETS_RETRY_BASE_SECONDS', 0.0)
+    monkeypatch.setattr(Config, 'GOOGLE_SHEETS_RETRY_MAX_SECONDS', 0.0)
+    monkeypatch.setattr(Config, 'GOOGLE_SHEETS_CHANGE_PROBE', False)
+    monkeypatch.setattr(Config, 'GOOGLE_SHEETS_JOURNAL_PATH', '')
+    monkeypatch.setattr(Config, 'GOOGLE_SHEETS_MIRROR_PATH', None)
+    monkeypatch.setattr(Config, 'ATTENDEE_WRITE_BEHIND_SECONDS', 0.0)
+    monkeypatch.setattr(Config, 'GOOGLE_SHEETS_VERIFY_ROWS', True)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """登録日時・更新日時に使う現在時刻を固定します。clock.current を書き換えると時刻が進みます。"""
+    from google_sheets import utils
+
+    monkeypatch.setattr(FakeClock, 'current', datetime(2025, 6, 1, 9, 0))
+    monkeypatch.setattr(utils, 'datetime', FakeClock)
+    return FakeClock
+
+
+@pytest.fixture
+def sheets(monkeypatch):
+    """
+    スケジュール・参加者の2つのワークシートを持つメモリ上のスプレッドシートを api_client に差し込みます。
+    :return: {ワークシート名: FakeWorksheet}
+    """
+    from google_sheets import api_client, cache, schema
+
+    spreadsheet = FakeSpreadsheet()
+    worksheets = {
+        Config.GOOGLE_SHEETS_SCHEDULE_WORKSHEET_NAME:
+            FakeWorksheet(spreadsheet, Config.GOOGLE_SHEETS_SCHEDULE_WORKSHEET_NAME, 1, SCHEDULE_VALUES),
+        Config.GOOGLE_SHEETS_ATTENDEES_WORKSHEET_NAME:
+            FakeWorksheet(spreadsheet, Config.GOOGLE_SHEETS_ATTENDEES_WORKSHEET_NAME, 2, ATTENDEE_VALUES),
+    }
+    spreadsheet.worksheets = worksheets
+    monkeypatch.setattr(api_client, '_client', object())
+    monkeypatch.setattr(api_client, '_spreadsheet', spreadsheet)
+    monkeypatch.setattr(api_client, '_worksheets', dict(worksheets))
+    monkeypatch.setattr(schema, '_schemas', {})
+    cache.invalidate()
+    yield worksheets
+    cache.invalidate()
+
+
+@pytest.fixture
+def main_module(sheets, monkeypatch):
+    """
+    main.py を読み込んで返します。初回の読み込み時の起動処理（スキーマの検証）は sheets のスプレッドシートに対して行い、
+    統計をログに出力するスレッドは起動しません。
+    """
+    monkeypatch.setattr(Config, 'STATS_LOG_INTERVAL_SECONDS', 0.0)
+    import main
+    return main
+
+
+@pytest.fixture
+def sheets_journal(tmp_path, monkeypatch):
+    """
+    一時ディレクトリのジャーナルを有効にします。再送スレッドは起動せず、テストから journal._drain() で再送します。
+    """
+    from google_sheets import journal
+
+    monkeypatch.setattr(Config, 'GOOGLE_SHEETS_JOURNAL_PATH', str(tmp_path / 'sheets_journal.jsonl'))
+    monkeypatch.setattr(journal, '_file', None)
+    monkeypatch.setattr(journal, '_lock_file', None)
+    monkeypatch.setattr(journal, '_unavailable', False)
+    monkeypatch.setattr(journal, '_replay_thread', threading.current_thread())
+    monkeypatch.setattr(journal, '_pending', {})
+    monkeypatch.setattr(journal, '_in_flight', set())
+    monkeypatch.setattr(journal, '_attempts', {})
+    monkeypatch.setattr(journal, '_next_id', 1)
+    monkeypatch.setattr(journal, '_completed_since_compaction', 0)
+    monkeypatch.setattr(journal, '_stats', dict.fromkeys(journal._stats, 0))
+    yield journal
+    if journal._file is not None:
+        journal._file.close()
+    if journal._lock_file is not None:
+        journal._lock_file.close()
+
+
+@pytest.fixture
+def local_mirror(tmp_path, monkeypatch):
+    """
+    一時ディレクトリのローカルミラーを有効にします。同期スレッドは起動せず、テストから mirror._drain_outbox() で反映します。
+    """
+    from google_sheets import mirror
+
+    monkeypatch.setattr(Config, 'GOOGLE_SHEETS_MIRROR_PATH', str(tmp_path / 'mirror.db'))
+    monkeypatch.setattr(mirror, '_conn', None)
+    monkeypatch.setattr(mirror, '_sync_thread', threading.current_thread())
+    monkeypatch.setattr(mirror, '_stats', dict.fromkeys(mirror._stats, 0))
+    yield mirror
+    if mirror._conn is not None:
+        mirror._conn.close()
+
+
+@pytest.fixture
+def attendee_write_behind(tmp_path, monkeypatch):
+    """
+    一時ディレクトリのジャーナルで参加予定の write-behind を有効にします。反映スレッドは起動せず、テストから flush() で反映します。
+    """
+    from google_sheets import write_behind
+
+    monkeypatch.setattr(Config, 'ATTENDEE_WRITE_BEHIND_SECONDS', 60.0)
+    monkeypatch.setattr(Config, 'ATTENDEE_WRITE_BEHIND_JOURNAL_PATH', str(tmp_path / 'attendee_write_behind.db'))
+    monkeypatch.setattr(write_behind, '_conn', None)
+    monkeypatch.setattr(write_behind, '_flush_thread', threading.current_thread())
+    monkeypatch.setattr(write_behind, '_pending', {})
+    monkeypatch.setattr(write_behind, '_revision', 0)
+    monkeypatch.setattr(write_behind, '_attempts', {})
+    monkeypatch.setattr(write_behind, '_stats', dict.fromkeys(write_behind._stats, 0))
+    yield write_behind
+    if write_behind._conn is not None:
+        write_behind._conn.close()
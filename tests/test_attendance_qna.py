@@ -0,0 +1,36 @@
+import pytest
+
+from config import Config, SessionState
+from line_handlers.qna import attendance_qna
+from utils import session_store
+from utils.session_manager import get_user_session
+
+SCHEDULE = Config.GOOGLE_SHEETS_SCHEDULE_WORKSHEET_NAME
+ATTENDEES = Config.GOOGLE_SHEETS_ATTENDEES_WORKSHEET_NAME
+
+
+class _FakeMessagingApi:
+    def __init__(self):
+        self.replies = []
+
+    def reply_message(self, request):
+        self.replies.append(request)
+
+
+@pytest.fixture(autouse=True)
+def _fresh_sessions(monkeypatch):
+    monkeypatch.setattr(session_store, '_store', session_store.InMemorySessionStore(3600, 100))
+
+
+@pytest.mark.parametrize('ttl', [0.0, 60.0])
+def test_start_reads_both_worksheets_in_one_request(sheets, monkeypatch, ttl):
+    monkeypatch.setattr(Config, 'GOOGLE_SHEETS_CACHE_TTL_SECONDS', ttl)
+    api = _FakeMessagingApi()
+    attendance_qna.start_attendance_qa('U1', 'u1', 'token', api)
+    assert sheets[SCHEDULE].calls == ['values_batch_get']
+    assert sheets[ATTENDEES].calls == ['values_batch_get']
+    # U1 は A と B に登録済みのため、C から尋ねる
+    assert '「C」' in api.replies[-1].messages[0].text
+    state, session_data = get_user_session('U1')
+    assert state == SessionState.ASKING_ATTENDANCE_STATUS
+    assert session_data['data']['unregistered_events'] == [{'date': '2025/06/20', 'title': 'C'}]
@@ -0,0 +1,73 @@
+import pytest
+
+from config import Config
+from google_sheets import cache, utils
+
+SCHEDULE = Config.GOOGLE_SHEETS_SCHEDULE_WORKSHEET_NAME
+ATTENDEES = Config.GOOGLE_SHEETS_ATTENDEES_WORKSHEET_NAME
+
+
+@pytest.fixture
+def probing(monkeypatch):
+    """TTLを0にして毎回変更確認を行わせます。"""
+    monkeypatch.setattr(Config, 'GOOGLE_SHEETS_CACHE_TTL_SECONDS', 0.0)
+    monkeypatch.setattr(Config, 'GOOGLE_SHEETS_CHANGE_PROBE', True)
+
+
+def test_unchanged_spreadsheet_is_not_reloaded(sheets, probing):
+    schedules = sheets[SCHEDULE]
+    utils.get_all_records(SCHEDULE)
+    utils.get_all_records(SCHEDULE)
+    assert schedules.calls.count('get_all_values') == 1
+
+
+def test_changed_spreadsheet_is_reloaded(sheets, probing):
+    schedules = sheets[SCHEDULE]
+    utils.get_all_records(SCHEDULE)
+    schedules.values[1][3] = 'ホール'
+    schedules.spreadsheet.version = 'v2'
+    assert utils.get_all_records(SCHEDULE)['開催場所'].tolist()[0] == 'ホール'
+
+
+def test_human_edit_after_own_write_is_not_hidden(sheets, probing):
+    schedules = sheets[SCHEDULE]
+    utils.get_all_records(SCHEDULE)
+    assert utils.update_schedule('2025/06/10', 'B', {'開催場所': 'ホール'})[0]
+    # 自分の書き込みと同じ確認間隔の中で、人が別のセルを編集した
+    schedules.values[3][3] = '屋外'
+    schedules.spreadsheet.version = 'v2'
+    assert utils.get_all_records(SCHEDULE)['開催場所'].tolist() == ['会議室', 'ホール', '屋外']
+
+
+def test_data_version_moves_on_every_write(sheets):
+    before = utils.get_data_version(SCHEDULE)
+    assert utils.update_schedule('2025/06/10', 'B', {'開催場所': 'ホール'})[0]
+    after_write = utils.get_data_version(SCHEDULE)
+    assert after_write > before
+    cache.bump_data_version()
+    assert cache.get_data_version(SCHEDULE) > after_write
+    assert cache.get_data_version(ATTENDEES) > 0
+
+
+def test_batch_read_loads_missing_worksheets_in_one_request(sheets):
+    records = utils.get_all_records_batch([SCHEDULE, ATTENDEES])
+    assert len(records[SCHEDULE]) == 3 and len(records[ATTENDEES]) == 3
+    assert sheets[SCHEDULE].calls == ['values_batch_get']
+    assert sheets[ATTENDEES].calls == ['values_batch_get']
+    utils.get_all_records_batch([SCHEDULE, ATTENDEES])
+    assert sheets[SCHEDULE].calls == ['values_batch_get']
+
+
+def test_data_version_is_kept_when_reloaded_content_is_unchanged(sheets, probing):
+    schedules = sheets[SCHEDULE]
+    utils.get_all_records(SCHEDULE)
+    before = utils.get_data_version(SCHEDULE)
+    # 内容を変えずに更新日時だけが進んだ（書式の変更など）
+    schedules.spreadsheet.version = 'v2'
+    utils.get_all_records(SCHEDULE)
+    assert schedules.calls.count('get_all_values') == 2
+    assert utils.get_data_version(SCHEDULE) == before
+    schedules.values[1][3] = 'ホール'
+    schedules.spreadsheet.version = 'v3'
+    utils.get_all_records(SCHEDULE)
+    assert utils.get_data_version(SCHEDULE) > before
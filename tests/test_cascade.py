@@ -0,0 +1,90 @@
+from config import Config
+from google_sheets import utils
+from tests.conftest import FakeAPIError, read_timeout
+
+SCHEDULE = Config.GOOGLE_SHEETS_SCHEDULE_WORKSHEET_NAME
+ATTENDEES = Config.GOOGLE_SHEETS_ATTENDEES_WORKSHEET_NAME
+
+
+def _add_attendees(attendees, count: int):
+    attendees.values.extend(['2025/06/10', 'B', f'X{i}', f'x{i}', '〇', '', '', ''] for i in range(count))
+
+
+def test_title_change_rewrites_attendee_rows_in_constant_calls(sheets):
+    attendees = sheets[ATTENDEES]
+    _add_attendees(attendees, 20)
+    utils.get_all_records(ATTENDEES)
+    attendees.calls.clear()
+
+    success, _ = utils.update_schedule('2025/06/10', 'B', {'タイトル': 'B2'})
+    assert success
+    assert attendees.calls == ['batch_get', 'batch_update']
+    assert attendees.column('タイトル').count('B2') == 22
+    assert 'B' not in attendees.column('タイトル')
+    # キャッシュも差分で更新されている
+    assert (utils.get_all_records(ATTENDEES)['タイトル'] == 'B2').sum() == 22
+
+
+def test_delete_removes_attendee_rows_in_constant_calls(sheets):
+    attendees = sheets[ATTENDEES]
+    _add_attendees(attendees, 20)
+    utils.get_all_records(ATTENDEES)
+    attendees.calls.clear()
+
+    success, _ = utils.delete_schedule_by_date_title('2025/06/10', 'B')
+    assert success
+    assert attendees.calls == ['batch_get', 'spreadsheet.batch_update']
+    assert attendees.column('タイトル') == ['A']
+    assert len(utils.get_all_records(ATTENDEES)) == 1
+
+
+def test_non_key_update_does_not_touch_attendees(sheets):
+    attendees = sheets[ATTENDEES]
+    utils.get_all_records(ATTENDEES)
+    attendees.calls.clear()
+    assert utils.update_schedule('2025/06/10', 'B', {'開催場所': 'ホール'})[0]
+    assert attendees.calls == []
+
+
+def test_timed_out_row_delete_is_not_resent(sheets):
+    attendees = sheets[ATTENDEES]
+    attendees.values.append(['2025/06/20', 'C', 'U9', 'u9', '〇', '', '', ''])
+    utils.get_all_records(ATTENDEES)
+    attendees.fail_after['spreadsheet.batch_update'] = [read_timeout()]
+
+    success, message = utils.delete_schedule_by_date_title('2025/06/10', 'B')
+    assert success # スケジュールは削除済み
+    assert '参加者シートへの反映に失敗しました' in message
+    assert attendees.calls.count('spreadsheet.batch_update') == 1
+    assert attendees.column('参加者ID') == ['U1', 'U9']
+
+
+def test_deferred_schedule_change_cascades_only_after_replay(sheets, sheets_journal, monkeypatch):
+    schedules, attendees = sheets[SCHEDULE], sheets[ATTENDEES]
+    monkeypatch.setattr(Config, 'GOOGLE_SHEETS_CALL_DEADLINE_SECONDS', 0.0) # 失敗したら再試行せずに諦める
+    schedules.fail_before['batch_update'] = [FakeAPIError(503)]
+
+    success, message = utils.update_schedule('2025/06/10', 'B', {'タイトル': 'B2'})
+    assert success and '後ほど' in message
+    assert schedules.column('タイトル') == ['A', 'B', 'C']
+    assert attendees.column('タイトル') == ['A', 'B', 'B'] # シートに届いていない変更は参加者シートにも反映しない
+
+    assert sheets_journal._drain()
+    assert schedules.column('タイトル') == ['A', 'B2', 'C']
+    assert attendees.column('タイトル') == ['A', 'B2', 'B2']
+    assert sheets_journal.get_journal_stats()['pending'] == 0
+
+
+def test_rejected_deferred_delete_does_not_cascade(sheets, sheets_journal, monkeypatch):
+    schedules, attendees = sheets[SCHEDULE], sheets[ATTENDEES]
+    monkeypatch.setattr(Config, 'GOOGLE_SHEETS_CALL_DEADLINE_SECONDS', 0.0)
+    schedules.fail_before['batch_get'] = [FakeAPIError(503)]
+
+    assert utils.delete_schedule_by_date_title('2025/06/10', 'B')[0]
+    # 再送までの間に、スケジュールが手動で削除された
+    del schedules.values[2]
+    attendees.values.append(['2025/06/10', 'B', 'U3', 'u3', '〇', '', '', ''])
+    utils.cache.invalidate()
+
+    assert sheets_journal._drain()
+    assert attendees.column('参加者ID') == ['U1', 'U1', 'U2', 'U3']
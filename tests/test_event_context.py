@@ -0,0 +1,66 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from config import Config
+from google_sheets import rate_limiter, utils
+from line_handlers import message_processors
+from utils import event_context
+
+ATTENDEES = Config.GOOGLE_SHEETS_ATTENDEES_WORKSHEET_NAME
+
+
+class _FakeMessagingApi:
+    def __init__(self):
+        self.replies = []
+
+    def reply_message(self, request):
+        self.replies.append(request)
+
+
+def _event(text='', age_seconds=0.0):
+    return SimpleNamespace(
+        source=SimpleNamespace(user_id='U1'),
+        reply_token='token',
+        timestamp=(time.time() - age_seconds) * 1000,
+        message=SimpleNamespace(text=text),
+    )
+
+
+@pytest.fixture
+def exhausted_read_quota(monkeypatch):
+    """読み取りのクォータを使い切った状態にし、次の読み取りが期限内にトークンを待てないようにします。"""
+    bucket = rate_limiter.TokenBucket(1)
+    bucket.tokens = 0.0
+    monkeypatch.setitem(rate_limiter._buckets, 'read', bucket)
+
+
+def test_redelivered_event_gets_the_full_event_budget():
+    # LINEから数分後に再送されたイベント
+    with event_context.handling(_event(age_seconds=300)) as context:
+        assert context.reply_deadline < time.monotonic()
+        assert context.remaining() > Config.EVENT_DEADLINE_SECONDS - 1
+
+
+def test_event_budget_starts_when_the_webhook_was_received():
+    received_at = time.monotonic() - 2
+    with event_context.handling(_event(), received_at=received_at) as context:
+        assert context.deadline == received_at + Config.EVENT_DEADLINE_SECONDS
+
+
+def test_read_helpers_raise_deadline_exceeded(sheets, exhausted_read_quota):
+    with event_context.handling(_event()):
+        with pytest.raises(rate_limiter.DeadlineExceededError):
+            utils.get_all_records(ATTENDEES)
+        with pytest.raises(rate_limiter.DeadlineExceededError):
+            utils.get_attendees_for_user('U1')
+
+
+def test_user_is_told_about_the_timeout_instead_of_an_empty_list(sheets, exhausted_read_quota, monkeypatch):
+    api = _FakeMessagingApi()
+    monkeypatch.setattr(message_processors, 'line_bot_api_messaging', api)
+    message_processors.process_message(_event('参加予定一覧'))
+    assert [message.text for message in api.replies[-1].messages] == [
+        "時間内に処理を完了できませんでした。しばらくしてからもう一度お試しください。"
+    ]
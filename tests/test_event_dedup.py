@@ -0,0 +1,77 @@
+from types import SimpleNamespace
+
+import pytest
+
+from config import Config
+from utils import event_dedup
+
+
+@pytest.fixture(autouse=True)
+def _fresh_dedup(monkeypatch):
+    monkeypatch.setattr(Config, 'SESSION_STORE_PATH', None)
+    monkeypatch.setattr(event_dedup, '_seen_events', event_dedup.OrderedDict())
+    monkeypatch.setattr(event_dedup, '_conn', None)
+    monkeypatch.setattr(event_dedup, '_last_sweep', 0.0)
+    monkeypatch.setattr(event_dedup, '_stats', dict.fromkeys(event_dedup._stats, 0))
+    yield
+    if event_dedup._conn is not None:
+        event_dedup._conn.close()
+
+
+@pytest.fixture
+def shared_store(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, 'SESSION_STORE_PATH', str(tmp_path / 'sessions.db'))
+
+
+def _event(event_id, redelivery=False):
+    return SimpleNamespace(webhook_event_id=event_id, delivery_context=SimpleNamespace(is_redelivery=redelivery))
+
+
+@pytest.mark.parametrize('store', ['local', 'shared'])
+def test_redelivered_event_is_skipped(store, request):
+    if store == 'shared':
+        request.getfixturevalue('shared_store')
+    assert event_dedup.mark_if_new(_event('e1'))
+    assert not event_dedup.mark_if_new(_event('e1', redelivery=True))
+    assert event_dedup.mark_if_new(_event('e2'))
+    stats = event_dedup.get_dedup_stats()
+    assert stats['accepted'] == 2 and stats['duplicates'] == 1 and stats['redeliveries'] == 1 and stats['tracked'] == 2
+
+
+@pytest.mark.parametrize('store', ['local', 'shared'])
+def test_forgotten_event_is_processed_again(store, request):
+    if store == 'shared':
+        request.getfixturevalue('shared_store')
+    assert event_dedup.mark_if_new(_event('e1'))
+    event_dedup.forget(_event('e1'))
+    assert event_dedup.mark_if_new(_event('e1'))
+
+
+@pytest.mark.parametrize('store', ['local', 'shared'])
+def test_event_outside_the_window_is_new(store, request, monkeypatch):
+    if store == 'shared':
+        request.getfixturevalue('shared_store')
+    monkeypatch.setattr(Config, 'WEBHOOK_DEDUP_WINDOW_SECONDS', 0.0)
+    assert event_dedup.mark_if_new(_event('e1'))
+    assert event_dedup.mark_if_new(_event('e1'))
+
+
+def test_local_store_keeps_at_most_max_entries(monkeypatch):
+    monkeypatch.setattr(Config, 'WEBHOOK_DEDUP_MAX_ENTRIES', 2)
+    for event_id in ('e1', 'e2', 'e3'):
+        assert event_dedup.mark_if_new(_event(event_id))
+    assert event_dedup.get_dedup_stats()['tracked'] == 2
+    assert event_dedup.mark_if_new(_event('e1'))
+
+
+def test_shared_store_detects_events_seen_by_another_process(shared_store, monkeypatch):
+    assert event_dedup.mark_if_new(_event('e1'))
+    # 別のプロセス（同じSQLiteファイルを開く、記録を持たない新しい接続）
+    event_dedup._conn.close()
+    monkeypatch.setattr(event_dedup, '_conn', None)
+    assert not event_dedup.mark_if_new(_event('e1'))
+
+
+def test_event_without_id_is_always_new():
+    assert event_dedup.mark_if_new(SimpleNamespace())
+    assert event_dedup.mark_if_new(SimpleNamespace())
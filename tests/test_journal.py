@@ -0,0 +1,98 @@
+import json
+from datetime import datetime
+
+from config import Config
+from google_sheets import utils
+from tests.conftest import FakeAPIError, read_timeout
+
+SCHEDULE = Config.GOOGLE_SHEETS_SCHEDULE_WORKSHEET_NAME
+ATTENDEES = Config.GOOGLE_SHEETS_ATTENDEES_WORKSHEET_NAME
+
+
+NEW_SCHEDULE = {'日付': '2025/06/15', '開始時刻': '10:00', 'タイトル': 'D', '開催場所': '会議室',
+                '詳細': '', '申込締切日': '', '規模': ''}
+
+
+def test_transient_failure_is_deferred_and_replayed(sheets, sheets_journal, monkeypatch):
+    monkeypatch.setattr(Config, 'GOOGLE_SHEETS_CALL_DEADLINE_SECONDS', 0.0)
+    schedules = sheets[SCHEDULE]
+    schedules.fail_before['batch_update'] = [FakeAPIError(503)]
+    success, message = utils.update_schedule('2025/06/10', 'B', {'開催場所': 'ホール'})
+    assert success and '受け付けました' in message
+    assert sheets_journal.get_journal_stats()['pending'] == 1
+    assert sheets_journal._drain()
+    assert schedules.column('開催場所') == ['会議室', 'ホール', '会議室']
+    assert sheets_journal.get_journal_stats()['pending'] == 0
+
+
+def test_permanent_failure_is_returned_and_not_journaled(sheets, sheets_journal):
+    attendees = sheets[ATTENDEES]
+    attendees.fail_before['append_rows'] = [FakeAPIError(400)]
+    success, _ = utils.update_or_add_attendee('2025/06/20', 'C', 'U3', 'u3', '〇', '')
+    assert not success
+    stats = sheets_journal.get_journal_stats()
+    assert stats['pending'] == 0 and stats['rejected'] == 1
+    assert 'U3' not in attendees.column('参加者ID')
+
+
+def test_permanent_replay_failure_is_dropped_without_waiting(sheets, sheets_journal, monkeypatch):
+    monkeypatch.setattr(Config, 'GOOGLE_SHEETS_CALL_DEADLINE_SECONDS', 0.0)
+    schedules = sheets[SCHEDULE]
+    schedules.fail_before['batch_update'] = [FakeAPIError(503), FakeAPIError(400)]
+    assert utils.update_schedule('2025/06/10', 'B', {'開催場所': 'ホール'})[0]
+    assert sheets_journal._drain()
+    stats = sheets_journal.get_journal_stats()
+    assert stats['pending'] == 0 and stats['dropped'] == 1 and stats['failures'] == 1
+
+
+def test_unknown_outcome_add_schedule_is_not_inserted_twice(sheets, sheets_journal):
+    schedules = sheets[SCHEDULE]
+    # 挿入はシートに反映されたが、応答を受け取る前にタイムアウトした
+    schedules.fail_after['insert_row'] = [read_timeout()]
+    success, message = utils.add_schedule(NEW_SCHEDULE)
+    assert success and '受け付けました' in message
+    assert sheets_journal._drain()
+    assert schedules.column('タイトル') == ['A', 'B', 'D', 'C']
+    assert schedules.calls.count('insert_row') == 1
+
+
+def test_journal_is_unavailable_while_another_process_holds_it(sheets, sheets_journal, monkeypatch):
+    assert sheets_journal._acquire_file_lock(Config.GOOGLE_SHEETS_JOURNAL_PATH)
+    other_process_lock = sheets_journal._lock_file
+    monkeypatch.setattr(sheets_journal, '_lock_file', None)
+    try:
+        assert sheets_journal.is_enabled()
+        assert utils.update_schedule('2025/06/10', 'B', {'開催場所': 'ホール'})[0]
+        assert not sheets_journal.is_enabled()
+        assert sheets[SCHEDULE].column('開催場所') == ['会議室', 'ホール', '会議室']
+        assert sheets_journal.get_journal_stats()['appended'] == 0
+    finally:
+        other_process_lock.close()
+
+
+def test_compaction_keeps_only_pending_entries(sheets, sheets_journal, monkeypatch):
+    monkeypatch.setattr(Config, 'GOOGLE_SHEETS_JOURNAL_COMPACT_THRESHOLD', 2)
+    pending_id, _ = sheets_journal.append('delete_row_by_criteria', {'worksheet_name': ATTENDEES, 'criteria': {'参加者ID': 'U9'}})
+    sheets_journal.defer(pending_id)
+    for _ in range(2):
+        entry_id, _ = sheets_journal.append('delete_row_by_criteria', {'worksheet_name': ATTENDEES, 'criteria': {'参加者ID': 'U8'}})
+        sheets_journal.complete(entry_id)
+    assert sheets_journal.get_journal_stats()['compactions'] == 1
+    with open(Config.GOOGLE_SHEETS_JOURNAL_PATH, encoding='utf-8') as f:
+        assert [json.loads(line)['id'] for line in f] == [pending_id]
+
+
+def test_replayed_attendee_keeps_the_time_it_was_registered(sheets, sheets_journal, clock, monkeypatch):
+    monkeypatch.setattr(Config, 'GOOGLE_SHEETS_CALL_DEADLINE_SECONDS', 0.0)
+    attendees = sheets[ATTENDEES]
+    attendees.fail_before['append_rows'] = [FakeAPIError(503)]
+    assert utils.update_or_add_attendee('2025/06/20', 'C', 'U3', 'u3', '〇', '')[0]
+    clock.current = datetime(2025, 6, 1, 9, 30)
+    assert utils.update_or_add_attendee('2025/06/20', 'C', 'U3', 'u3', '×', '欠席')[0]
+    # 接続が戻ってから数時間後に再送された
+    clock.current = datetime(2025, 6, 1, 15, 0)
+    assert sheets_journal._drain()
+    row = attendees.column('参加者ID').index('U3')
+    assert attendees.column('登録日時')[row] == '2025/06/01 09:00'
+    assert attendees.column('更新日時')[row] == '2025/06/01 09:30'
+    assert attendees.column('出欠')[row] == '×'
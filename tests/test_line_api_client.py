@@ -0,0 +1,64 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+import requests
+from linebot.v3.messaging import ApiException, ReplyMessageRequest, TextMessage
+
+from utils import event_context
+from utils.line_api_client import DeadlineAwareMessagingApi
+
+
+class _FakeMessagingApi:
+    def __init__(self, reply_error=None):
+        self.reply_error = reply_error
+        self.replies = []
+        self.pushes = []
+
+    def reply_message(self, request):
+        if self.reply_error is not None:
+            raise self.reply_error
+        self.replies.append(request)
+
+    def push_message(self, request):
+        self.pushes.append(request)
+
+
+def _event():
+    return SimpleNamespace(source=SimpleNamespace(user_id='U1'), reply_token='token', timestamp=None)
+
+
+def _reply(api):
+    DeadlineAwareMessagingApi(api).reply_message(ReplyMessageRequest(reply_token='token', messages=[TextMessage(text='ok')]))
+
+
+def test_invalid_reply_token_falls_back_to_push():
+    api = _FakeMessagingApi(ApiException(status=400, reason='Invalid reply token'))
+    with event_context.handling(_event()):
+        _reply(api)
+    assert len(api.pushes) == 1
+
+
+@pytest.mark.parametrize('error', [ApiException(status=500, reason='Internal Server Error'), requests.exceptions.ReadTimeout()])
+def test_other_failures_are_not_pushed(error):
+    api = _FakeMessagingApi(error)
+    with event_context.handling(_event()):
+        with pytest.raises(type(error)):
+            _reply(api)
+    assert api.pushes == []
+
+
+def test_failure_after_reply_deadline_falls_back_to_push():
+    api = _FakeMessagingApi(ApiException(status=500, reason='Internal Server Error'))
+    with event_context.handling(_event()) as context:
+        context.reply_deadline = time.monotonic() - 1
+        _reply(api)
+    assert len(api.pushes) == 1
+
+
+def test_reply_after_interim_reply_is_pushed():
+    api = _FakeMessagingApi()
+    with event_context.handling(_event()) as context:
+        context.reply_token_used = True
+        _reply(api)
+    assert api.replies == [] and len(api.pushes) == 1
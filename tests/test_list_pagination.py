@@ -0,0 +1,62 @@
+import pytest
+
+from config import Config
+from line_handlers import list_pagination
+from utils import session_store
+
+
+@pytest.fixture(autouse=True)
+def _fresh_pagination(monkeypatch):
+    monkeypatch.setattr(list_pagination, '_rendered_pages', {})
+    monkeypatch.setattr(list_pagination, '_render_stats', {'hits': 0, 'misses': 0})
+    monkeypatch.setattr(session_store, '_store', session_store.InMemorySessionStore(3600, 100))
+
+
+def _texts(messages):
+    return [message.text for message in messages]
+
+
+def test_pages_follow_page_size_until_the_end(monkeypatch):
+    monkeypatch.setattr(Config, 'LIST_PAGE_SIZE', 2)
+    entries = [f"予定{i}\n" for i in range(5)]
+    offset, pages = 0, []
+    while offset is not None:
+        messages, offset = list_pagination.build_page_messages("【一覧】\n", entries, offset)
+        pages.append(messages)
+    assert len(pages) == 3
+    assert _texts(pages[0])[0].startswith("【一覧】\n予定0\n予定1\n（2/5件を表示）")
+    assert pages[0][-1].quick_reply.items[0].action.text == list_pagination.NEXT_PAGE_COMMAND
+    assert _texts(pages[2]) == ["【一覧】\n予定4\n"]
+    assert pages[2][-1].quick_reply is None
+
+
+def test_long_entries_are_split_within_one_reply(monkeypatch):
+    monkeypatch.setattr(Config, 'LIST_PAGE_SIZE', 100)
+    entries = ['あ' * 3000] * 8
+    messages, next_offset = list_pagination.build_page_messages("", entries)
+    assert len(messages) == list_pagination.MAX_MESSAGES_PER_REPLY
+    assert all(len(text) <= list_pagination.MAX_TEXT_LENGTH for text in _texts(messages))
+    assert next_offset == list_pagination.MAX_MESSAGES_PER_REPLY
+    rest, next_offset = list_pagination.build_page_messages("", entries, next_offset)
+    assert len(rest) == 3 and next_offset is None
+
+
+def test_rendered_page_is_reused_until_the_version_changes():
+    version = list_pagination.render_version(1)
+    assert list_pagination.get_rendered_page('schedules', version, 0) is None
+    list_pagination.store_rendered_page('schedules', version, 0, ['page0'], 10)
+    list_pagination.store_rendered_page('schedules', version, 10, ['page1'], None)
+    assert list_pagination.get_rendered_page('schedules', version, 10) == (['page1'], None)
+
+    new_version = list_pagination.render_version(2)
+    assert list_pagination.get_rendered_page('schedules', new_version, 0) is None
+    list_pagination.store_rendered_page('schedules', new_version, 0, ['new page0'], 10)
+    # 古い版のページは同じ一覧のページを保存した時点で破棄される
+    assert list_pagination.get_render_cache_stats() == {'entries': 1, 'hits': 1, 'misses': 2}
+
+
+def test_cursor_is_saved_until_the_last_page():
+    list_pagination.save_cursor('U1', 'attendees', 10)
+    assert list_pagination.load_cursor('U1') == {'list': 'attendees', 'offset': 10}
+    list_pagination.save_cursor('U1', 'attendees', None)
+    assert list_pagination.load_cursor('U1') is None
@@ -0,0 +1,88 @@
+import json
+from datetime import datetime
+
+from config import Config
+from google_sheets import utils
+from tests.conftest import FakeAPIError, read_timeout
+
+SCHEDULE = Config.GOOGLE_SHEETS_SCHEDULE_WORKSHEET_NAME
+ATTENDEES = Config.GOOGLE_SHEETS_ATTENDEES_WORKSHEET_NAME
+
+NEW_SCHEDULE = {'日付': '2025/06/15', '開始時刻': '10:00', 'タイトル': 'D', '開催場所': '会議室',
+                '詳細': '', '申込締切日': '', '規模': ''}
+
+
+def test_add_schedule_keeps_date_order_in_mirror(sheets, local_mirror):
+    utils.get_all_records(SCHEDULE)
+    assert utils.add_schedule(NEW_SCHEDULE)[0]
+    assert utils.add_schedule(dict(NEW_SCHEDULE, 日付='2025/05/01', タイトル='E'))[0]
+    assert utils.add_schedule(dict(NEW_SCHEDULE, 日付='2025/06/10', タイトル='F'))[0]
+    assert utils.get_all_records(SCHEDULE)['タイトル'].tolist() == ['E', 'A', 'B', 'F', 'D', 'C']
+    assert local_mirror._drain_outbox(local_mirror._conn)
+    assert sheets[SCHEDULE].column('タイトル') == ['E', 'A', 'B', 'F', 'D', 'C']
+
+
+def test_unknown_outcome_insert_is_not_duplicated_on_retry(sheets, local_mirror):
+    schedules = sheets[SCHEDULE]
+    schedules.fail_after['insert_row'] = [read_timeout()]
+    assert utils.add_schedule(NEW_SCHEDULE)[0]
+    assert not local_mirror._drain_outbox(local_mirror._conn)
+    assert local_mirror._drain_outbox(local_mirror._conn)
+    assert schedules.column('タイトル') == ['A', 'B', 'D', 'C']
+
+
+def test_failing_write_moves_to_dead_letters_after_max_attempts(sheets, local_mirror, monkeypatch):
+    monkeypatch.setattr(Config, 'GOOGLE_SHEETS_MIRROR_MAX_ATTEMPTS', 2)
+    monkeypatch.setattr(Config, 'GOOGLE_SHEETS_CALL_DEADLINE_SECONDS', 0.0)
+    schedules = sheets[SCHEDULE]
+    schedules.fail_before['batch_update'] = [FakeAPIError(503), FakeAPIError(503)]
+    utils.get_all_records(SCHEDULE)
+    assert utils.update_schedule('2025/06/10', 'B', {'開催場所': 'ホール'})[0]
+    assert utils.delete_schedule_by_date_title('2025/06/20', 'C')[0]
+    assert not local_mirror._drain_outbox(local_mirror._conn)
+    assert local_mirror._drain_outbox(local_mirror._conn)
+    stats = local_mirror.get_mirror_stats()
+    assert stats['pending'] == 0 and stats['dead_letters'] == 1
+    # 後続の削除は止まらずに反映される
+    assert schedules.column('タイトル') == ['A', 'B']
+    operation, arguments = local_mirror._conn.execute("SELECT operation, arguments FROM outbox_dead_letters").fetchone()
+    assert operation == 'update_schedule' and json.loads(arguments)['original_title'] == 'B'
+
+
+def test_permanent_failure_moves_to_dead_letters_immediately(sheets, local_mirror):
+    attendees = sheets[ATTENDEES]
+    attendees.fail_before['append_rows'] = [FakeAPIError(400)]
+    assert utils.update_or_add_attendee('2025/06/20', 'C', 'U3', 'u3', '〇', '')[0]
+    assert local_mirror._drain_outbox(local_mirror._conn)
+    assert local_mirror.get_mirror_stats()['dead_letters'] == 1
+    assert 'U3' not in attendees.column('参加者ID')
+
+
+def test_submit_returns_failure_when_mirror_cannot_be_written(sheets, local_mirror, monkeypatch):
+    monkeypatch.setattr(Config, 'GOOGLE_SHEETS_MIRROR_PATH', '/nonexistent/directory/mirror.db')
+    success, message = utils.add_schedule(NEW_SCHEDULE)
+    assert not success and 'エラー' in message
+    assert utils.delete_row_by_criteria(ATTENDEES, {'参加者ID': 'U1'}) is False
+
+
+def test_pull_moves_data_version_only_when_the_sheet_changed(sheets, local_mirror):
+    utils.get_all_records(SCHEDULE)
+    before = utils.get_data_version(SCHEDULE)
+    assert local_mirror.pull(SCHEDULE)
+    assert utils.get_data_version(SCHEDULE) == before
+    sheets[SCHEDULE].values[1][3] = 'ホール'
+    assert local_mirror.pull(SCHEDULE)
+    assert utils.get_data_version(SCHEDULE) > before
+    assert utils.get_all_records(SCHEDULE)['開催場所'].tolist()[0] == 'ホール'
+
+
+def test_replicated_attendee_keeps_the_time_it_was_registered(sheets, local_mirror, clock):
+    utils.get_all_records(ATTENDEES)
+    assert utils.update_or_add_attendee('2025/06/20', 'C', 'U3', 'u3', '〇', '')[0]
+    # 同期スレッドがシートへ反映したのは数時間後
+    clock.current = datetime(2025, 6, 1, 15, 0)
+    assert local_mirror._drain_outbox(local_mirror._conn)
+    attendees = sheets[ATTENDEES]
+    row = attendees.column('参加者ID').index('U3')
+    assert attendees.column('登録日時')[row] == '2025/06/01 09:00'
+    assert attendees.column('更新日時')[row] == '2025/06/01 09:00'
@@ -0,0 +1,90 @@
+import pytest
+
+from config import Config
+from google_sheets import rate_limiter, utils
+from tests.conftest import FakeAPIError, connection_timeout, read_timeout
+
+
+def _flaky(errors: list, result='ok'):
+    calls = []
+
+    def func():
+        calls.append(1)
+        if errors:
+            raise errors.pop(0)
+        return result
+    return func, calls
+
+
+@pytest.mark.parametrize('error', [FakeAPIError(429), FakeAPIError(503), read_timeout(), connection_timeout()])
+def test_idempotent_call_retries_transient_errors(error):
+    func, calls = _flaky([error])
+    assert rate_limiter.call('write', func) == 'ok'
+    assert len(calls) == 2
+
+
+def test_permanent_error_is_not_retried():
+    func, calls = _flaky([FakeAPIError(400)])
+    with pytest.raises(FakeAPIError):
+        rate_limiter.call('write', func)
+    assert len(calls) == 1
+
+
+@pytest.mark.parametrize('error', [FakeAPIError(503), read_timeout()])
+def test_non_idempotent_call_is_not_retried_when_outcome_is_unknown(error):
+    func, calls = _flaky([error])
+    with pytest.raises(type(error)):
+        rate_limiter.call('write', func, idempotent=False)
+    assert len(calls) == 1
+
+
+@pytest.mark.parametrize('error', [FakeAPIError(429), connection_timeout()])
+def test_non_idempotent_call_is_retried_when_request_was_not_applied(error):
+    func, calls = _flaky([error])
+    assert rate_limiter.call('write', func, idempotent=False) == 'ok'
+    assert len(calls) == 2
+
+
+def test_deadline_stops_retrying(monkeypatch):
+    monkeypatch.setattr(Config, 'GOOGLE_SHEETS_RETRY_BASE_SECONDS', 10.0)
+    monkeypatch.setattr(Config, 'GOOGLE_SHEETS_RETRY_MAX_SECONDS', 10.0)
+    func, calls = _flaky([FakeAPIError(503), FakeAPIError(503)])
+    with pytest.raises(FakeAPIError):
+        rate_limiter.call('write', func, deadline=__import__('time').monotonic() + 1)
+    assert len(calls) == 1
+
+
+def test_is_transient():
+    assert rate_limiter.is_transient(FakeAPIError(429))
+    assert rate_limiter.is_transient(FakeAPIError(500))
+    assert rate_limiter.is_transient(read_timeout())
+    assert rate_limiter.is_transient(rate_limiter.DeadlineExceededError())
+    assert not rate_limiter.is_transient(FakeAPIError(400))
+    assert not rate_limiter.is_transient(FakeAPIError(404))
+
+
+def test_batch_update_rows_sends_a_fresh_payload_on_retry(sheets):
+    attendees = sheets[Config.GOOGLE_SHEETS_ATTENDEES_WORKSHEET_NAME]
+    attendees.fail_after['batch_update'] = [FakeAPIError(503)]
+    assert utils.batch_update_rows(Config.GOOGLE_SHEETS_ATTENDEES_WORKSHEET_NAME, {3: {'備考': 'x'}}) == ['備考']
+    assert attendees.calls.count('batch_update') == 2
+    assert attendees.values[2][5] == 'x'
+
+
+def test_timed_out_delete_is_not_repeated_on_the_next_row(sheets):
+    schedules = sheets[Config.GOOGLE_SHEETS_SCHEDULE_WORKSHEET_NAME]
+    utils.get_all_records(Config.GOOGLE_SHEETS_SCHEDULE_WORKSHEET_NAME)
+    # 削除はシートに反映されたが、応答を受け取る前にタイムアウトした
+    schedules.fail_after['delete_rows'] = [read_timeout()]
+    success, _ = utils.delete_schedule_by_date_title('2025/06/01', 'A')
+    assert not success
+    assert schedules.column('タイトル') == ['B', 'C']
+    assert schedules.calls.count('delete_rows') == 1
+
+
+def test_timed_out_append_is_not_duplicated(sheets):
+    attendees = sheets[Config.GOOGLE_SHEETS_ATTENDEES_WORKSHEET_NAME]
+    attendees.fail_after['append_rows'] = [read_timeout()]
+    success, _ = utils.update_or_add_attendee('2025/06/20', 'C', 'U3', 'u3', '〇', '')
+    assert not success
+    assert attendees.column('参加者ID').count('U3') == 1
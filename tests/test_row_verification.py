@@ -0,0 +1,74 @@
+from config import Config
+from google_sheets import utils
+from tests.conftest import FakeAPIError, connection_timeout
+
+SCHEDULE = Config.GOOGLE_SHEETS_SCHEDULE_WORKSHEET_NAME
+ATTENDEES = Config.GOOGLE_SHEETS_ATTENDEES_WORKSHEET_NAME
+
+
+def _shift_rows_then_fail(worksheet, method_name: str, error):
+    """初回の呼び出しの前に他のクライアントが先頭へ1行挿入し、その呼び出しは反映前に失敗したことにします。"""
+    original = getattr(worksheet, method_name)
+    state = {'first': True}
+
+    def wrapper(*args, **kwargs):
+        if state['first']:
+            state['first'] = False
+            worksheet.values.insert(1, ['2025/05/01', '09:00', 'Z', '', '', '', ''])
+            worksheet.calls.append(method_name)
+            raise error
+        return original(*args, **kwargs)
+    setattr(worksheet, method_name, wrapper)
+
+
+def test_delete_relocates_row_shifted_by_another_client(sheets):
+    schedules = sheets[SCHEDULE]
+    utils.get_all_records(SCHEDULE)
+    schedules.values.insert(1, ['2025/05/01', '09:00', 'Z', '', '', '', ''])
+    success, _ = utils.delete_schedule_by_date_title('2025/06/10', 'B')
+    assert success
+    assert schedules.column('タイトル') == ['Z', 'A', 'C']
+
+
+def test_every_retry_verifies_the_row_again(sheets):
+    schedules = sheets[SCHEDULE]
+    utils.get_all_records(SCHEDULE)
+    _shift_rows_then_fail(schedules, 'delete_rows', connection_timeout())
+    success, _ = utils.delete_schedule_by_date_title('2025/06/10', 'B')
+    assert success
+    assert schedules.column('タイトル') == ['Z', 'A', 'C']
+    assert schedules.calls.count('batch_get') >= 2
+
+
+def test_update_retry_verifies_the_row_again(sheets):
+    schedules = sheets[SCHEDULE]
+    utils.get_all_records(SCHEDULE)
+    _shift_rows_then_fail(schedules, 'batch_update', FakeAPIError(503))
+    success, _ = utils.update_schedule('2025/06/10', 'B', {'開催場所': 'ホール'})
+    assert success
+    assert schedules.column('開催場所') == ['', '会議室', 'ホール', '会議室']
+
+
+def test_gives_up_when_rows_keep_moving(sheets, monkeypatch):
+    monkeypatch.setattr(Config, 'GOOGLE_SHEETS_ROW_VERIFY_ATTEMPTS', 2)
+    schedules = sheets[SCHEDULE]
+    original_batch_get = schedules.batch_get
+
+    def moving_batch_get(ranges, **kwargs):
+        schedules.values.insert(1, ['2025/05/01', '09:00', 'Z', '', '', '', ''])
+        return original_batch_get(ranges, **kwargs)
+    schedules.batch_get = moving_batch_get
+
+    success, _ = utils.delete_schedule_by_date_title('2025/06/10', 'B')
+    assert not success
+    assert 'B' in schedules.column('タイトル')
+    assert 'delete_rows' not in schedules.calls
+
+
+def test_delete_row_by_criteria_checks_criteria_columns(sheets):
+    attendees = sheets[ATTENDEES]
+    utils.get_all_records(ATTENDEES)
+    # 他のクライアントが U2 の行を削除し、同じ行番号に別の参加者の行が来た
+    attendees.values[3] = ['2025/06/10', 'B', 'U3', 'u3', '〇', '', '', '']
+    assert not utils.delete_row_by_criteria(ATTENDEES, {'日付': '2025/06/10', 'タイトル': 'B', '参加者ID': 'U2'})
+    assert attendees.column('参加者ID') == ['U1', 'U1', 'U3']
@@ -0,0 +1,132 @@
+from types import SimpleNamespace
+
+import pytest
+
+from config import SessionState
+from utils import session_store
+from utils.session_manager import (
+    clear_all_session_data, delete_user_session_data, get_user_session, get_user_session_data, set_user_session
+)
+
+
+def _close(store):
+    if isinstance(store, session_store.SQLiteSessionStore):
+        store._conn.close()
+
+
+def _new_store(backend, tmp_path, idle_ttl=3600, max_entries=100):
+    if backend == 'memory':
+        return session_store.InMemorySessionStore(idle_ttl, max_entries)
+    return session_store.SQLiteSessionStore(str(tmp_path / 'sessions.db'), idle_ttl, max_entries)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """session_store の time を、テストから進められる時計に差し替えます。"""
+    clock = SimpleNamespace(now=1000000.0)
+    monkeypatch.setattr(session_store, 'time', SimpleNamespace(monotonic=lambda: clock.now, time=lambda: clock.now))
+    return clock
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def store(request, tmp_path, monkeypatch):
+    """両方のバックエンドで同じテストを行うため、session_manager が使うストアを差し替えます。"""
+    store = _new_store(request.param, tmp_path)
+    monkeypatch.setattr(session_store, '_store', store)
+    yield store
+    _close(store)
+
+
+def test_state_and_data_round_trip(store):
+    data = {'日付': '2025/06/15', 'タイトル': '会議', 'unregistered_events': [{'date': '2025/06/20', 'title': 'C'}]}
+    set_user_session('U1', SessionState.ASKING_SCHEDULE_START_TIME, data)
+    state, session_data = get_user_session('U1')
+    assert state == SessionState.ASKING_SCHEDULE_START_TIME
+    assert dict(session_data) == data
+    assert get_user_session('U2') == (SessionState.NONE, None)
+
+
+def test_transitions_replace_state_and_data_together(store):
+    set_user_session('U1', SessionState.ASKING_SCHEDULE_DATE, {'日付': '2025/06/15'})
+    state, session_data = get_user_session('U1')
+    session_data['開始時刻'] = '10:00'
+    set_user_session('U1', SessionState.ASKING_SCHEDULE_TITLE, session_data)
+    state, session_data = get_user_session('U1')
+    assert state == SessionState.ASKING_SCHEDULE_TITLE
+    assert dict(session_data) == {'日付': '2025/06/15', '開始時刻': '10:00'}
+    # フローの終了で状態とデータをまとめて破棄する
+    set_user_session('U1', SessionState.NONE, None)
+    assert get_user_session('U1') == (SessionState.NONE, None)
+
+
+def test_data_can_be_deleted_while_keeping_the_state(store):
+    set_user_session('U1', SessionState.ASKING_SCHEDULE_DATE, {'日付': '2025/06/15'})
+    delete_user_session_data('U1')
+    assert get_user_session('U1') == (SessionState.ASKING_SCHEDULE_DATE, None)
+    SessionState.clear_state('U1')
+    assert get_user_session_data('U1') is None
+    assert store.stats()['active'] == 0
+
+
+def test_clear_removes_every_session(store):
+    set_user_session('U1', SessionState.ASKING_SCHEDULE_DATE, {'日付': '2025/06/15'})
+    set_user_session('U2', SessionState.ASKING_SCHEDULE_TITLE, None)
+    clear_all_session_data()
+    assert get_user_session('U1') == (SessionState.NONE, None)
+    assert get_user_session('U2') == (SessionState.NONE, None)
+    assert store.stats()['active'] == 0
+
+
+def test_sqlite_sessions_are_shared_through_the_file(tmp_path):
+    path = str(tmp_path / 'sessions.db')
+    # 同じファイルを開く2つのプロセスに相当する、別々の接続
+    first = session_store.SQLiteSessionStore(path, 3600, 100)
+    second = session_store.SQLiteSessionStore(path, 3600, 100)
+    try:
+        first.save('U1', SessionState.ASKING_ATTENDANCE_STATUS, {'出欠': '〇'})
+        state, data = second.get('U1')
+        assert state == SessionState.ASKING_ATTENDANCE_STATUS and dict(data) == {'出欠': '〇'}
+        second.save('U1', None, None)
+        assert first.get('U1') == (None, None)
+    finally:
+        _close(first)
+        _close(second)
+
+
+@pytest.mark.parametrize('backend', ['memory', 'sqlite'])
+def test_idle_session_expires(backend, tmp_path, clock):
+    store = _new_store(backend, tmp_path, idle_ttl=60)
+    try:
+        store.save('U1', SessionState.ASKING_SCHEDULE_DATE, {'日付': '2025/06/15'})
+        clock.now += 30
+        assert store.get('U1')[0] == SessionState.ASKING_SCHEDULE_DATE
+        clock.now += 61
+        assert store.get('U1') == (None, None)
+        assert store.stats() == {'active': 0, 'expired': 1, 'evicted': 0}
+    finally:
+        _close(store)
+
+
+@pytest.mark.parametrize('backend', ['memory', 'sqlite'])
+def test_least_recently_used_session_is_evicted_over_the_cap(backend, tmp_path, clock):
+    store = _new_store(backend, tmp_path, idle_ttl=0, max_entries=2)
+    try:
+        for user_id in ('U1', 'U2'):
+            store.save(user_id, SessionState.ASKING_SCHEDULE_DATE, None)
+            clock.now += 1
+        store.set_state('U1', SessionState.ASKING_SCHEDULE_TITLE) # U1 を最近使ったものにする
+        clock.now += 1
+        store.save('U3', SessionState.ASKING_SCHEDULE_DATE, None)
+        stats = store.stats()
+        assert stats['active'] == 2 and stats['evicted'] == 1
+        assert store.get('U2') == (None, None)
+        assert store.get('U1')[0] == SessionState.ASKING_SCHEDULE_TITLE
+    finally:
+        _close(store)
+
+
+def test_session_stats_are_included_in_the_app_stats(main_module, store):
+    set_user_session('U1', SessionState.ASKING_SCHEDULE_DATE, None)
+    stats = main_module.collect_stats()
+    assert stats['sessions']['active'] == 1
+    assert {'webhook_dedup', 'worker_pool', 'sheets_cache', 'attendee_write_behind'} <= set(stats)
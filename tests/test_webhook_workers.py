@@ -0,0 +1,102 @@
+import base64
+import hashlib
+import hmac
+import json
+import threading
+import time
+
+import pytest
+
+from config import Config
+from utils import event_dedup, worker_pool
+
+
+@pytest.fixture(autouse=True)
+def _fresh_workers(monkeypatch):
+    monkeypatch.setattr(Config, 'WEBHOOK_WORKER_COUNT', 4)
+    monkeypatch.setattr(Config, 'SESSION_STORE_PATH', None)
+    monkeypatch.setattr(worker_pool, '_queues', [])
+    monkeypatch.setattr(worker_pool, '_threads', [])
+    monkeypatch.setattr(worker_pool, '_stats', dict.fromkeys(worker_pool._stats, 0))
+    monkeypatch.setattr(event_dedup, '_seen_events', event_dedup.OrderedDict())
+    monkeypatch.setattr(event_dedup, '_stats', dict.fromkeys(event_dedup._stats, 0))
+
+
+def _wait_for_workers():
+    for job_queue in worker_pool._queues:
+        job_queue.join()
+
+
+def _webhook(client, event_id, text, redelivery=False):
+    body = json.dumps({
+        'destination': 'Ubot',
+        'events': [{
+            'type': 'message',
+            'mode': 'active',
+            'timestamp': int(time.time() * 1000),
+            'source': {'type': 'user', 'userId': 'U1'},
+            'webhookEventId': event_id,
+            'deliveryContext': {'isRedelivery': redelivery},
+            'replyToken': f'token-{event_id}',
+            'message': {'id': event_id, 'type': 'text', 'text': text, 'quoteToken': 'q'},
+        }],
+    })
+    signature = base64.b64encode(
+        hmac.new(Config.LINE_CHANNEL_SECRET.encode('utf-8'), body.encode('utf-8'), hashlib.sha256).digest()
+    ).decode('utf-8')
+    return client.post('/callback', data=body, headers={'X-Line-Signature': signature, 'Content-Type': 'application/json'})
+
+
+def test_jobs_with_the_same_key_run_in_order_on_one_worker():
+    first_started = threading.Event()
+    release_first = threading.Event()
+    runs = []
+
+    def job(name):
+        if name == 'first':
+            first_started.set()
+            release_first.wait(5)
+        runs.append((name, threading.current_thread().name))
+
+    assert worker_pool.submit('U1', job, 'first')
+    assert first_started.wait(5)
+    # 1件目が処理中でも、同じユーザーの2件目は他のワーカーで先に実行されない
+    assert worker_pool.submit('U1', job, 'second')
+    time.sleep(0.05)
+    assert runs == []
+    release_first.set()
+    _wait_for_workers()
+    assert [name for name, _ in runs] == ['first', 'second']
+    assert runs[0][1] == runs[1][1]
+
+
+def test_same_key_always_maps_to_the_same_queue():
+    gate = threading.Event()
+    for _ in range(3):
+        assert worker_pool.submit('U1', gate.wait, 5)
+    assert [job_queue.unfinished_tasks for job_queue in worker_pool._queues if job_queue.unfinished_tasks] == [3]
+    gate.set()
+    _wait_for_workers()
+
+
+@pytest.mark.parametrize('async_processing', [True, False])
+def test_failed_event_is_processed_again_when_redelivered(main_module, monkeypatch, async_processing):
+    monkeypatch.setattr(Config, 'WEBHOOK_ASYNC_PROCESSING', async_processing)
+    processed = []
+
+    def process_message(event, received_at=None):
+        processed.append(event.message.text)
+        if len(processed) == 1:
+            raise RuntimeError('Sheets unavailable')
+
+    monkeypatch.setattr(main_module, 'process_message', process_message)
+    client = main_module.app.test_client()
+    _webhook(client, 'E1', 'スケジュール一覧')
+    _wait_for_workers()
+    _webhook(client, 'E1', 'スケジュール一覧', redelivery=True)
+    _wait_for_workers()
+    assert processed == ['スケジュール一覧', 'スケジュール一覧']
+    # 処理に成功したイベントの再送は捨てる
+    _webhook(client, 'E1', 'スケジュール一覧', redelivery=True)
+    _wait_for_workers()
+    assert len(processed) == 2
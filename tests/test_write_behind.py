@@ -0,0 +1,87 @@
+from config import Config
+from google_sheets import utils
+from tests.conftest import FakeAPIError
+
+ATTENDEES = Config.GOOGLE_SHEETS_ATTENDEES_WORKSHEET_NAME
+
+
+def test_updates_to_the_same_attendance_are_coalesced(sheets, attendee_write_behind):
+    assert utils.update_or_add_attendee('2025/06/20', 'C', 'U3', 'u3', '〇', '') == (True, "参加予定を新規登録しました。")
+    assert utils.update_or_add_attendee('2025/06/20', 'C', 'U3', 'u3', '×', '欠席') == (True, "参加予定を更新しました。")
+    stats = attendee_write_behind.get_write_behind_stats()
+    assert stats['pending'] == 1 and stats['coalesced'] == 1
+    # 応答の文言を選ぶためにシートを読み込まない
+    assert sheets[ATTENDEES].calls == []
+
+
+def test_reply_wording_uses_the_loaded_index(sheets, attendee_write_behind):
+    utils.get_all_records(ATTENDEES)
+    assert utils.update_or_add_attendee('2025/06/10', 'B', 'U2', 'u2', '×', '') == (True, "参加予定を更新しました。")
+    assert sheets[ATTENDEES].calls == ['get_all_values']
+
+
+def test_flush_writes_updates_and_new_rows_in_one_request_each(sheets, attendee_write_behind):
+    attendees = sheets[ATTENDEES]
+    utils.update_or_add_attendee('2025/06/10', 'B', 'U2', 'u2', '×', '欠席')
+    utils.update_or_add_attendee('2025/06/20', 'C', 'U3', 'u3', '〇', '')
+    utils.update_or_add_attendee('2025/06/20', 'C', 'U4', 'u4', '△', '')
+    assert attendee_write_behind.flush()
+    assert attendees.calls.count('batch_update') == 1 and attendees.calls.count('append_rows') == 1
+    assert attendees.column('参加者ID') == ['U1', 'U1', 'U2', 'U3', 'U4']
+    assert attendees.column('出欠')[2] == '×'
+    assert attendee_write_behind.get_write_behind_stats()['pending'] == 0
+
+
+def test_pending_writes_are_visible_before_flush(sheets, attendee_write_behind):
+    utils.update_or_add_attendee('2025/06/20', 'C', 'U1', 'u1', '〇', '')
+    utils.update_or_add_attendee('2025/06/01', 'A', 'U1', 'u1', '×', '')
+    records = utils.get_user_attendee_records('U1')
+    assert sorted(zip(records['タイトル'], records['出欠'])) == [('A', '×'), ('B', '△'), ('C', '〇')]
+
+
+def test_failed_flush_keeps_writes_for_the_next_attempt(sheets, attendee_write_behind):
+    attendees = sheets[ATTENDEES]
+    attendees.fail_before['append_rows'] = [FakeAPIError(503)]
+    utils.update_or_add_attendee('2025/06/20', 'C', 'U3', 'u3', '〇', '')
+    assert not attendee_write_behind.flush()
+    assert attendee_write_behind.get_write_behind_stats()['pending'] == 1
+    assert attendee_write_behind.flush()
+    assert 'U3' in attendees.column('参加者ID')
+
+
+def test_pending_writes_survive_a_restart(sheets, attendee_write_behind, monkeypatch):
+    utils.update_or_add_attendee('2025/06/20', 'C', 'U3', 'u3', '〇', '')
+    attendee_write_behind._conn.close()
+    monkeypatch.setattr(attendee_write_behind, '_conn', None)
+    monkeypatch.setattr(attendee_write_behind, '_pending', {})
+    attendee_write_behind.resume()
+    assert attendee_write_behind.get_write_behind_stats()['pending'] == 1
+    assert attendee_write_behind.flush()
+    assert 'U3' in sheets[ATTENDEES].column('参加者ID')
+
+
+def test_rejected_write_is_dead_lettered_without_blocking_the_queue(sheets, attendee_write_behind):
+    attendees = sheets[ATTENDEES]
+    # まとめた append_rows と、1件ずつの反映し直しの最初の1件が 400 で拒否される
+    attendees.fail_before['append_rows'] = [FakeAPIError(400), FakeAPIError(400)]
+    utils.update_or_add_attendee('2025/06/20', 'C', 'U3', 'u3', '〇', '')
+    utils.update_or_add_attendee('2025/06/20', 'C', 'U4', 'u4', '△', '')
+    assert attendee_write_behind.flush()
+    stats = attendee_write_behind.get_write_behind_stats()
+    assert stats['pending'] == 0 and stats['dead_letters'] == 1 and stats['dead_lettered'] == 1
+    assert attendees.column('参加者ID') == ['U1', 'U1', 'U2', 'U4']
+    # 拒否された書き込みが、参加者シートからの削除を止めない
+    assert utils.delete_row_by_criteria(ATTENDEES, {'日付': '2025/06/20', 'タイトル': 'C', '参加者ID': 'U4'})
+    assert attendees.column('参加者ID') == ['U1', 'U1', 'U2']
+
+
+def test_write_failing_too_many_times_is_dead_lettered(sheets, attendee_write_behind, monkeypatch):
+    monkeypatch.setattr(Config, 'ATTENDEE_WRITE_BEHIND_MAX_ATTEMPTS', 2)
+    attendees = sheets[ATTENDEES]
+    attendees.fail_before['append_rows'] = [FakeAPIError(503), FakeAPIError(503)]
+    utils.update_or_add_attendee('2025/06/20', 'C', 'U3', 'u3', '〇', '')
+    assert not attendee_write_behind.flush()
+    assert attendee_write_behind.flush()
+    stats = attendee_write_behind.get_write_behind_stats()
+    assert stats['pending'] == 0 and stats['dead_letters'] == 1
+    assert 'U3' not in attendees.column('参加者ID')
@@ -0,0 +1,88 @@
+# utils/event_context.py
+
+import threading
+import time
+from contextlib import contextmanager
+
+from config import Config
+
+# 処理中のWebhookイベントごとの期限
+# 返信の期限（これを過ぎたら「処理中」の返信を先に送る）は、返信トークンの有効期間に合わせてイベントの発生時刻を起点にする。
+# イベント全体の期限（Sheets API 呼び出しはこれを超えて待たない）は、Webhookを受信した時刻を起点にする。
+# 発生時刻を起点にすると、LINEからの再送や待ち行列で待ったイベントが期限切れの状態で始まり、再試行が一切行われなくなるため。
+# 処理中のスレッドに紐づけて保持するため、ハンドラーや Sheets の呼び出し側で引数として受け渡す必要はない。
+
+_local = threading.local()
+
+
+class EventContext:
+    """1イベント分の返信先・返信トークン・期限（time.monotonic 基準）。"""
+
+    __slots__ = ('user_id', 'reply_token', 'reply_deadline', 'deadline', 'lock', 'reply_token_used')
+
+    def __init__(self, user_id: str, reply_token: str, reply_deadline: float, deadline: float):
+        self.user_id = user_id
+        self.reply_token = reply_token
+        self.reply_deadline = reply_deadline
+        self.deadline = deadline
+        self.lock = threading.Lock() # 返信トークンの使用を1回に限るためのロック
+        self.reply_token_used = False
+
+    def remaining(self) -> float:
+        """イベント全体の期限までの残り秒数。"""
+        return self.deadline - time.monotonic()
+
+
+def _monotonic_deadline(event, budget_seconds: float) -> float:
+    """
+    イベントの発生時刻（ミリ秒のUNIX時刻）から budget_seconds 後を time.monotonic 基準で返します。
+    """
+    now = time.monotonic()
+    timestamp = getattr(event, 'timestamp', None)
+    if not timestamp:
+        return now + budget_seconds
+    elapsed = max(time.time() - timestamp / 1000, 0)
+    return now + budget_seconds - elapsed
+
+
+def current() -> EventContext:
+    """現在のスレッドで処理中のイベントのコンテキストを返します。イベント処理中でなければ None。"""
+    return getattr(_local, 'context', None)
+
+
+def current_deadline() -> float:
+    """現在のスレッドで処理中のイベント全体の期限（time.monotonic 基準）を返します。イベント処理中でなければ None。"""
+    context = current()
+    return context.deadline if context is not None else None
+
+
+@contextmanager
+def handling(event, on_reply_deadline=None, received_at: float = None):
+    """
+    イベントの処理中、期限付きのコンテキストを現在のスレッドに設定します。
+    返信の期限までに処理が終わらない場合は、別スレッドから on_reply_deadline(context) を呼び出します。
+    :param event: linebot.v3.webhooks の MessageEvent
+    :param on_reply_deadline: 返信の期限を過ぎた時に呼び出す関数
+    :param received_at: Webhookを受信した時刻（time.monotonic 基準）。省略時は現在時刻
+    """
+    if received_at is None:
+        received_at = time.monotonic()
+    context = EventContext(
+        user_id=event.source.user_id,
+        reply_token=event.reply_token,
+        reply_deadline=_monotonic_deadline(event, Config.REPLY_DEADLINE_SECONDS),
+        deadline=received_at + Config.EVENT_DEADLINE_SECONDS,
+    )
+    timer = None
+    if on_reply_deadline is not None:
+        timer = threading.Timer(max(context.reply_deadline - time.monotonic(), 0), on_reply_deadline, args=(context,))
+        timer.daemon = True
+        timer.start()
+
+    _local.context = context
+    try:
+        yield context
+    finally:
+        _local.context = None
+        if timer is not None:
+            timer.cancel()
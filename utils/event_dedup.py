@@ -0,0 +1,155 @@
+# utils/event_dedup.py
+
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from config import Config
+
+# 処理済みWebhookイベントIDの記録（再送による二重処理の防止）
+# Config.SESSION_STORE_PATH が設定されていない場合は、プロセス内の OrderedDict に受信順に保持し、
+# 期間を過ぎたものと上限を超えたものを古い順に捨てる。この記録はプロセスごとのため、単一プロセスでのみ有効。
+# 設定されている場合は、セッションストアと同じSQLiteファイルの webhook_events テーブルに記録し、
+# 同じファイルを参照する複数のワーカープロセス・インスタンスの間で重複を判定する。
+
+_lock = threading.Lock()
+_seen_events = OrderedDict() # {webhook_event_id: 受信時刻(time.monotonic)}
+_conn = None
+_last_sweep = 0.0
+_stats = {'accepted': 0, 'duplicates': 0, 'redeliveries': 0}
+
+_SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS webhook_events (
+    event_id TEXT PRIMARY KEY,
+    seen_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_webhook_events_seen_at ON webhook_events (seen_at);
+"""
+# 共有ストアから期間を過ぎた・上限を超えたイベントIDを削除する間隔（秒）
+_SWEEP_INTERVAL_SECONDS = 60
+
+
+def _evict(now: float):
+    """
+    期間を過ぎたイベントIDと、上限を超えた分のイベントIDを古い順に削除します。呼び出し元で _lock を保持していること。
+    """
+    expire_before = now - Config.WEBHOOK_DEDUP_WINDOW_SECONDS
+    while _seen_events:
+        seen_at = next(iter(_seen_events.values()))
+        if seen_at >= expire_before and len(_seen_events) < Config.WEBHOOK_DEDUP_MAX_ENTRIES:
+            break
+        _seen_events.popitem(last=False)
+
+
+def _get_connection() -> sqlite3.Connection:
+    """共有ストア（セッションストアのSQLiteファイル）への接続を返します。呼び出し元で _lock を保持していること。"""
+    global _conn
+    if _conn is None:
+        conn = sqlite3.connect(Config.SESSION_STORE_PATH, check_same_thread=False, isolation_level=None, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(_SCHEMA_SQL)
+        _conn = conn
+    return _conn
+
+
+def _sweep(conn: sqlite3.Connection, now: float):
+    """
+    共有ストアから期間を過ぎたイベントIDと上限を超えた分を削除します。全プロセスで合わせて一定間隔に1回程度になるよう間引く。
+    呼び出し元で _lock を保持していること。
+    """
+    global _last_sweep
+    if now - _last_sweep < _SWEEP_INTERVAL_SECONDS:
+        return
+    _last_sweep = now
+    conn.execute("DELETE FROM webhook_events WHERE seen_at < ?", (now - Config.WEBHOOK_DEDUP_WINDOW_SECONDS,))
+    conn.execute(
+        "DELETE FROM webhook_events WHERE event_id IN "
+        "(SELECT event_id FROM webhook_events ORDER BY seen_at DESC LIMIT -1 OFFSET ?)",
+        (Config.WEBHOOK_DEDUP_MAX_ENTRIES,)
+    )
+
+
+def _mark_shared(event_id: str) -> bool:
+    """共有ストアにイベントIDを記録します。呼び出し元で _lock を保持していること。:return: 新規であればTrue"""
+    conn = _get_connection()
+    now = time.time() # プロセス間で比較するため、time.monotonic ではなく時刻を記録する
+    _sweep(conn, now)
+    if conn.execute("INSERT OR IGNORE INTO webhook_events (event_id, seen_at) VALUES (?, ?)", (event_id, now)).rowcount:
+        return True
+    # 削除前の、期間を過ぎた記録は新規として記録し直す
+    return conn.execute(
+        "UPDATE webhook_events SET seen_at = ? WHERE event_id = ? AND seen_at < ?",
+        (now, event_id, now - Config.WEBHOOK_DEDUP_WINDOW_SECONDS)
+    ).rowcount == 1
+
+
+def _mark_local(event_id: str) -> bool:
+    """プロセス内の記録にイベントIDを記録します。呼び出し元で _lock を保持していること。:return: 新規であればTrue"""
+    now = time.monotonic()
+    _evict(now)
+    if event_id in _seen_events:
+        return False
+    _seen_events[event_id] = now
+    return True
+
+
+def _event_id(event):
+    return getattr(event, 'webhook_event_id', None)
+
+
+def _is_redelivery(event) -> bool:
+    delivery_context = getattr(event, 'delivery_context', None)
+    return bool(getattr(delivery_context, 'is_redelivery', False))
+
+
+def mark_if_new(event) -> bool:
+    """
+    イベントを処理済みとして記録します。期間内に同じイベントIDを記録済みの場合は何もしません。
+    イベントIDを持たないイベントは常に新規として扱います。
+    :param event: linebot.v3.webhooks の Event
+    :return: 新規のイベントであればTrue、重複（処理済み）であればFalse
+    """
+    event_id = _event_id(event)
+    redelivered = _is_redelivery(event)
+    if not event_id:
+        return True
+
+    with _lock:
+        if redelivered:
+            _stats['redeliveries'] += 1
+        is_new = _mark_shared(event_id) if Config.SESSION_STORE_PATH else _mark_local(event_id)
+        if not is_new:
+            _stats['duplicates'] += 1
+            print(f"DEBUG: Duplicate webhook event {event_id} skipped (redelivery: {redelivered}).")
+            return False
+        _stats['accepted'] += 1
+        return True
+
+
+def forget(event):
+    """
+    イベントの記録を取り消します。処理に失敗し、再送時に改めて処理させたい場合に使用します。
+    """
+    event_id = _event_id(event)
+    if not event_id:
+        return
+    with _lock:
+        if Config.SESSION_STORE_PATH:
+            _get_connection().execute("DELETE FROM webhook_events WHERE event_id = ?", (event_id,))
+        else:
+            _seen_events.pop(event_id, None)
+
+
+def get_dedup_stats() -> dict:
+    """
+    受け付けたイベント数・重複として捨てたイベント数・再送されたイベント数と、記録中のイベントID数を返します。（監視・デバッグ用）
+    """
+    with _lock:
+        stats = dict(_stats)
+        if Config.SESSION_STORE_PATH:
+            stats['tracked'] = _get_connection().execute("SELECT COUNT(*) FROM webhook_events").fetchone()[0]
+        else:
+            stats['tracked'] = len(_seen_events)
+    return stats
@@ -0,0 +1,144 @@
+# utils/line_api_client.py
+
+import threading
+import time
+
+import urllib3
+from linebot.v3.messaging import ApiClient, ApiException, Configuration, MessagingApi, PushMessageRequest, ReplyMessageRequest, TextMessage
+
+from config import Config
+from utils import event_context
+
+# プロセス全体で共有するLINE Messaging APIクライアント
+# Keep-Alive の接続プールを1つだけ持ち、main.py と全てのハンドラーがこれを使い回すことで、
+# 応答のたびにTLSハンドシェイクが発生しないようにする。
+
+_lock = threading.Lock()
+_messaging_api = None
+_stats_lock = threading.Lock()
+_reply_stats = {'replies': 0, 'interim_replies': 0, 'pushed': 0, 'reply_failures': 0}
+
+INTERIM_REPLY_MESSAGE = "処理中です。結果はまもなくお送りしますので、少々お待ちください。"
+
+
+class _PooledApiClient(ApiClient):
+    """呼び出し側でタイムアウトを指定しなかったリクエストに、既定のタイムアウトを適用するApiClient。"""
+
+    def __init__(self, configuration, request_timeout):
+        super().__init__(configuration)
+        self._default_request_timeout = request_timeout
+
+    def request(self, *args, _request_timeout=None, **kwargs):
+        return super().request(*args, _request_timeout=_request_timeout or self._default_request_timeout, **kwargs)
+
+
+def _create_messaging_api() -> MessagingApi:
+    configuration = Configuration(access_token=Config.LINE_CHANNEL_ACCESS_TOKEN)
+    # 同時に処理するワーカー数以上の接続を保持できるようにする
+    configuration.connection_pool_maxsize = max(Config.LINE_API_POOL_SIZE, Config.WEBHOOK_WORKER_COUNT)
+    # 接続できなかった場合は全てのリクエストを再試行する。
+    # 429 / 5xx の応答で再試行するのは冪等なメソッド（GET など）のみで、返信・プッシュ（POST）が二重に送られないようにする
+    configuration.retries = urllib3.Retry(
+        total=Config.LINE_API_MAX_RETRIES,
+        connect=Config.LINE_API_MAX_RETRIES,
+        read=0,
+        status_forcelist=(429, 500, 502, 503, 504),
+        backoff_factor=Config.LINE_API_RETRY_BACKOFF_SECONDS,
+        raise_on_status=False,
+    )
+    request_timeout = (Config.LINE_API_CONNECT_TIMEOUT_SECONDS, Config.LINE_API_READ_TIMEOUT_SECONDS)
+    return MessagingApi(_PooledApiClient(configuration, request_timeout))
+
+
+def get_messaging_api() -> MessagingApi:
+    """
+    共有のMessagingApiインスタンスを返します。初回呼び出し時に一度だけ生成します（スレッドセーフ）。
+    """
+    global _messaging_api
+    if _messaging_api is None:
+        with _lock:
+            if _messaging_api is None:
+                _messaging_api = _create_messaging_api()
+                print("DEBUG: Shared LINE Messaging API client created.")
+    return _messaging_api
+
+
+def _record(**increments):
+    with _stats_lock:
+        for name, value in increments.items():
+            _reply_stats[name] += value
+
+
+def send_interim_reply(context: event_context.EventContext):
+    """
+    返信の期限までに処理が終わらなかったイベントに、返信トークンを使って「処理中」のメッセージを先に返します。
+    以降のそのイベントへの返信はプッシュメッセージで送られます。（event_context.handling から呼ばれる）
+    """
+    with context.lock:
+        if context.reply_token_used:
+            return # 期限直前にハンドラーが返信済み
+        context.reply_token_used = True
+    try:
+        get_messaging_api().reply_message(
+            ReplyMessageRequest(reply_token=context.reply_token, messages=[TextMessage(text=INTERIM_REPLY_MESSAGE)])
+        )
+        _record(interim_replies=1)
+        print(f"DEBUG: Reply deadline passed for user {context.user_id}. Sent interim reply.")
+    except Exception as e:
+        _record(reply_failures=1)
+        print(f"ERROR: Failed to send interim reply to user {context.user_id}: {e}")
+
+
+def _is_invalid_reply_token(e: Exception) -> bool:
+    """返信トークンが無効・期限切れのため返信が拒否されたかどうか（400 Bad Request）。"""
+    return isinstance(e, ApiException) and e.status == 400
+
+
+class DeadlineAwareMessagingApi:
+    """
+    ハンドラーに渡すMessagingApi。処理中のイベントの返信トークンが既に「処理中」の返信に使われていた場合や、
+    返信トークンが無効・期限切れ（400）で返信できなかった場合は、同じメッセージをプッシュメッセージで送ります。
+    返信の期限を過ぎてから送った返信が失敗した場合も、トークンの期限切れとみなしてプッシュで送ります。
+    それ以外の失敗（タイムアウト・5xx など）は、返信が届いている可能性があり二重に送らないよう、例外をそのまま送出します。
+    reply_message 以外の呼び出しは共有のMessagingApiにそのまま委譲します。
+    """
+
+    def __init__(self, messaging_api: MessagingApi):
+        self._messaging_api = messaging_api
+
+    def __getattr__(self, name):
+        return getattr(self._messaging_api, name)
+
+    def reply_message(self, reply_message_request: ReplyMessageRequest, *args, **kwargs):
+        context = event_context.current()
+        if context is None or context.reply_token != reply_message_request.reply_token:
+            return self._messaging_api.reply_message(reply_message_request, *args, **kwargs)
+
+        with context.lock:
+            use_reply_token = not context.reply_token_used
+            context.reply_token_used = True
+        if use_reply_token:
+            late = time.monotonic() >= context.reply_deadline
+            try:
+                response = self._messaging_api.reply_message(reply_message_request, *args, **kwargs)
+                _record(replies=1)
+                return response
+            except Exception as e:
+                _record(reply_failures=1)
+                if not (late or _is_invalid_reply_token(e)):
+                    raise
+                print(f"WARNING: Reply to user {context.user_id} failed ({e}). Falling back to push message.")
+        return self._push(context, reply_message_request.messages)
+
+    def _push(self, context: event_context.EventContext, messages):
+        response = self._messaging_api.push_message(PushMessageRequest(to=context.user_id, messages=messages))
+        _record(pushed=1)
+        return response
+
+
+def get_reply_stats() -> dict:
+    """
+    通常の返信数・「処理中」の返信数・プッシュで送った数・返信の失敗数を返します。（監視・デバッグ用）
+    """
+    with _stats_lock:
+        return dict(_reply_stats)
@@ -1,33 +1,49 @@
 # utils/session_manager.py
 
-import json
+from config import SessionState
+from utils.session_store import get_session_store
 
-# ユーザーごとのセッションデータを保持する辞書
-# {user_id: {data_key: data_value, ...}}
-_session_data_store = {}
+# ユーザーごとのセッションデータは utils/session_store.py のセッションストアに保存する
+# 状態とデータは1ユーザー1つの SessionRecord にまとめて保持され、データは {data_key: data_value, ...} の辞書と同様に扱える
+
+def get_user_session(user_id):
+    """
+    指定されたユーザーIDの会話状態とセッションデータを、1回の参照でまとめて取得します。
+    :return: (状態, セッションデータ) 状態がない場合は SessionState.NONE、データがない場合は None
+    """
+    state, data = get_session_store().get(user_id)
+    return (state if state is not None else SessionState.NONE), data
 
 def get_user_session_data(user_id):
     """
     指定されたユーザーIDのセッションデータを取得します。
     データが見つからない場合はNoneを返します。
     """
-    return _session_data_store.get(user_id)
+    _, data = get_session_store().get(user_id)
+    return data
 
 def set_user_session_data(user_id, data):
     """
     指定されたユーザーIDのセッションデータを設定します。
     """
-    _session_data_store[user_id] = data
+    get_session_store().set_data(user_id, data)
+
+def set_user_session(user_id, state, data):
+    """
+    指定されたユーザーIDの会話状態とセッションデータを、1回の操作でまとめて設定します。
+    状態の遷移とデータの更新を同時に行う箇所では、SessionState.set_state と set_user_session_data の代わりにこれを使う。
+    """
+    get_session_store().save(user_id, state, data)
+    print(f"DEBUG: User {user_id} state changed to: {state}")
 
 def delete_user_session_data(user_id):
     """
     指定されたユーザーIDのセッションデータを削除します。
     """
-    if user_id in _session_data_store:
-        del _session_data_store[user_id]
+    get_session_store().delete_data(user_id)
 
 def clear_all_session_data():
     """
     全てのセッションデータをクリアします。（テストやデバッグ用）
     """
-    _session_data_store.clear()
\ No newline at end of file
+    get_session_store().clear()
@@ -0,0 +1,450 @@
+# utils/session_store.py
+
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import MutableMapping
+
+from config import Config, SessionState
+
+# ユーザーごとの会話状態（SessionState）とセッションデータを保持するストア
+# 状態とデータは1ユーザー1レコードにまとめて保持し、1回の操作で両方を原子的に読み書きできる。
+# Config.SESSION_STORE_PATH が設定されていれば、複数のワーカープロセスから共有できるSQLite（WAL）ファイルを使い、
+# 未設定であれば従来どおりプロセス内のメモリに保持する。
+# どちらも最後のアクセスから Config.SESSION_IDLE_TTL_SECONDS を過ぎたセッションを削除し、件数を Config.SESSION_MAX_ENTRIES までに抑える。
+
+
+class SessionStore:
+    """セッションストアのインターフェース。state / data は未設定の場合 None。"""
+
+    def get(self, user_id: str) -> tuple:
+        """(state, data) を1回の参照で返します。data は SessionRecord。"""
+        raise NotImplementedError
+
+    def save(self, user_id: str, state, data):
+        """状態とデータをまとめて保存します。"""
+        raise NotImplementedError
+
+    def set_state(self, user_id: str, state):
+        raise NotImplementedError
+
+    def set_data(self, user_id: str, data):
+        raise NotImplementedError
+
+    def clear_state(self, user_id: str):
+        raise NotImplementedError
+
+    def delete_data(self, user_id: str):
+        raise NotImplementedError
+
+    def clear(self):
+        """全ユーザーのセッションを削除します。"""
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        """有効なセッション数（active）と、削除したセッション数（expired / evicted）を返します。"""
+        raise NotImplementedError
+
+
+# 会話状態の文字列 ⇔ 小さな整数コードの対応表（コード0 は SessionState.NONE = 状態なし）
+# メモリ上のレコードは状態をコードで持ち、文字列はこの表を1回引いて返す
+_STATE_NAMES = [SessionState.NONE] + sorted(
+    {value for name, value in vars(SessionState).items() if name.isupper() and isinstance(value, str)} - {SessionState.NONE}
+)
+_STATE_CODES = {state: code for code, state in enumerate(_STATE_NAMES)}
+_state_codes_lock = threading.Lock()
+
+
+def _state_code(state) -> int:
+    if state is None:
+        return 0
+    code = _STATE_CODES.get(state)
+    if code is None:
+        # SessionState に定義されていない状態文字列は末尾に追加する
+        with _state_codes_lock:
+            code = _STATE_CODES.get(state)
+            if code is None:
+                code = len(_STATE_NAMES)
+                _STATE_NAMES.append(state)
+                _STATE_CODES[state] = code
+    return code
+
+
+# セッションデータのキー（会話中に集める列名など）⇔ SessionRecord のスロット名
+_FIELD_SLOTS = {
+    '日付': 'date',
+    '開始時刻': 'start_time',
+    'タイトル': 'title',
+    '開催場所': 'location',
+    '詳細': 'detail',
+    '申込締切日': 'deadline',
+    '規模': 'scale',
+    '参加者ID': 'attendee_id',
+    '参加者名': 'attendee_name',
+    '出欠': 'attendance',
+    '備考': 'notes',
+    '編集対象日付': 'edit_date',
+    '編集対象タイトル': 'edit_title',
+    '編集フィールド': 'edit_field',
+    '削除対象日付': 'delete_date',
+    '削除対象タイトル': 'delete_title',
+}
+
+
+class SessionRecord(MutableMapping):
+    """
+    1ユーザー分のセッション（会話状態とセッションデータ）をまとめて持つレコード。
+    状態は小さな整数コード、よく使うデータ項目は __slots__ の型付きフィールドで持ち、
+    それ以外のキー（参加予定Q&Aの進行状況など）だけを extra の辞書に入れる。
+    データ部分は従来のセッションデータの辞書と同じく session_data['日付'] のように読み書きできる。
+    """
+
+    __slots__ = ('state_code', 'touched_at', 'extra') + tuple(_FIELD_SLOTS.values())
+
+    state_code: int
+    touched_at: float
+    extra: dict
+    date: str
+    start_time: str
+    title: str
+    location: str
+    detail: str
+    deadline: str
+    scale: str
+    attendee_id: str
+    attendee_name: str
+    attendance: str
+    notes: str
+    edit_date: str
+    edit_title: str
+    edit_field: str
+    delete_date: str
+    delete_title: str
+
+    def __init__(self, state=None, data=None):
+        self.state_code = _state_code(state)
+        self.touched_at = 0.0
+        self.extra = None
+        if data:
+            self.update(data)
+
+    @property
+    def state(self):
+        """状態の文字列。状態がない場合は None。"""
+        return _STATE_NAMES[self.state_code] if self.state_code else None
+
+    @state.setter
+    def state(self, state):
+        self.state_code = _state_code(state)
+
+    def is_empty(self) -> bool:
+        """状態もデータも持たないレコードであればTrue。"""
+        return not self.state_code and not len(self)
+
+    def __getitem__(self, key):
+        slot = _FIELD_SLOTS.get(key)
+        if slot is None:
+            if self.extra is None:
+                raise KeyError(key)
+            return self.extra[key]
+        try:
+            return getattr(self, slot)
+        except AttributeError: # 未設定のスロット
+            raise KeyError(key) from None
+
+    def __setitem__(self, key, value):
+        slot = _FIELD_SLOTS.get(key)
+        if slot is not None:
+            setattr(self, slot, value)
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def __delitem__(self, key):
+        slot = _FIELD_SLOTS.get(key)
+        if slot is None:
+            if self.extra is None:
+                raise KeyError(key)
+            del self.extra[key]
+            return
+        try:
+            delattr(self, slot)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __iter__(self):
+        for key, slot in _FIELD_SLOTS.items():
+            if hasattr(self, slot):
+                yield key
+        if self.extra:
+            yield from self.extra
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class InMemorySessionStore(SessionStore):
+    """
+    プロセス内の辞書に保持するストア。単一プロセスでのみ有効。
+    ユーザーIDごとに SessionRecord を1つだけ持ち、状態とデータを1回の参照で取得する。
+    最後にアクセスされた順に並べた OrderedDict で保持し、先頭（最も古いもの）から
+    アイドル期間を過ぎたものと上限を超えたものを捨てる（1操作あたり償却O(1)）。
+    """
+
+    def __init__(self, idle_ttl: float = 0, max_entries: int = 0):
+        self._lock = threading.Lock()
+        self._records = OrderedDict() # {user_id: SessionRecord}（最後にアクセスされた順）
+        self._idle_ttl = idle_ttl
+        self._max_entries = max_entries
+        self._stats = {'expired': 0, 'evicted': 0}
+
+    def get(self, user_id):
+        with self._lock:
+            self._evict(time.monotonic())
+            record = self._touch(user_id)
+        if record is None:
+            return None, None
+        # データを持つ場合はレコード自体をセッションデータとして返す（呼び出し側の変更はそのまま反映される）
+        return record.state, record if len(record) else None
+
+    def save(self, user_id, state, data):
+        with self._lock:
+            record = self._record_with_data(self._record_for_update(user_id), data)
+            record.state = state
+            self._store_or_drop(user_id, record)
+
+    def set_state(self, user_id, state):
+        with self._lock:
+            record = self._record_for_update(user_id)
+            record.state = state
+            self._store_or_drop(user_id, record)
+
+    def set_data(self, user_id, data):
+        with self._lock:
+            record = self._record_with_data(self._record_for_update(user_id), data)
+            self._store_or_drop(user_id, record)
+
+    def clear_state(self, user_id):
+        self.set_state(user_id, None)
+
+    def delete_data(self, user_id):
+        self.set_data(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._records.clear()
+
+    def stats(self):
+        with self._lock:
+            self._evict(time.monotonic())
+            return dict(self._stats, active=len(self._records))
+
+    def _touch(self, user_id):
+        """レコードを最新のアクセスとして末尾へ移動し、返します。"""
+        record = self._records.get(user_id)
+        if record is not None:
+            record.touched_at = time.monotonic()
+            self._records.move_to_end(user_id)
+        return record
+
+    def _record_for_update(self, user_id) -> SessionRecord:
+        self._evict(time.monotonic())
+        record = self._touch(user_id)
+        return record if record is not None else SessionRecord()
+
+    @staticmethod
+    def _record_with_data(record: SessionRecord, data) -> SessionRecord:
+        """
+        data を持つレコードを返します。data が取得済みのレコード自体であればそのまま使い、
+        それ以外は新しいレコードを作る（呼び出し側が保持している取得済みのデータは書き換えない）。
+        """
+        if data is record:
+            return record
+        return SessionRecord(record.state, data)
+
+    def _store_or_drop(self, user_id, record: SessionRecord):
+        if record.is_empty():
+            self._records.pop(user_id, None)
+            return
+        record.touched_at = time.monotonic()
+        self._records[user_id] = record
+        self._records.move_to_end(user_id)
+        self._evict(record.touched_at)
+
+    def _evict(self, now: float):
+        """先頭から、アイドル期間を過ぎたレコードと上限を超えた分のレコードを削除します。"""
+        while self._records:
+            touched_at = next(iter(self._records.values())).touched_at
+            if self._idle_ttl and touched_at < now - self._idle_ttl:
+                self._stats['expired'] += 1
+            elif self._max_entries and len(self._records) > self._max_entries:
+                self._stats['evicted'] += 1
+            else:
+                break
+            self._records.popitem(last=False)
+
+
+def _json_default(value):
+    # pandas / numpy のスカラー（シートから読み込んだ値など）はPythonの値に戻す
+    if hasattr(value, 'item'):
+        return value.item()
+    return str(value)
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    SQLite（WAL）ファイルに保持するストア。同じファイルを参照する複数のプロセスで共有できる。
+    プロセスやデプロイをまたいで読めるよう、状態は文字列、データはJSONで保存し、読み込み時に SessionRecord に戻す。
+    """
+
+    _SCHEMA_SQL = """
+    CREATE TABLE IF NOT EXISTS sessions (
+        user_id TEXT PRIMARY KEY,
+        state TEXT,
+        data TEXT,
+        updated_at REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_sessions_updated_at ON sessions (updated_at);
+    """
+    # 読み取りだけのアクセスで最終アクセス時刻を書き換える間隔（秒）。読み取りのたびに書き込まないようにする
+    _TOUCH_INTERVAL_SECONDS = 60
+
+    def __init__(self, path: str, idle_ttl: float = 0, max_entries: int = 0):
+        self._lock = threading.Lock()
+        self._idle_ttl = idle_ttl
+        self._max_entries = max_entries
+        self._stats = {'expired': 0, 'evicted': 0}
+        self._last_sweep = 0.0
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(self._SCHEMA_SQL)
+        print(f"DEBUG: Session store opened at '{path}'.")
+
+    def get(self, user_id):
+        now = time.time()
+        with self._lock:
+            self._sweep(now)
+            row = self._conn.execute("SELECT state, data, updated_at FROM sessions WHERE user_id = ?", (user_id,)).fetchone()
+            if row is None:
+                return None, None
+            if self._idle_ttl and row[2] < now - self._idle_ttl:
+                # 定期削除の前にアイドル期間を過ぎたレコード
+                self._conn.execute("DELETE FROM sessions WHERE user_id = ? AND updated_at = ?", (user_id, row[2]))
+                self._stats['expired'] += 1
+                return None, None
+            if row[2] < now - self._TOUCH_INTERVAL_SECONDS:
+                self._conn.execute("UPDATE sessions SET updated_at = ? WHERE user_id = ?", (now, user_id))
+        if row[1] is None:
+            return row[0], None
+        record = SessionRecord(row[0], json.loads(row[1]))
+        return record.state, record if len(record) else None
+
+    def save(self, user_id, state, data):
+        if state is None and data is None:
+            with self._lock:
+                self._conn.execute("DELETE FROM sessions WHERE user_id = ?", (user_id,))
+            return
+        self._upsert(user_id, ('state', 'data'), (state, self._dumps(data)))
+
+    def set_state(self, user_id, state):
+        self._upsert(user_id, ('state',), (state,))
+
+    def set_data(self, user_id, data):
+        self._upsert(user_id, ('data',), (self._dumps(data),))
+
+    def clear_state(self, user_id):
+        self.set_state(user_id, None)
+
+    def delete_data(self, user_id):
+        self.set_data(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM sessions")
+
+    def stats(self):
+        with self._lock:
+            self._sweep(time.time(), force=True)
+            active = self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+            return dict(self._stats, active=active)
+
+    def _sweep(self, now: float, force: bool = False):
+        """
+        アイドル期間を過ぎたレコードと、上限を超えた分の古いレコードを削除します。
+        updated_at のインデックスを使い、最短でも _TOUCH_INTERVAL_SECONDS に1回だけ実行します。呼び出し元で _lock を保持していること。
+        """
+        if not force and now - self._last_sweep < self._TOUCH_INTERVAL_SECONDS:
+            return
+        self._last_sweep = now
+        if self._idle_ttl:
+            cursor = self._conn.execute("DELETE FROM sessions WHERE updated_at < ?", (now - self._idle_ttl,))
+            self._stats['expired'] += max(cursor.rowcount, 0)
+        if self._max_entries:
+            cursor = self._conn.execute(
+                "DELETE FROM sessions WHERE user_id IN (SELECT user_id FROM sessions ORDER BY updated_at DESC LIMIT -1 OFFSET ?)",
+                (self._max_entries,)
+            )
+            self._stats['evicted'] += max(cursor.rowcount, 0)
+
+    @staticmethod
+    def _dumps(data):
+        return json.dumps(dict(data), ensure_ascii=False, default=_json_default) if data else None
+
+    def _upsert(self, user_id, columns, values):
+        """
+        指定した列だけを1つのトランザクションで書き換えます。状態もデータも空になったレコードは削除します。
+        """
+        assignments = ', '.join(f"{column} = excluded.{column}" for column in columns)
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                if self._idle_ttl:
+                    # アイドル期間を過ぎたレコードの残りの列を引き継がないよう、先に削除する
+                    cursor = self._conn.execute("DELETE FROM sessions WHERE user_id = ? AND updated_at < ?", (user_id, now - self._idle_ttl))
+                    self._stats['expired'] += max(cursor.rowcount, 0)
+                self._conn.execute(
+                    f"INSERT INTO sessions (user_id, {', '.join(columns)}, updated_at) VALUES (?, {', '.join('?' for _ in columns)}, ?) "
+                    f"ON CONFLICT(user_id) DO UPDATE SET {assignments}, updated_at = excluded.updated_at",
+                    (user_id,) + tuple(values) + (now,)
+                )
+                self._conn.execute("DELETE FROM sessions WHERE user_id = ? AND state IS NULL AND data IS NULL", (user_id,))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+
+_lock = threading.Lock()
+_store = None
+
+
+def get_session_store() -> SessionStore:
+    """
+    設定に応じたセッションストアを返します。初回呼び出し時に一度だけ生成します。
+    """
+    global _store
+    if _store is None:
+        with _lock:
+            if _store is None:
+                idle_ttl = Config.SESSION_IDLE_TTL_SECONDS
+                max_entries = Config.SESSION_MAX_ENTRIES
+                if Config.SESSION_STORE_PATH:
+                    _store = SQLiteSessionStore(Config.SESSION_STORE_PATH, idle_ttl, max_entries)
+                else:
+                    _store = InMemorySessionStore(idle_ttl, max_entries)
+    return _store
+
+
+def get_session_stats() -> dict:
+    """
+    有効なセッション数と、アイドル期間切れ・上限超過で削除したセッション数を返します。（監視・デバッグ用）
+    """
+    return get_session_store().stats()
@@ -0,0 +1,89 @@
+# utils/worker_pool.py
+
+import queue
+import threading
+import zlib
+
+from config import Config
+
+# Webhookイベントを処理するプロセス内ワーカープール
+# ワーカーごとに上限付きの待ち行列を持ち、同じキー（ユーザーID）のジョブは常に同じワーカーに割り当てる。
+# これにより、ユーザーごとの処理順序（FIFO）が保たれ、会話の途中のステップが前後することはない。
+
+_lock = threading.Lock()
+_queues = [] # ワーカーごとの queue.Queue
+_threads = []
+_stats_lock = threading.Lock()
+_stats = {'submitted': 0, 'completed': 0, 'failed': 0, 'rejected': 0}
+
+
+def _record(**increments):
+    with _stats_lock:
+        for name, value in increments.items():
+            _stats[name] += value
+
+
+def _worker_loop(job_queue: queue.Queue):
+    """
+    待ち行列からジョブを1つずつ取り出して実行します。例外はログに出力して次のジョブへ進みます。
+    """
+    while True:
+        func, args = job_queue.get()
+        try:
+            func(*args)
+            _record(completed=1)
+        except Exception as e:
+            print(f"ERROR: Worker job {getattr(func, '__name__', func)} failed: {e}")
+            _record(failed=1)
+        finally:
+            job_queue.task_done()
+
+
+def _ensure_started():
+    """
+    ワーカースレッドを未起動の場合のみ起動します。
+    """
+    if _queues:
+        return
+    with _lock:
+        if _queues:
+            return
+        worker_count = max(Config.WEBHOOK_WORKER_COUNT, 1)
+        for i in range(worker_count):
+            job_queue = queue.Queue(maxsize=Config.WEBHOOK_WORKER_QUEUE_SIZE)
+            thread = threading.Thread(target=_worker_loop, args=(job_queue,), name=f"webhook-worker-{i}", daemon=True)
+            thread.start()
+            _threads.append(thread)
+            _queues.append(job_queue)
+        print(f"DEBUG: Started {worker_count} webhook worker threads.")
+
+
+def submit(key: str, func, *args) -> bool:
+    """
+    ジョブをキーに対応するワーカーの待ち行列に追加します。同じキーのジョブは追加した順に実行されます。
+    :param key: 順序を保証する単位（ユーザーIDなど）
+    :param func: 実行する関数
+    :return: 追加できた場合はTrue、待ち行列が満杯の場合はFalse
+    """
+    _ensure_started()
+    # hash() はプロセスごとに値が変わるため、安定したCRC32で割り当て先を決める
+    job_queue = _queues[zlib.crc32((key or '').encode('utf-8')) % len(_queues)]
+    try:
+        job_queue.put_nowait((func, args))
+    except queue.Full:
+        print(f"WARNING: Worker queue is full. Job for key '{key}' rejected.")
+        _record(rejected=1)
+        return False
+    _record(submitted=1)
+    return True
+
+
+def get_worker_pool_stats() -> dict:
+    """
+    投入・完了・失敗・拒否したジョブ数と、現在の待ち行列の長さを返します。（監視・デバッグ用）
+    """
+    with _stats_lock:
+        stats = dict(_stats)
+    stats['workers'] = len(_threads)
+    stats['queued'] = sum(job_queue.qsize() for job_queue in _queues)
+    return stats